@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Benchmark the stages of theme generation.
+
+Times color extraction on the images in images/ and on synthetic images from
+256px up to 8K, and the palette stages (role assignment, blur opacity, Zed
+style mapping, HTML preview) on the analyses of the bundled images. Results
+can be saved as a JSON baseline and later runs compared against it:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.1
+
+--allocations also traces the memory the palette benchmarks allocate with
+tracemalloc, saved and compared alongside the times.
+
+Comparisons use the fastest run of each benchmark, which is the least
+sensitive to other load on the machine. Baselines are only comparable on the
+same machine and Python.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import color_palette_generator as cpg
+
+BASELINE_VERSION = 1
+
+# Synthetic images by name, generated as both JPEG and PNG
+SYNTHETIC_SIZES = {
+    "256": (256, 256),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+SYNTHETIC_FORMATS = ("jpg", "png")
+
+DEFAULT_THRESHOLD = 0.10  # Slowdown flagged as a regression by --compare
+
+
+def make_synthetic_image(path, size, seed=0):
+    """Write a photo-like test image: smooth fields around one color, with grain.
+
+    Its color count (about 9000 histogram bins) is in the range of the bundled
+    photos, so the extraction cost is comparable; fully random colors would
+    cost several times more to cluster.
+    """
+    import numpy as np
+    from PIL import Image, ImageChops
+
+    rng = np.random.default_rng(seed)
+    center = rng.integers(40, 216, 3)
+    fields = np.clip(center + rng.integers(-60, 61, (4, 6, 3)), 0, 255)
+    base = Image.fromarray(fields.astype(np.uint8))
+    base = base.resize(size, Image.Resampling.BICUBIC)
+    grain = Image.effect_noise(size, 8).convert("RGB")
+    # effect_noise is centered on 128
+    image = ImageChops.add(base, grain, offset=-128)
+    if str(path).endswith(".png"):
+        image.save(path, compress_level=1)
+    else:
+        image.save(path, quality=90)
+
+
+def extraction_benchmarks(image_paths):
+    """(name, function, calls) for extraction on each image"""
+    benchmarks = []
+    for path in image_paths:
+        benchmarks.append(
+            (f"extract_colors[{path.name}]", lambda p=path: cpg.extract_colors(p), 1)
+        )
+        benchmarks.append(
+            (
+                f"find_average_color[{path.name}]",
+                lambda p=path: cpg.find_average_color(p),
+                1,
+            )
+        )
+    return benchmarks
+
+
+def palette_benchmarks(image_paths, scratch_dir):
+    """(name, function, calls) for the palette stages.
+
+    Every call covers all bundled images, so calls is the number of palettes
+    it builds or processes and results are per palette.
+    """
+    analyses = [cpg.analyze_image(path) for path in image_paths]
+    # (palette, extracted colors, is dark) for both themes of every image
+    palettes = [
+        (*cpg.generate_functional_palette(None, theme, analysis)[:2], theme == "dark")
+        for theme in cpg.THEMES
+        for analysis in analyses
+    ]
+    html_path = os.path.join(scratch_dir, "preview.html")
+
+    def for_each_palette(name, stage):
+        def run():
+            for palette, extracted, is_dark in palettes:
+                stage(palette, extracted, is_dark)
+
+        return name, run, len(palettes)
+
+    def build_palettes(theme):
+        def run():
+            for analysis in analyses:
+                cpg.generate_functional_palette(None, theme, analysis)
+
+        return f"generate_functional_palette[{theme}]", run, len(analyses)
+
+    def build_zed_themes():
+        # One blur theme family per image, from its dark and light palettes
+        families = list(zip(palettes[: len(analyses)], palettes[len(analyses) :]))
+
+        def run():
+            for (dark, _, _), (light, _, _) in families:
+                cpg.generate_zed_themes(dark, light, "Benchmark", 0.9, 0.9)
+
+        return "generate_zed_themes (per family)", run, len(families)
+
+    def build_variants():
+        # The default matrix: every contrast tier, opaque and auto blur
+        def run():
+            for analysis in analyses:
+                cpg.zed_variant_data(analysis, "Benchmark")
+
+        return "zed_variant_data (per image)", run, len(analyses)
+
+    def apply_profiles():
+        # A sweep: every contrast and saturation tier over each analysis
+        profiles = [
+            cpg.variant_profile(contrast, saturation)
+            for contrast in cpg.CONTRAST_TIERS
+            for saturation in cpg.SATURATION_TIERS
+        ]
+
+        def run():
+            for analysis in analyses:
+                for profile in profiles:
+                    cpg.apply_profile(analysis, profile)
+
+        return "apply_profile (per profile)", run, len(analyses) * len(profiles)
+
+    return [
+        *(build_palettes(theme) for theme in cpg.THEMES),
+        for_each_palette(
+            "calculate_theme_opacity",
+            lambda palette, _, is_dark: cpg.calculate_theme_opacity(palette, is_dark),
+        ),
+        for_each_palette(
+            "_build_zed_style",
+            lambda palette, _, is_dark: cpg._build_zed_style(palette, is_dark, 0.9),
+        ),
+        build_zed_themes(),
+        build_variants(),
+        apply_profiles(),
+        for_each_palette(
+            "create_html_preview",
+            lambda palette, extracted, is_dark: cpg.create_html_preview(
+                palette, extracted, html_path, is_dark
+            ),
+        ),
+    ]
+
+
+def import_benchmark():
+    """(name, function, calls) for a fresh interpreter importing the module,
+    which is the floor of every CLI run"""
+    command = [sys.executable, "-c", "import color_palette_generator"]
+    root = Path(__file__).parent
+
+    def run():
+        subprocess.run(command, cwd=root, check=True)
+
+    return "import (new process)", run, 1
+
+
+def measure(function, calls=1, min_time=0.5, min_runs=3, max_runs=100):
+    """Time function after one warm-up call.
+
+    Runs it until min_time seconds have passed (and at least min_runs times),
+    dividing each run by calls. Returns {"min", "median", "runs"}.
+    """
+    function()
+    times = []
+    total = 0.0
+    while len(times) < max_runs and (len(times) < min_runs or total < min_time):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        times.append(elapsed / calls)
+    return {"min": min(times), "median": statistics.median(times), "runs": len(times)}
+
+
+def measure_allocations(function, calls=1):
+    """Trace the Python and NumPy memory one run of function allocates.
+
+    Runs it once untraced to fill caches (interned colors, color arrays), then
+    once under tracemalloc. Returns {"peak_bytes", "retained_bytes"}: the most
+    memory live at once during the run, and what is still held after it per
+    call.
+    """
+    import tracemalloc
+
+    function()
+    tracemalloc.start()
+    try:
+        function()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes": peak, "retained_bytes": retained / calls}
+
+
+def environment():
+    """What baselines are only comparable within"""
+    import numpy
+    import PIL
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "numpy": numpy.__version__,
+        "pillow": PIL.__version__,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print results against baseline. Returns the names that regressed."""
+    regressed = []
+    print(f"\n{'benchmark':44} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:44} {'-':>10} {result['min'] * 1000:8.2f}ms {'new':>8}")
+            continue
+        change = result["min"] / before["min"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed.append(name)
+        print(
+            f"{name:44} {before['min'] * 1000:8.2f}ms {result['min'] * 1000:8.2f}ms "
+            f"{change:+7.1%}{flag}"
+        )
+
+    allocations = [
+        (name, baseline[name]["peak_bytes"], result["peak_bytes"])
+        for name, result in results.items()
+        if "peak_bytes" in result and "peak_bytes" in baseline.get(name, {})
+    ]
+    if allocations:
+        print(
+            f"\n{'allocation peak':44} {'baseline':>10} {'current':>10} "
+            f"{'change':>8}"
+        )
+    for name, before, after in allocations:
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed.append(f"{name} (allocations)")
+        print(
+            f"{name:44} {before / 1024:7.1f}KiB {after / 1024:7.1f}KiB "
+            f"{change:+7.1%}{flag}"
+        )
+    return regressed
+
+
+def main():
+    root = Path(__file__).parent
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark color extraction and palette generation"
+    )
+    parser.add_argument(
+        "--images",
+        type=Path,
+        default=root / "images",
+        help="Folder of real images to benchmark (default: images/)",
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="*",
+        choices=list(SYNTHETIC_SIZES),
+        default=list(SYNTHETIC_SIZES),
+        help="Synthetic image sizes to generate (default: all)",
+    )
+    parser.add_argument(
+        "--filter",
+        default=None,
+        help="Only run benchmarks whose name contains this text",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="Seconds to keep repeating each benchmark (default: 0.5)",
+    )
+    parser.add_argument(
+        "--save",
+        type=Path,
+        default=None,
+        help="Write the results as a JSON baseline",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        default=None,
+        help="Compare against a JSON baseline and exit 1 on regressions",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Slowdown counted as a regression, as a fraction "
+        f"(default: {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--allocations",
+        action="store_true",
+        help="Also trace the peak and retained memory each palette benchmark "
+        "allocates (compared like times with --compare)",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            data = json.load(f)
+        if data.get("version") != BASELINE_VERSION:
+            parser.error(f"{args.compare} is not a version {BASELINE_VERSION} baseline")
+        baseline = data["benchmarks"]
+        if data["environment"] != environment():
+            print(f"Note: {args.compare} was recorded in a different environment")
+
+    images = sorted(
+        path
+        for path in args.images.iterdir()
+        if path.suffix.lower() in {".png", ".jpg", ".jpeg"}
+    )
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        synthetic = []
+        for size_name in args.sizes:
+            for extension in SYNTHETIC_FORMATS:
+                path = Path(scratch_dir) / f"synthetic-{size_name}.{extension}"
+                make_synthetic_image(path, SYNTHETIC_SIZES[size_name])
+                synthetic.append(path)
+
+        benchmarks = extraction_benchmarks(images + synthetic)
+        palettes = palette_benchmarks(images, scratch_dir)
+        benchmarks += palettes
+        benchmarks.append(import_benchmark())
+        if args.filter is not None:
+            benchmarks = [b for b in benchmarks if args.filter in b[0]]
+        traced = {name for name, _, _ in palettes} if args.allocations else set()
+
+        results = {}
+        print(f"{'benchmark':44} {'min':>10} {'median':>10} {'runs':>5}")
+        for name, function, calls in benchmarks:
+            result = measure(function, calls, min_time=args.min_time)
+            results[name] = result
+            print(
+                f"{name:44} {result['min'] * 1000:8.2f}ms "
+                f"{result['median'] * 1000:8.2f}ms {result['runs']:5}"
+            )
+
+        if traced & set(results):
+            print(f"\n{'allocations':44} {'peak':>10} {'kept/call':>10}")
+        for name, function, calls in benchmarks:
+            if name not in traced:
+                continue
+            allocations = measure_allocations(function, calls)
+            results[name].update(allocations)
+            print(
+                f"{name:44} {allocations['peak_bytes'] / 1024:7.1f}KiB "
+                f"{allocations['retained_bytes'] / 1024:7.1f}KiB"
+            )
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "version": BASELINE_VERSION,
+                    "environment": environment(),
+                    "benchmarks": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nSaved baseline to {args.save}")
+
+    if baseline is not None:
+        regressed = compare(results, baseline, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} regressions over {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
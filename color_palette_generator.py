@@ -2,25 +2,79 @@
 # /// script
 # dependencies = [
 #     "numpy",
-#     "pillow",
-#     "scikit-learn"
+#     "pillow"
 # ]
 # ///
 
 import colorsys
+import contextlib
+import functools
+import io
 import json
 from collections import namedtuple
 
-import numpy as np
-from PIL import Image
-from sklearn.cluster import KMeans
-
 # """
 # Functional Color Palette Generator v2
 # Extracts colors from an image and assigns functional roles with strict readability enforcement.
 # """
 
-Color = namedtuple("Color", ["hex", "rgb", "hsl", "luminance"])
+
+class Color:
+    """An sRGB color with its hex, HSL and WCAG luminance representations.
+
+    Only rgb is set up front; hex, hsl and luminance are computed on first
+    access and then stored in their slots, so later reads cost no more than a
+    namedtuple field. Colors are equal when their rgb is and iterate like the
+    (hex, rgb, hsl, luminance) namedtuple they replace. Get them from
+    create_color(), which interns them. Interned colors are shared by every
+    palette, so assigning or deleting an attribute raises AttributeError.
+    """
+
+    __slots__ = ("rgb", "hex", "hsl", "luminance")
+
+    def __init__(self, r, g, b):
+        object.__setattr__(self, "rgb", (r, g, b))
+
+    def __getattr__(self, name):
+        # Only called while a derived slot is still unset
+        if name == "hex":
+            value = rgb_to_hex(*self.rgb)
+        elif name == "hsl":
+            value = rgb_to_hsl(*self.rgb)
+        elif name == "luminance":
+            value = relative_luminance(*self.rgb)
+        else:
+            raise AttributeError(name)
+        object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Color is immutable, can't set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Color is immutable, can't delete {name}")
+
+    def __iter__(self):
+        return iter((self.hex, self.rgb, self.hsl, self.luminance))
+
+    def __eq__(self, other):
+        if not isinstance(other, Color):
+            return NotImplemented
+        return self.rgb == other.rgb
+
+    def __hash__(self):
+        return hash(self.rgb)
+
+    def __repr__(self):
+        return (
+            f"Color(hex={self.hex!r}, rgb={self.rgb!r}, hsl={self.hsl!r}, "
+            f"luminance={self.luminance!r})"
+        )
+
+    def __reduce__(self):
+        # Unpickle through create_color() so colors from workers are interned
+        return (create_color, self.rgb)
+
 
 # Contrast requirements
 MIN_TEXT_CONTRAST = 5.0  # Main text against bg AND bg_light
@@ -33,6 +87,113 @@ MAX_BG_SATURATION = 35  # Backgrounds shouldn't be too colorful
 MAX_FG_SATURATION = 25  # Foregrounds should be near-neutral
 MAX_ACCENT_SATURATION = 75  # Accents can be vibrant but not neon
 
+# The rules generate_functional_palette() assigns roles by: contrast targets,
+# saturation caps, background lightness ranges (percent), how far borders blend
+# toward the primary accent (compatible with the background or not) and the
+# (hue, saturation, lightness) the semantic colors start from. DEFAULT_PROFILE
+# holds the constants above and the original built-in values. Profiles can be
+# loaded from TOML or JSON (load_palette_profile()) and applied to a cached
+# analysis without extracting again (apply_profile()); theme variants replace
+# fields with those of a contrast and a saturation tier.
+PaletteProfile = namedtuple(
+    "PaletteProfile",
+    [
+        "text_contrast",
+        "dim_contrast",
+        "terminal_contrast",
+        "semantic_contrast",
+        "max_bg_saturation",
+        "max_fg_saturation",
+        "max_accent_saturation",
+        "dark_bg_min_lightness",
+        "dark_bg_max_lightness",
+        "light_bg_min_lightness",
+        "light_bg_max_lightness",
+        "border_blend_compatible",
+        "border_blend_incompatible",
+        "error_hsl",
+        "warning_hsl",
+        "success_hsl",
+        "info_hsl",
+    ],
+)
+DEFAULT_PROFILE = PaletteProfile(
+    text_contrast=MIN_TEXT_CONTRAST,
+    dim_contrast=MIN_DIM_CONTRAST,
+    terminal_contrast=MIN_TERMINAL_CONTRAST,
+    semantic_contrast=MIN_SEMANTIC_CONTRAST,
+    max_bg_saturation=MAX_BG_SATURATION,
+    max_fg_saturation=MAX_FG_SATURATION,
+    max_accent_saturation=MAX_ACCENT_SATURATION,
+    dark_bg_min_lightness=8,
+    dark_bg_max_lightness=18,
+    light_bg_min_lightness=85,
+    light_bg_max_lightness=95,
+    border_blend_compatible=0.50,
+    border_blend_incompatible=0.05,
+    error_hsl=(0, 65, 55),  # Red
+    warning_hsl=(38, 70, 55),  # Yellow/orange
+    success_hsl=(120, 50, 45),  # Green
+    info_hsl=(200, 60, 50),  # Cyan/blue
+)
+
+# PaletteProfile fields of each contrast and saturation tier of a theme variant
+CONTRAST_TIERS = {
+    "soft": {
+        "text_contrast": 4.5,
+        "dim_contrast": 3.0,
+        "terminal_contrast": 3.0,
+        "semantic_contrast": 3.0,
+    },
+    "standard": {
+        "text_contrast": MIN_TEXT_CONTRAST,
+        "dim_contrast": MIN_DIM_CONTRAST,
+        "terminal_contrast": MIN_TERMINAL_CONTRAST,
+        "semantic_contrast": MIN_SEMANTIC_CONTRAST,
+    },
+    "high": {  # WCAG AAA for text
+        "text_contrast": 7.0,
+        "dim_contrast": 5.5,
+        "terminal_contrast": 5.0,
+        "semantic_contrast": 5.5,
+    },
+}
+SATURATION_TIERS = {
+    "muted": {
+        "max_bg_saturation": 20,
+        "max_fg_saturation": 12,
+        "max_accent_saturation": 50,
+    },
+    "standard": {
+        "max_bg_saturation": MAX_BG_SATURATION,
+        "max_fg_saturation": MAX_FG_SATURATION,
+        "max_accent_saturation": MAX_ACCENT_SATURATION,
+    },
+    "vivid": {
+        "max_bg_saturation": 45,
+        "max_fg_saturation": 30,
+        "max_accent_saturation": 90,
+    },
+}
+
+# Distinct colors create_color() keeps interned, least recently used dropped
+COLOR_CACHE_SIZE = 65536
+
+# Color extraction settings (also part of the extraction cache key)
+CLUSTER_THUMBNAIL_SIZE = 600  # Thumbnail clustered by the quantizer
+AVERAGE_THUMBNAIL_SIZE = 100  # Thumbnail averaged for theme detection
+MIN_PIXEL_SUM = 30  # Pixels with r+g+b outside (MIN, MAX) are ignored
+MAX_PIXEL_SUM = 735
+HISTOGRAM_BITS = 6  # Bits per channel when binning pixels before clustering
+DECODE_REDUCING_GAP = 2.0  # Decode >= this many times the thumbnail size (None: full)
+DECODE_MEMORY_LIMIT = 1024 * 1024 * 1024  # Largest bitmap load_image() will decode
+HASH_CHUNK_SIZE = 1024 * 1024  # Bytes ColorCache.file_key() reads at a time
+KMEANS_RANDOM_STATE = 42
+KMEANS_N_INIT = 10  # Restarts for the scikit-learn engine
+KMEANS_NUMPY_N_INIT = 3  # Restarts for the NumPy engine (seeding is greedy k-means++)
+KMEANS_BATCH_SIZE = 4096  # Mini-batch size for the NumPy engine
+KMEANS_MAX_ITER = 100  # Mini-batch steps, then up to this many full Lloyd passes
+
 
 def rgb_to_hex(r, g, b):
     return f"#{r:02x}{g:02x}{b:02x}"
@@ -55,14 +216,20 @@ def hsl_to_rgb(h, s, l):
     return (int(r * 255), int(g * 255), int(b * 255))
 
 
-def relative_luminance(r, g, b):
-    """Calculate relative luminance per WCAG 2.0"""
+def _linear_channel(c):
+    """sRGB channel (0-255) to linear light"""
+    c = c / 255
+    return c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4
+
 
-    def channel(c):
-        c = c / 255
-        return c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4
+# _linear_channel() of every 8-bit channel value
+_LINEAR_CHANNEL = tuple(_linear_channel(c) for c in range(256))
 
-    return 0.2126 * channel(r) + 0.7152 * channel(g) + 0.0722 * channel(b)
+
+def relative_luminance(r, g, b):
+    """Calculate relative luminance per WCAG 2.0 (integer channels 0-255)"""
+    linear = _LINEAR_CHANNEL
+    return 0.2126 * linear[r] + 0.7152 * linear[g] + 0.0722 * linear[b]
 
 
 def contrast_ratio(lum1, lum2):
@@ -72,15 +239,141 @@ def contrast_ratio(lum1, lum2):
     return (lighter + 0.05) / (darker + 0.05)
 
 
+# === VECTORIZED COLOR SCIENCE ===
+# Array versions of the scalar conversions above. They repeat the exact float
+# operations of colorsys and relative_luminance(), so every element is
+# bit-for-bit equal to the corresponding scalar call.
+
+
+def rgb_to_hsl_array(rgb):
+    """(N, 3) RGB (0-255) -> (N, 3) HSL (degrees, percent, percent)"""
+    import numpy as np
+
+    rgb = np.asarray(rgb, dtype=np.float64) / 255
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = rgb.max(axis=1)
+    minc = rgb.min(axis=1)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    l = sumc / 2.0
+    gray = minc == maxc
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(l <= 0.5, rangec / sumc, rangec / (2.0 - maxc - minc))
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+    h = np.where(
+        r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc)
+    )
+    h = np.mod(h / 6.0, 1.0)
+
+    h = np.where(gray, 0.0, h)
+    s = np.where(gray, 0.0, s)
+    return np.column_stack([h * 360, s * 100, l * 100])
+
+
+def _hls_channel(m1, m2, hue):
+    # colorsys._v
+    import numpy as np
+
+    hue = np.mod(hue, 1.0)
+    return np.select(
+        [hue < 1.0 / 6.0, hue < 0.5, hue < 2.0 / 3.0],
+        [m1 + (m2 - m1) * hue * 6.0, m2, m1 + (m2 - m1) * (2.0 / 3.0 - hue) * 6.0],
+        m1,
+    )
+
+
+def hsl_to_rgb_array(hsl):
+    """(N, 3) HSL (degrees, percent, percent) -> (N, 3) integer RGB (0-255)"""
+    import numpy as np
+
+    hsl = np.asarray(hsl, dtype=np.float64)
+    h, s, l = hsl[:, 0] / 360, hsl[:, 1] / 100, hsl[:, 2] / 100
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+    m1 = 2.0 * l - m2
+    rgb = np.column_stack(
+        [
+            _hls_channel(m1, m2, h + 1.0 / 3.0),
+            _hls_channel(m1, m2, h),
+            _hls_channel(m1, m2, h - 1.0 / 3.0),
+        ]
+    )
+    rgb = np.where((s == 0.0)[:, None], l[:, None], rgb)
+    return np.trunc(rgb * 255).astype(np.int64)
+
+
+_linear_table = None
+
+
+def relative_luminance_array(rgb):
+    """(N, 3) integer RGB (0-255) -> (N,) relative luminance per WCAG 2.0"""
+    import numpy as np
+
+    global _linear_table
+    if _linear_table is None:
+        # NumPy's vectorized power can differ from libm pow() in the last bit,
+        # so the 256 channel values come from the scalar formula.
+        _linear_table = np.array(_LINEAR_CHANNEL)
+
+    linear = _linear_table[np.asarray(rgb, dtype=np.int64)]
+    return 0.2126 * linear[:, 0] + 0.7152 * linear[:, 1] + 0.0722 * linear[:, 2]
+
+
+def contrast_ratio_matrix(lums_a, lums_b):
+    """Contrast ratio of every luminance in lums_a against every one in lums_b.
+
+    Returns an (len(lums_a), len(lums_b)) array.
+    """
+    import numpy as np
+
+    a = np.asarray(lums_a, dtype=np.float64)[:, None]
+    b = np.asarray(lums_b, dtype=np.float64)[None, :]
+    return (np.maximum(a, b) + 0.05) / (np.minimum(a, b) + 0.05)
+
+
+def create_colors(rgb):
+    """Create Colors for an (N, 3) RGB array"""
+    import numpy as np
+
+    rgb = np.clip(np.asarray(rgb, dtype=np.int64).reshape(-1, 3), 0, 255)
+    return [_interned_color(r, g, b) for r, g, b in rgb.tolist()]
+
+
+def _select_color(colors, mask, key=None, largest=False):
+    """Vectorized sorted(filter(mask, colors), key=key)[0].
+
+    Returns the first matching color with the smallest (or largest) key, with
+    ties going to the earliest color like a stable sort, or None if no color
+    matches.
+    """
+    import numpy as np
+
+    candidates = np.flatnonzero(np.broadcast_to(mask, (len(colors),)))
+    if len(candidates) == 0:
+        return None
+    if key is None:
+        return colors[candidates[0]]
+    values = np.asarray(key)[candidates]
+    best = values.argmax() if largest else values.argmin()
+    return colors[candidates[best]]
+
+
 def create_color(r, g, b):
-    """Create a Color namedtuple with all representations"""
+    """Get the Color for RGB values, clamped to 0-255.
+
+    Colors are interned: asking for the same values again returns the same
+    object, derived values included, while it is among the COLOR_CACHE_SIZE
+    most recently used.
+    """
     r, g, b = max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b))
-    return Color(
-        hex=rgb_to_hex(r, g, b),
-        rgb=(r, g, b),
-        hsl=rgb_to_hsl(r, g, b),
-        luminance=relative_luminance(r, g, b),
-    )
+    return _interned_color(r, g, b)
+
+
+@functools.lru_cache(maxsize=COLOR_CACHE_SIZE)
+def _interned_color(r, g, b):
+    return Color(r, g, b)
 
 
 def adjust_color(color, lightness_delta=0, saturation_delta=0):
@@ -106,11 +399,78 @@ def set_color_saturation(color, target_saturation):
     return create_color(r, g, b)
 
 
-def ensure_contrast(color, bg_color, bg_light_color, min_contrast, is_dark_theme):
+def _min_contrast_against(lum, bg_color, bg_light_color):
+    return min(
+        contrast_ratio(lum, bg_color.luminance),
+        contrast_ratio(lum, bg_light_color.luminance),
+    )
+
+
+def solve_contrast(
+    color,
+    bg_color,
+    bg_light_color,
+    min_contrast,
+    is_dark_theme,
+    min_lightness=5,
+    max_lightness=95,
+    tolerance=0.01,
+):
+    """
+    Find the smallest lightness change that gives color min_contrast against
+    BOTH backgrounds, keeping its hue and saturation.
+
+    Lightness moves up for dark themes and down for light themes, no further
+    than max_lightness/min_lightness. Luminance never decreases as HSL
+    lightness increases, so once contrast is reached it stays reached and the
+    lightness can be bisected: at most ~14 evaluations (90 lightness points
+    down to tolerance) instead of up to 60 fixed steps that overshoot the
+    target. If even the limit falls short, the color at the limit is returned.
+    """
+    if _min_contrast_against(color.luminance, bg_color, bg_light_color) >= min_contrast:
+        return color
+
+    h, s, l = color.hsl
+    if is_dark_theme:
+        limit = max_lightness if l < max_lightness else 100
+    else:
+        limit = min_lightness if l > min_lightness else 0
+
+    def reaches(lightness):
+        lum = relative_luminance(*hsl_to_rgb(h, s, lightness))
+        return _min_contrast_against(lum, bg_color, bg_light_color) >= min_contrast
+
+    # Invariant: failing lightness and passing lightness
+    failing, passing = l, limit
+    if reaches(passing):
+        while abs(passing - failing) > tolerance:
+            mid = (failing + passing) / 2
+            if reaches(mid):
+                passing = mid
+            else:
+                failing = mid
+
+    return create_color(*hsl_to_rgb(h, s, passing))
+
+
+# How ensure_contrast()/ensure_terminal_contrast() move a color: "solve" uses
+# solve_contrast(), "step" keeps the original fixed-step loops (reproduces
+# palettes generated before the solver existed).
+CONTRAST_METHODS = ("solve", "step")
+
+
+def ensure_contrast(
+    color, bg_color, bg_light_color, min_contrast, is_dark_theme, method="solve"
+):
     """
     Adjust color to ensure it meets minimum contrast against BOTH backgrounds.
     Returns adjusted color.
     """
+    if method == "solve":
+        return solve_contrast(
+            color, bg_color, bg_light_color, min_contrast, is_dark_theme, 5, 95
+        )
+
     max_iterations = 50
     step = 3 if is_dark_theme else -3
 
@@ -134,11 +494,16 @@ def ensure_contrast(color, bg_color, bg_light_color, min_contrast, is_dark_theme
 
 
 def ensure_terminal_contrast(
-    color, bg_color, bg_light_color, min_contrast, is_dark_theme
+    color, bg_color, bg_light_color, min_contrast, is_dark_theme, method="solve"
 ):
     """
     Adjust terminal color for readability. More aggressive than text.
     """
+    if method == "solve":
+        return solve_contrast(
+            color, bg_color, bg_light_color, min_contrast, is_dark_theme, 10, 90
+        )
+
     max_iterations = 60
     step = 4 if is_dark_theme else -4
 
@@ -218,6 +583,10 @@ def blend_color_with_opacity(bg_color, wallpaper_rgb, opacity):
     return create_color(blended_r, blended_g, blended_b)
 
 
+# Opacities reported by calculate_safe_opacity() are multiples of this step
+SAFE_OPACITY_STEP = 1 / 1024
+
+
 def calculate_safe_opacity(bg_color, fg_color, min_contrast, is_dark_theme):
     """
     Calculate the minimum opacity that maintains contrast with worst-case wallpaper.
@@ -225,47 +594,118 @@ def calculate_safe_opacity(bg_color, fg_color, min_contrast, is_dark_theme):
     For dark themes: worst case is white wallpaper (#ffffff)
     For light themes: worst case is black wallpaper (#000000)
 
-    Uses binary search to find the minimum opacity where:
+    Raising the opacity only moves the blended background away from the
+    wallpaper, so the opacities where
         contrast(blended_bg, fg) >= min_contrast
+    holds from there up to fully opaque form a single range. Bisects the
+    multiples of SAFE_OPACITY_STEP for the first one in it; see
+    solve_safe_opacities() for the exact start.
 
-    Returns opacity value 0.0-1.0 (higher = more opaque)
+    Returns opacity value 0.0-1.0 (higher = more opaque), 1.0 if even the
+    opaque background lacks contrast
     """
-    # Worst case wallpaper
-    wallpaper_rgb = (255, 255, 255) if is_dark_theme else (0, 0, 0)
-
-    low, high = 0.0, 1.0
-    result = 1.0  # Default to fully opaque if we can't find a solution
-
-    for _ in range(50):  # Binary search iterations
-        mid = (low + high) / 2
+    wallpaper = 255 if is_dark_theme else 0
+    fg_lum = fg_color.luminance
+    bg_r, bg_g, bg_b = bg_color.rgb
 
-        blended = blend_color_with_opacity(bg_color, wallpaper_rgb, mid)
-        achieved_contrast = contrast_ratio(blended.luminance, fg_color.luminance)
+    def readable(opacity):
+        """Contrast holds here and blending further can't lose it"""
+        # Blended like blend_color_with_opacity()
+        wp = wallpaper * (1 - opacity)
+        lum = relative_luminance(
+            int(bg_r * opacity + wp), int(bg_g * opacity + wp), int(bg_b * opacity + wp)
+        )
 
-        if achieved_contrast >= min_contrast:
-            result = mid
-            high = mid  # Try for more transparency (lower opacity)
+        # Still on the wallpaper's side of the text
+        if (lum > fg_lum) == is_dark_theme:
+            return False
+        return contrast_ratio(lum, fg_lum) >= min_contrast
+
+    if contrast_ratio(bg_color.luminance, fg_lum) < min_contrast:
+        return 1.0
+    if not readable(1.0):
+        # Readable on the wallpaper's side all the way to opaque
+        return SAFE_OPACITY_STEP
+
+    low, high = 0, round(1 / SAFE_OPACITY_STEP)
+    while high - low > 1:
+        mid = (low + high) // 2
+        if readable(mid * SAFE_OPACITY_STEP):
+            high = mid
         else:
-            low = mid  # Need more opacity
+            low = mid
+    return high * SAFE_OPACITY_STEP
 
-        if high - low < 0.001:
-            break
 
-    return result
+def solve_safe_opacities(bg_rgbs, fg_luminance, min_contrast, is_dark_theme):
+    """Exact minimum safe opacity of several backgrounds at once.
 
+    Same worst case as calculate_safe_opacity(), without the grid: the blend
+    truncates each channel to an integer, so it only changes where a channel
+    reaches the next level, at most 3 x 255 opacities per background. Every
+    stretch between them is checked in one pass, and the result is where the
+    last one lacking contrast ends (0.0 if none does, 1.0 if the opaque
+    background already lacks it).
 
-def calculate_theme_opacity(palette, is_dark_theme):
+    Args:
+        bg_rgbs: (N, 3) integer RGB of the backgrounds
+        fg_luminance: Luminance of the text that has to stay readable
+        min_contrast: Contrast ratio to keep
+        is_dark_theme: Selects the worst-case wallpaper
+
+    Returns an (N,) array of opacities 0.0-1.0.
+    """
+    import numpy as np
+
+    wallpaper = 255.0 if is_dark_theme else 0.0
+    bg = np.asarray(bg_rgbs, dtype=np.float64).reshape(-1, 3)
+    n = len(bg)
+
+    def failing(opacities):
+        """(N, M) opacities -> whether each blend lacks contrast"""
+        o = opacities[:, :, None]
+        # Blended like blend_color_with_opacity()
+        blended = (bg[:, None, :] * o + wallpaper * (1 - o)).astype(np.int64)
+        lums = relative_luminance_array(blended.reshape(-1, 3))
+        contrast = contrast_ratio_matrix(lums, [fg_luminance])
+        return (contrast < min_contrast).reshape(opacities.shape)
+
+    # Opacities where a channel reaches a level, sorted after 0 and padded
+    # with 1. Column 0 (level 0 of red) never falls inside (0, 1).
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bounds = (np.arange(256.0) - wallpaper) / (bg - wallpaper)[:, :, None]
+    bounds = bounds.reshape(n, -1)
+    bounds[~((bounds > 0) & (bounds < 1))] = 1.0
+    bounds[:, 0] = 0.0
+    bounds.sort(axis=1)
+
+    # Padding makes empty stretches at 1, which check the opaque background
+    fails = failing((bounds[:, :-1] + bounds[:, 1:]) / 2)
+    ends = fails.shape[1] - fails[:, ::-1].argmax(axis=1)
+    result = np.where(fails.any(axis=1), bounds[np.arange(n), ends], 0.0)
+
+    # Blending exactly at a level can still round to the one before it
+    while True:
+        short = failing(result[:, None])[:, 0] & (result < 1)
+        if not short.any():
+            return result
+        result[short] = np.nextafter(result[short], 2.0)
+
+
+def calculate_theme_opacity(palette, is_dark_theme, min_contrast=MIN_DIM_CONTRAST):
     """
     Calculate optimal opacity for a theme based on contrast preservation.
     Uses the lowest-contrast text (foreground_dim) to ensure all text remains readable.
+    min_contrast is the dim text contrast the palette was built to, see
+    PaletteProfile.
 
     Returns opacity value 0.0-1.0
     """
     bg = palette["background"]
     fg_dim = palette["foreground_dim"]
 
-    # Use MIN_DIM_CONTRAST as the threshold since that's our lowest acceptable contrast
-    opacity = calculate_safe_opacity(bg, fg_dim, MIN_DIM_CONTRAST, is_dark_theme)
+    # Use the dim text contrast as the threshold since that's our lowest acceptable
+    opacity = calculate_safe_opacity(bg, fg_dim, min_contrast, is_dark_theme)
 
     # Add a small safety margin (5% more opaque)
     opacity = min(1.0, opacity + 0.05)
@@ -273,6 +713,40 @@ def calculate_theme_opacity(palette, is_dark_theme):
     return opacity
 
 
+# Backgrounds text is drawn on, see calculate_surface_opacities()
+SURFACE_ROLES = (
+    "background",
+    "background_medium",
+    "background_light",
+    "element",
+    "element_hover",
+    "element_active",
+    "element_selected",
+)
+
+
+def calculate_surface_opacities(palette, is_dark_theme, min_contrast=MIN_DIM_CONTRAST):
+    """
+    Per-surface counterpart of calculate_theme_opacity(): the opacity each of
+    SURFACE_ROLES needs for foreground_dim to stay readable (min_contrast, a
+    PaletteProfile's dim_contrast) over the worst-case wallpaper, solved exactly
+    for all of them in one solve_safe_opacities() call.
+
+    Returns dict of role -> opacity value 0.0-1.0
+    """
+    opacities = solve_safe_opacities(
+        [palette[role].rgb for role in SURFACE_ROLES],
+        palette["foreground_dim"].luminance,
+        min_contrast,
+        is_dark_theme,
+    )
+    # Same safety margin as calculate_theme_opacity()
+    return {
+        role: min(1.0, float(opacity) + 0.05)
+        for role, opacity in zip(SURFACE_ROLES, opacities)
+    }
+
+
 def calculate_layered_opacities(editor_target):
     """
     Calculate opacity values for the layered transparency system.
@@ -315,258 +789,1370 @@ def calculate_layered_opacities(editor_target):
     }
 
 
-def extract_colors(image_path, n_colors=20):
-    """Extract dominant colors using k-means clustering"""
-    img = Image.open(image_path).convert("RGB")
-    img.thumbnail((300, 300))
-    pixels = np.array(img).reshape(-1, 3)
+def load_image(image_path, size=None, max_bytes=None):
+    """Decode an image from disk as RGB.
 
-    # Remove extreme pixels
-    mask = (pixels.sum(axis=1) > 30) & (pixels.sum(axis=1) < 735)
-    filtered_pixels = pixels[mask]
+    With size, the image is only decoded at the resolution a size x size
+    thumbnail needs (DECODE_REDUCING_GAP times larger): JPEGs are decoded
+    straight at a reduced scale via draft(), uncompressed BMP/PPM/TIFF data is
+    sampled from a memory map without decoding the rest, other formats are
+    box-reduced right after decoding.
 
-    if len(filtered_pixels) < n_colors:
-        filtered_pixels = pixels
+    Raises ValueError instead of decoding a bitmap larger than max_bytes
+    (default: DECODE_MEMORY_LIMIT). This replaces Pillow's decompression bomb
+    check, so images too large for it still load when they can be sampled.
+    """
+    return _decode_image(image_path, size, max_bytes)[0]
 
-    kmeans = KMeans(n_clusters=n_colors, random_state=42, n_init=10)
-    kmeans.fit(filtered_pixels)
 
-    colors = []
-    for center in kmeans.cluster_centers_:
-        r, g, b = int(center[0]), int(center[1]), int(center[2])
-        colors.append(create_color(r, g, b))
+def _decode_image(fp, size, max_bytes=None):
+    """load_image() for a path or file object.
 
-    return colors
+    Returns (RGB image, full image size, size the decoder produced before any
+    reduce()).
+    """
+    from PIL import Image
+
+    max_bytes = DECODE_MEMORY_LIMIT if max_bytes is None else max_bytes
+    bomb_limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+    try:
+        img = Image.open(fp)
+    finally:
+        Image.MAX_IMAGE_PIXELS = bomb_limit
+    full_size = img.size
+
+    needed = _needed_size(full_size, size)
+    if needed != full_size:
+        img.draft("RGB", needed)  # DCT scaling, a no-op for non-JPEG images
+        sampled = _sample_raw_tiles(img, fp, needed)
+        if sampled is not None:
+            return sampled, full_size, sampled.size
+
+    decode_bytes = _decode_bytes(img)
+    if decode_bytes > max_bytes:
+        raise ValueError(
+            f"Decoding this {full_size[0]}x{full_size[1]} {img.format} image "
+            f"needs {decode_bytes / 2**20:.0f} MiB, over the "
+            f"{max_bytes / 2**20:.0f} MiB limit"
+        )
+    if img.mode == "RGB":
+        img.load()  # convert() would make a second full-size copy
+    else:
+        img = img.convert("RGB")
+    return _reduce_image(img, needed), full_size, img.size
 
 
-def find_average_color(image_path):
-    """Get overall average color of image"""
-    img = Image.open(image_path).convert("RGB")
-    img.thumbnail((100, 100))
-    pixels = np.array(img).reshape(-1, 3)
-    avg = pixels.mean(axis=0)
-    return create_color(int(avg[0]), int(avg[1]), int(avg[2]))
+def _decoded_input(image):
+    """The PIL image for a PIL image or pixel array input, None for encoded ones"""
+    from PIL import Image
 
+    if isinstance(image, Image.Image):
+        return image
+    if hasattr(image, "__array_interface__"):
+        return Image.fromarray(image)
+    return None
 
-def generate_functional_palette(image_path, force_theme=None):
-    """Generate a functional color palette with strict readability
 
-    Args:
-        image_path: Path to the source image
-        force_theme: "dark", "light", or None (auto-detect from image)
+class _BytesFile(io.BytesIO):
+    """BytesIO that keeps the buffer it was made from.
+
+    _sample_raw_tiles() views that buffer in place; getbuffer() would copy it,
+    since a BytesIO made from bytes shares them only until it is exported.
     """
-    colors = extract_colors(image_path, n_colors=20)
-    avg_color = find_average_color(image_path)
 
-    colors_by_lum = sorted(colors, key=lambda c: c.luminance)
-    colors_by_sat = sorted(colors, key=lambda c: c.hsl[1], reverse=True)
+    def __init__(self, data):
+        super().__init__(data)
+        self.data = data
 
-    palette = {}
 
-    # Determine if this should be a dark or light theme
-    if force_theme is not None:
-        is_dark_theme = force_theme == "dark"
-    else:
-        is_dark_theme = avg_color.luminance < 0.5
+def _encoded_input(image):
+    """A path or seekable file to decode a path, bytes or file object input from.
 
-    # === BACKGROUND ===
-    # Target lightness ranges for themes
-    DARK_BG_MAX_LIGHTNESS = 18  # Dark themes: 8-18% lightness
-    DARK_BG_MIN_LIGHTNESS = 8
-    LIGHT_BG_MIN_LIGHTNESS = 85  # Light themes: 85-95% lightness
-    LIGHT_BG_MAX_LIGHTNESS = 95
+    File objects are read to the end once, since Pillow needs to seek and pipes
+    such as stdin can't. The bytes are then shared with the returned file, not
+    copied (a bytearray or memoryview is copied once).
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return _BytesFile(image)
+    if hasattr(image, "read"):
+        return _BytesFile(image.read())
+    return image
 
-    if is_dark_theme:
-        # Dark theme: pick a color with good saturation, then force it dark
-        # Prefer colors with moderate saturation for character
-        bg_base = sorted(colors, key=lambda c: abs(c.hsl[1] - 25))[0]
-        h, s, l = bg_base.hsl
-        # Clamp lightness to dark range
-        target_l = min(max(l, DARK_BG_MIN_LIGHTNESS), DARK_BG_MAX_LIGHTNESS)
-        # If the source color was bright, bring it down to dark range
-        if l > DARK_BG_MAX_LIGHTNESS:
-            target_l = DARK_BG_MAX_LIGHTNESS - 3  # Aim for ~15% lightness
-        bg = create_color(*hsl_to_rgb(h, min(s, MAX_BG_SATURATION), target_l))
-    else:
-        # Light theme: pick a color with subtle saturation, then force it light
-        bg_base = sorted(colors, key=lambda c: abs(c.hsl[1] - 15))[0]
-        h, s, l = bg_base.hsl
-        # Clamp lightness to light range
-        target_l = min(max(l, LIGHT_BG_MIN_LIGHTNESS), LIGHT_BG_MAX_LIGHTNESS)
-        # If the source color was dark, bring it up to light range
-        if l < LIGHT_BG_MIN_LIGHTNESS:
-            target_l = LIGHT_BG_MIN_LIGHTNESS + 5  # Aim for ~90% lightness
-        bg = create_color(
-            *hsl_to_rgb(h, min(s, MAX_BG_SATURATION / 2), target_l)
-        )  # Lower saturation for light themes
 
-    # Clamp background saturation to avoid gaudy
-    bg = clamp_saturation(bg, MAX_BG_SATURATION)
-    palette["background"] = bg
+def _load_input(image, size):
+    """load_image() for every kind of input analyze_image() takes"""
+    decoded = _decoded_input(image)
+    if decoded is None:
+        return load_image(_encoded_input(image), size)
+    return decoded if decoded.mode == "RGB" else decoded.convert("RGB")
 
-    # === BACKGROUND MEDIUM ===
-    if is_dark_theme:
-        bg_medium = adjust_color(bg, lightness_delta=4)
-    else:
-        bg_medium = adjust_color(bg, lightness_delta=-3)
-    bg_medium = clamp_saturation(bg_medium, MAX_BG_SATURATION)
-    palette["background_medium"] = bg_medium
 
-    # === BACKGROUND LIGHT ===
-    if is_dark_theme:
-        bg_light = adjust_color(bg, lightness_delta=8)
-    else:
-        bg_light = adjust_color(bg, lightness_delta=-6)
-    bg_light = clamp_saturation(bg_light, MAX_BG_SATURATION)
-    palette["background_light"] = bg_light
+def _needed_size(full_size, size):
+    """Pixels needed for a thumbnail() of size x size, times the reducing gap"""
+    if size is None or DECODE_REDUCING_GAP is None:
+        return full_size
+    width, height = full_size
+    scale = min(size / width, size / height, 1.0) * DECODE_REDUCING_GAP
+    return (max(1, int(width * scale)), max(1, int(height * scale)))
 
-    # === BACKGROUND DISABLED ===
-    # Desaturated, slightly different from bg for disabled surfaces
-    if is_dark_theme:
-        bg_disabled = adjust_color(bg, lightness_delta=-2, saturation_delta=-10)
-    else:
-        bg_disabled = adjust_color(bg, lightness_delta=2, saturation_delta=-10)
-    bg_disabled = clamp_saturation(bg_disabled, MAX_BG_SATURATION)
-    palette["background_disabled"] = bg_disabled
 
-    # === ELEMENT BACKGROUNDS ===
-    # For interactive elements (buttons, inputs, checkboxes, etc.)
-    if is_dark_theme:
-        # element.background - sits between bg and bg_medium
-        element_bg = adjust_color(bg, lightness_delta=2)
-        # element.hover - lighter than element
-        element_hover = adjust_color(bg, lightness_delta=5)
-        # element.active - lighter than hover (pressed state)
-        element_active = adjust_color(bg, lightness_delta=8)
-        # element.selected - same as active
-        element_selected = element_active
-        # element.disabled - darker and desaturated
-        element_disabled = adjust_color(bg, lightness_delta=-1, saturation_delta=-10)
-    else:
-        element_bg = adjust_color(bg, lightness_delta=-2)
-        element_hover = adjust_color(bg, lightness_delta=-4)
-        element_active = adjust_color(bg, lightness_delta=-6)
-        element_selected = element_active
-        element_disabled = adjust_color(bg, lightness_delta=2, saturation_delta=-10)
+def _reduce_image(img, needed):
+    factor = min(img.width // needed[0], img.height // needed[1])
+    return img.reduce(factor) if factor > 1 else img
 
-    palette["element"] = clamp_saturation(element_bg, MAX_BG_SATURATION)
-    palette["element_hover"] = clamp_saturation(element_hover, MAX_BG_SATURATION)
-    palette["element_active"] = clamp_saturation(element_active, MAX_BG_SATURATION)
-    palette["element_selected"] = clamp_saturation(element_selected, MAX_BG_SATURATION)
-    palette["element_disabled"] = clamp_saturation(element_disabled, MAX_BG_SATURATION)
 
-    # === POST-PROCESS: Ensure backgrounds allow for readable text ===
-    # For dark themes, if bg_light is too bright, we can't get enough contrast even with white text
-    # Calculate max possible contrast (white text on bg_light)
-    if is_dark_theme:
-        white_lum = 1.0
-        max_possible_contrast = contrast_ratio(white_lum, bg_light.luminance)
+def _decode_bytes(img):
+    """Memory needed to decode an opened image and convert it to RGB"""
+    if img.mode in ("1", "L", "P"):
+        bytes_per_pixel = 1
+    elif img.mode.startswith("I;16"):
+        bytes_per_pixel = 2
+    else:
+        bytes_per_pixel = 4  # Pillow pads 3-channel modes to 4 bytes
+    if img.mode != "RGB":
+        bytes_per_pixel += 4
+    return img.width * img.height * bytes_per_pixel
+
+
+# Uncompressed pixel layouts _sample_raw_tiles() reads straight from the file:
+# Pillow raw mode -> (bytes per pixel, byte offsets of red, green and blue)
+_RAW_LAYOUTS = {
+    "RGB": (3, (0, 1, 2)),
+    "BGR": (3, (2, 1, 0)),
+    "RGBX": (4, (0, 1, 2)),
+    "RGBA": (4, (0, 1, 2)),
+    "BGRX": (4, (2, 1, 0)),
+    "BGRA": (4, (2, 1, 0)),
+    "L": (1, (0, 0, 0)),
+}
+
+
+def _sample_raw_tiles(img, fp, needed):
+    """Sample an uncompressed image from a memory map of its file or its bytes.
+
+    Picks every step-th pixel of every step-th row, step being the factor
+    reduce() would use for the needed size, so only the sampled rows are ever
+    read and the full bitmap is never held. Returns an RGB image, or None if
+    the image isn't stored as raw tiles in a layout from _RAW_LAYOUTS or fp is
+    neither a path nor a _BytesFile from _encoded_input().
+    """
+    import os
 
-        # If we can't even get MIN_TEXT_CONTRAST with white, darken the backgrounds
-        if max_possible_contrast < MIN_TEXT_CONTRAST + 0.5:  # Add buffer
-            # Calculate required bg_light luminance for 5.5:1 with white
-            # contrast = (1 + 0.05) / (bg_lum + 0.05) >= 5.5
-            # bg_lum <= (1.05 / 5.5) - 0.05 = 0.14
-            target_lum = 0.12
+    import numpy as np
+    from PIL import Image
+
+    width, height = img.size
+    step = min(width // needed[0], height // needed[1])
+    if step <= 1 or not img.tile:
+        return None
+
+    tiles = []
+    for tile in img.tile:
+        name, (x0, y0, x1, y1), offset, args = tile[:4]
+        args = (args,) if isinstance(args, str) else tuple(args)
+        if name != "raw" or args[0] not in _RAW_LAYOUTS:
+            return None
+        bytes_per_pixel, channels = _RAW_LAYOUTS[args[0]]
+        stride = (args[1] if len(args) > 1 else 0) or (x1 - x0) * bytes_per_pixel
+        bottom_up = len(args) > 2 and args[2] < 0
+        tiles.append(
+            ((x0, y0, x1, y1), offset, bytes_per_pixel, channels, stride, bottom_up)
+        )
 
-            # Darken bg_light until we hit target luminance
-            while bg_light.luminance > target_lum and bg_light.hsl[2] > 5:
-                bg_light = adjust_color(bg_light, lightness_delta=-3)
+    if isinstance(fp, (str, os.PathLike)):
+        data = np.memmap(fp, dtype=np.uint8, mode="r")
+    elif isinstance(fp, _BytesFile):
+        data = np.frombuffer(memoryview(fp.data).cast("B"), dtype=np.uint8)
+    else:
+        return None
+
+    ys = np.arange(step // 2, height, step)
+    xs = np.arange(step // 2, width, step)
+    sample = np.empty((len(ys), len(xs), 3), dtype=np.uint8)
+    for (x0, y0, x1, y1), offset, bytes_per_pixel, channels, stride, bottom_up in tiles:
+        rows = (ys >= y0) & (ys < y1)
+        cols = (xs >= x0) & (xs < x1)
+        if not rows.any() or not cols.any():
+            continue
+        end = offset + (y1 - y0) * stride
+        if end > len(data):
+            raise ValueError("Image data is truncated")
+        pixels = data[offset:end].reshape(y1 - y0, stride)
+        tile_rows = ys[rows] - y0
+        if bottom_up:
+            tile_rows = (y1 - y0 - 1) - tile_rows
+        tile_bytes = (xs[cols] - x0)[:, None] * bytes_per_pixel + channels
+        sample[np.ix_(rows, cols)] = pixels[tile_rows[:, None, None], tile_bytes]
+    return Image.fromarray(sample)
+
+
+def _thumbnail_pixels(img, size):
+    """Downscale a copy of a decoded image and return its pixels as an (N, 3) array"""
+    import numpy as np
+
+    thumb = img.copy()
+    thumb.thumbnail((size, size))
+    return np.array(thumb).reshape(-1, 3)
+
+
+# === COLOR QUANTIZERS ===
+# Each engine takes an (N, 3) array of colors, a color count and optional
+# per-color weights (pixel counts from color_histogram()) and returns an
+# (n_colors, 3) array of RGB centers (fewer rows if the engine finds fewer
+# distinct colors). Weighted colors must give the same result as the
+# equivalent repeated pixels, up to the engine's randomness.
+
+
+def color_histogram(pixels, bits=8):
+    """Collapse pixels into distinct colors with pixel counts.
 
-            # Also darken main bg proportionally
-            lum_diff = palette["background_light"].luminance - bg_light.luminance
-            if lum_diff > 0:
-                bg = adjust_color(bg, lightness_delta=-int(lum_diff * 80))
-                bg = clamp_saturation(bg, MAX_BG_SATURATION)
-                palette["background"] = bg
+    Args:
+        pixels: (N, 3) uint8 RGB array
+        bits: Bits kept per channel. 8 keeps exact colors; fewer bits merge
+              nearby colors into one bin, represented by the mean of its pixels.
 
-            palette["background_light"] = bg_light
+    Returns:
+        (colors, counts): (M, 3) float64 colors and (M,) pixel counts
+    """
+    import numpy as np
 
-    # === FOREGROUND ===
-    # Must have good contrast with BOTH bg and bg_light
-    if is_dark_theme:
-        # Start with lightest color from palette
-        fg_candidates = [c for c in colors if c.luminance > 0.5]
-        if fg_candidates:
-            fg_base = sorted(fg_candidates, key=lambda c: c.luminance, reverse=True)[0]
-        else:
-            fg_base = colors_by_lum[-1]
-        fg_base = adjust_color(fg_base, lightness_delta=10, saturation_delta=-20)
+    shift = 8 - bits
+    binned = (pixels >> shift).astype(np.int64)
+    keys = (binned[:, 0] << (2 * bits)) | (binned[:, 1] << bits) | binned[:, 2]
+    unique_keys, inverse, counts = np.unique(
+        keys, return_inverse=True, return_counts=True
+    )
+    if shift == 0:
+        colors = np.column_stack(
+            [unique_keys >> 16, (unique_keys >> 8) & 0xFF, unique_keys & 0xFF]
+        ).astype(np.float64)
     else:
-        # Light theme: dark foreground
-        fg_candidates = [c for c in colors if c.luminance < 0.3]
-        if fg_candidates:
-            fg_base = sorted(fg_candidates, key=lambda c: c.luminance)[0]
-        else:
-            fg_base = colors_by_lum[0]
-        fg_base = adjust_color(fg_base, lightness_delta=-10, saturation_delta=-20)
+        inverse = inverse.reshape(-1)
+        colors = np.column_stack(
+            [
+                np.bincount(inverse, weights=pixels[:, i], minlength=len(counts))
+                for i in range(3)
+            ]
+        )
+        colors /= counts[:, None]
+    return colors, counts
 
-    # Clamp saturation and ensure contrast
-    fg_base = clamp_saturation(fg_base, MAX_FG_SATURATION)
-    fg = ensure_contrast(fg_base, bg, bg_light, MIN_TEXT_CONTRAST, is_dark_theme)
-    palette["foreground"] = fg
 
-    # Push foreground a bit lighter for dark themes
-    if is_dark_theme:
-        fg = adjust_color(fg, lightness_delta=5)
-    palette["foreground"] = fg
+def _nearest_center(points, centers, point_norms=None):
+    """Index of the closest center for each point, and the squared distance"""
+    import numpy as np
 
-    # === FOREGROUND BRIGHT ===
-    # Brighter than foreground for emphasis, headings, etc.
-    if is_dark_theme:
-        fg_bright_base = adjust_color(fg, lightness_delta=10)
-    else:
-        fg_bright_base = adjust_color(fg, lightness_delta=-10)
-    fg_bright = clamp_saturation(fg_bright_base, MAX_FG_SATURATION)
-    palette["foreground_bright"] = fg_bright
+    if point_norms is None:
+        point_norms = (points**2).sum(axis=1)
+    distances = -2 * points @ centers.T
+    distances += (centers**2).sum(axis=1)[None, :]
+    labels = distances.argmin(axis=1)
+    closest = distances[np.arange(len(points)), labels] + point_norms
+    return labels, np.maximum(closest, 0)
 
-    # === FOREGROUND MEDIUM ===
-    # Intermediate between foreground and foreground_dim
-    if is_dark_theme:
-        fg_medium_base = adjust_color(fg, lightness_delta=-3)
-    else:
-        fg_medium_base = adjust_color(fg, lightness_delta=4)
-    fg_medium = ensure_contrast(
-        fg_medium_base, bg, bg_light, MIN_TEXT_CONTRAST, is_dark_theme
+
+def _center_sums(points, weights, labels, k):
+    """Per-cluster total weight and weighted coordinate sums"""
+    import numpy as np
+
+    counts = np.bincount(labels, weights=weights, minlength=k)
+    sums = np.column_stack(
+        [
+            np.bincount(labels, weights=points[:, i] * weights, minlength=k)
+            for i in range(3)
+        ]
     )
-    palette["foreground_medium"] = fg_medium
+    return counts, sums
+
+
+def _kmeans_plusplus(points, weights, n_clusters, rng):
+    """Greedy weighted k-means++ seeding (a few candidates per step, keep the best)"""
+    import numpy as np
+
+    n = len(points)
+    n_trials = 2 + int(np.log(n_clusters))
+    point_norms = (points**2).sum(axis=1)
+    centers = np.empty((n_clusters, points.shape[1]))
+    first = np.searchsorted(np.cumsum(weights), rng.random() * weights.sum())
+    centers[0] = points[min(first, n - 1)]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+
+    for i in range(1, n_clusters):
+        cumulative = np.cumsum(closest * weights)
+        if cumulative[-1] == 0:
+            centers[i] = points[rng.integers(n)]
+            continue
+        candidates = np.searchsorted(cumulative, rng.random(n_trials) * cumulative[-1])
+        candidates = np.minimum(candidates, n - 1)
+        candidate_dist = -2 * points[candidates] @ points.T
+        candidate_dist += point_norms[None, :]
+        candidate_dist += point_norms[candidates][:, None]
+        candidate_dist = np.minimum(closest[None, :], candidate_dist)
+        best = (candidate_dist @ weights).argmin()
+        centers[i] = points[candidates[best]]
+        closest = candidate_dist[best]
+
+    return centers
+
+
+def _lloyd(points, weights, centers, max_iter, tol):
+    """Full-batch weighted k-means refinement. Returns (centers, inertia)"""
+    k = len(centers)
+    point_norms = (points**2).sum(axis=1)
+    for _ in range(max_iter):
+        labels, _ = _nearest_center(points, centers, point_norms)
+        counts, sums = _center_sums(points, weights, labels, k)
+        filled = counts > 0
+        new_centers = centers.copy()
+        new_centers[filled] = sums[filled] / counts[filled, None]
+        shift = ((new_centers - centers) ** 2).sum()
+        centers = new_centers
+        if shift <= tol:
+            break
+    _, distances = _nearest_center(points, centers, point_norms)
+    return centers, distances @ weights
 
-    # === FOREGROUND DIM ===
-    # Start closer to fg, then ensure contrast - don't go too far from readable
-    if is_dark_theme:
-        fg_dim_base = adjust_color(fg, lightness_delta=-8)
-    else:
-        fg_dim_base = adjust_color(fg, lightness_delta=10)
-    fg_dim = ensure_contrast(fg_dim_base, bg, bg_light, MIN_DIM_CONTRAST, is_dark_theme)
-    palette["foreground_dim"] = fg_dim
 
-    # === PRIMARY ACCENT ===
-    vibrant_colors = [c for c in colors if c.hsl[1] > 35 and 0.1 < c.luminance < 0.75]
-    if vibrant_colors:
-        primary = sorted(vibrant_colors, key=lambda c: c.hsl[1], reverse=True)[0]
-    else:
-        primary = colors_by_sat[0]
-    primary = clamp_saturation(primary, MAX_ACCENT_SATURATION)
-    palette["primary"] = primary
+def quantize_kmeans(pixels, n_colors, weights=None):
+    """NumPy mini-batch k-means with k-means++ seeding.
 
-    # === SECONDARY ACCENT ===
-    primary_hue = primary.hsl[0]
-    secondary_candidates = [
-        c
-        for c in colors
-        if c.hsl[1] > 25
-        and abs(c.hsl[0] - primary_hue) > 40
-        and 0.1 < c.luminance < 0.75
-    ]
-    if secondary_candidates:
-        secondary = sorted(secondary_candidates, key=lambda c: c.hsl[1], reverse=True)[
-            0
+    Mini-batches (drawn in proportion to the weights) get the centers close
+    cheaply, then full Lloyd passes converge them. The best of
+    KMEANS_NUMPY_N_INIT seeded runs is kept. Deterministic for a given
+    KMEANS_RANDOM_STATE.
+    """
+    import numpy as np
+
+    points = np.asarray(pixels, dtype=np.float64)
+    n = len(points)
+    weights = np.ones(n) if weights is None else np.asarray(weights, np.float64)
+    k = min(n_colors, n)
+    rng = np.random.default_rng(KMEANS_RANDOM_STATE)
+    # Same convergence criterion as scikit-learn: relative to the data variance
+    mean = weights @ points / weights.sum()
+    tol = 1e-4 * (weights @ (points - mean) ** 2 / weights.sum()).mean()
+    cumulative_weights = np.cumsum(weights)
+
+    best_centers, best_inertia = None, np.inf
+    for _ in range(KMEANS_NUMPY_N_INIT):
+        centers = _kmeans_plusplus(points, weights, k, rng)
+        if n > KMEANS_BATCH_SIZE:
+            counts = np.zeros(k)
+            for _ in range(KMEANS_MAX_ITER):
+                picks = np.searchsorted(
+                    cumulative_weights,
+                    rng.random(KMEANS_BATCH_SIZE) * cumulative_weights[-1],
+                )
+                batch = points[np.minimum(picks, n - 1)]
+                labels, _ = _nearest_center(batch, centers)
+                batch_counts, sums = _center_sums(
+                    batch, np.ones(len(batch)), labels, k
+                )
+                counts += batch_counts
+                hit = batch_counts > 0
+                step = (
+                    sums[hit] - batch_counts[hit, None] * centers[hit]
+                ) / counts[hit, None]
+                centers[hit] += step
+                if (step**2).sum() <= tol:
+                    break
+        centers, inertia = _lloyd(points, weights, centers, KMEANS_MAX_ITER, tol)
+        if inertia < best_inertia:
+            best_centers, best_inertia = centers, inertia
+
+    return best_centers
+
+
+def quantize_median_cut(pixels, n_colors, weights=None):
+    """Median-cut: repeatedly split the box with the widest channel range at its
+    (weighted) median"""
+    import numpy as np
+
+    points = np.asarray(pixels, dtype=np.float64)
+    weights = np.ones(len(points)) if weights is None else np.asarray(weights)
+    boxes = [(points, weights)]
+    while len(boxes) < n_colors:
+        ranges = [
+            (np.ptp(box, axis=0).max() if len(box) > 1 else -1) for box, _ in boxes
         ]
-    else:
+        widest = int(np.argmax(ranges))
+        if ranges[widest] <= 0:
+            break
+        box, box_weights = boxes.pop(widest)
+        channel = np.ptp(box, axis=0).argmax()
+        order = np.argsort(box[:, channel], kind="stable")
+        cumulative = np.cumsum(box_weights[order])
+        half = np.searchsorted(cumulative, cumulative[-1] / 2)
+        half = min(max(half, 1), len(box) - 1)
+        boxes.append((box[order[:half]], box_weights[order[:half]]))
+        boxes.append((box[order[half:]], box_weights[order[half:]]))
+    return np.array([w @ box / w.sum() for box, w in boxes])
+
+
+def quantize_pil(pixels, n_colors, weights=None):
+    """PIL's built-in Image.quantize (median cut in C), using the colors it assigns"""
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(pixels)
+    if weights is not None:
+        # Pillow has no notion of weights: expand back to one row per pixel
+        pixels = np.repeat(pixels, np.asarray(weights, dtype=np.int64), axis=0)
+    img = Image.fromarray(pixels.reshape(1, -1, 3).astype(np.uint8), "RGB")
+    quantized = img.quantize(colors=n_colors)
+    palette = np.array(quantized.getpalette()[: 3 * n_colors]).reshape(-1, 3)
+    used = sorted(index for _, index in quantized.getcolors(n_colors))
+    return palette[used]
+
+
+def quantize_sklearn(pixels, n_colors, weights=None):
+    """scikit-learn KMeans (the original engine; needs the optional dependency)"""
+    try:
+        from sklearn.cluster import KMeans
+    except ImportError as e:
+        raise ImportError(
+            "The 'sklearn' quantizer needs scikit-learn: "
+            "pip install 'color-palette-generator[sklearn]'"
+        ) from e
+
+    kmeans = KMeans(
+        n_clusters=min(n_colors, len(pixels)),
+        random_state=KMEANS_RANDOM_STATE,
+        n_init=KMEANS_N_INIT,
+    )
+    kmeans.fit(pixels, sample_weight=weights)
+    return kmeans.cluster_centers_
+
+
+QUANTIZERS = {
+    "kmeans": quantize_kmeans,
+    "median-cut": quantize_median_cut,
+    "pil": quantize_pil,
+    "sklearn": quantize_sklearn,
+}
+DEFAULT_QUANTIZER = "kmeans"
+
+
+def _cluster_pixels(pixels, n_colors, quantizer=DEFAULT_QUANTIZER):
+    """Quantize RGB pixels. Returns (colors, filtered pixel count, histogram size)
+
+    The pixels are first collapsed by color_histogram(), so clustering cost
+    depends on the number of distinct colors rather than the pixel count.
+    """
+    import numpy as np
+
+    # Remove extreme pixels
+    mask = (pixels.sum(axis=1) > MIN_PIXEL_SUM) & (pixels.sum(axis=1) < MAX_PIXEL_SUM)
+    filtered_pixels = pixels[mask]
+
+    if len(filtered_pixels) < n_colors:
+        filtered_pixels = pixels
+
+    hist_colors, counts = color_histogram(filtered_pixels, HISTOGRAM_BITS)
+    centers = QUANTIZERS[quantizer](hist_colors, n_colors, counts)
+    colors = create_colors(np.asarray(centers, dtype=np.float64).astype(np.int64))
+
+    return colors, len(filtered_pixels), len(hist_colors)
+
+
+def _average_pixels(pixels):
+    """Average color of RGB pixels"""
+    avg = pixels.mean(axis=0)
+    return create_color(int(avg[0]), int(avg[1]), int(avg[2]))
+
+
+def extract_colors(image, n_colors=20, quantizer=DEFAULT_QUANTIZER):
+    """Extract dominant colors by color quantization
+
+    Args:
+        image: Source image, any input analyze_image() takes
+        n_colors: Number of colors to extract
+        quantizer: Name of the engine in QUANTIZERS
+    """
+    image = _load_input(image, CLUSTER_THUMBNAIL_SIZE)
+    pixels = _thumbnail_pixels(image, CLUSTER_THUMBNAIL_SIZE)
+    colors, _, _ = _cluster_pixels(pixels, n_colors, quantizer)
+    return colors
+
+
+def find_average_color(image):
+    """Get overall average color of image (any input analyze_image() takes)"""
+    image = _load_input(image, AVERAGE_THUMBNAIL_SIZE)
+    return _average_pixels(_thumbnail_pixels(image, AVERAGE_THUMBNAIL_SIZE))
+
+
+# === STAGE PROFILING ===
+# Pipeline stages report themselves through _stage(). Nothing is measured unless
+# a StageProfiler is active (see StageProfiler.measure()), so the unprofiled
+# cost is one global lookup per stage.
+
+# One stage of one image. start is the wall clock (time.time()) it began at,
+# wall and cpu are seconds. max_rss is the process's peak resident size after
+# the stage. peak_memory is how far the memory traced by tracemalloc rose above
+# its level at the start of the stage, which covers Python and NumPy but not
+# Pillow's decode buffers. Both are bytes, None when not measured.
+StageRecord = namedtuple(
+    "StageRecord",
+    ["image", "stage", "start", "wall", "cpu", "peak_memory", "max_rss", "pid"],
+)
+
+# Stage names used by the pipeline, in the order they run
+PROFILE_STAGES = (
+    "cache",
+    "decode",
+    "extract",
+    "palette",
+    "opacity",
+    "report",
+    "html",
+    "json",
+)
+
+_profiler = None  # The StageProfiler measuring this process, if any
+
+
+class StageProfiler:
+    """Collects a StageRecord for every pipeline stage run while measuring.
+
+    Example:
+        profiler = StageProfiler()
+        for path in paths:
+            with profiler.measure(path):
+                export_theme(path, out_dir, verbose=False)
+        write_profile(profiler.records, "profile.jsonl")
+        print(format_profile_summary(profiler.records))
+
+    Stages are measured per process, so only one thread should run the
+    pipeline while a profiler is active.
+
+    Args:
+        trace_memory: Also measure peak_memory with tracemalloc. Tracing slows
+                      the Python-heavy stages down several times over, so
+                      their times are only comparable between runs that
+                      both trace or both don't.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._image = None
+
+    @contextlib.contextmanager
+    def measure(self, image=None):
+        """Context manager recording the stages run inside it, labelled image"""
+        import tracemalloc
+
+        global _profiler
+        previous, _profiler = _profiler, self
+        self._image = None if image is None else str(image)
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            _profiler = previous
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager recording one stage of the current image.
+
+        Stages don't nest: an inner stage resets the outer one's memory peak.
+        """
+        import os
+        import time
+        import tracemalloc
+
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            peak = tracemalloc.get_traced_memory()[1] - baseline if tracing else None
+            self.records.append(
+                StageRecord(
+                    image=self._image,
+                    stage=name,
+                    start=start,
+                    wall=wall,
+                    cpu=cpu,
+                    peak_memory=peak,
+                    max_rss=_max_rss(),
+                    pid=os.getpid(),
+                )
+            )
+
+
+def _stage(name):
+    """Measure the block as stage name of the active StageProfiler, if any"""
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _profiler.stage(name)
+
+
+def _max_rss():
+    """Peak resident set size of this process in bytes, None if unknown"""
+    import sys
+
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def write_profile(records, path):
+    """Write StageRecords to path as a Chrome trace or as JSON lines.
+
+    A path ending in .json gets the Chrome trace-event format, which
+    chrome://tracing and https://ui.perfetto.dev show as one timeline per
+    process. Any other path gets one JSON object per record and line.
+    """
+    with open(path, "w") as f:
+        if not str(path).endswith(".json"):
+            for record in records:
+                f.write(json.dumps(record._asdict()) + "\n")
+            return
+
+        origin = min((record.start for record in records), default=0)
+        events = [
+            {
+                "name": record.stage,
+                "cat": "stage",
+                "ph": "X",
+                "ts": round((record.start - origin) * 1e6),
+                "dur": round(record.wall * 1e6),
+                "pid": record.pid,
+                "tid": record.pid,
+                "args": {
+                    "image": record.image,
+                    "cpu_ms": round(record.cpu * 1000, 3),
+                    "peak_memory": record.peak_memory,
+                    "max_rss": record.max_rss,
+                },
+            }
+            for record in records
+        ]
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def format_profile_summary(records):
+    """Table of the wall time, CPU time and peak memory of every stage"""
+    stages = {}
+    for record in records:
+        stages.setdefault(record.stage, []).append(record)
+    # Pipeline order first, then any stages added by callers
+    order = [stage for stage in PROFILE_STAGES if stage in stages]
+    order += sorted(set(stages) - set(order))
+
+    def megabytes(values):
+        values = [value for value in values if value is not None]
+        return f"{max(values) / 2**20:8.1f}M" if values else f"{'-':>9}"
+
+    lines = [
+        f"  {'stage':10} {'images':>6} {'wall':>9} {'per image':>10} "
+        f"{'cpu':>9} {'peak mem':>9} {'max rss':>9}"
+    ]
+    for stage in order:
+        group = stages[stage]
+        images = len({record.image for record in group})
+        wall = sum(record.wall for record in group)
+        cpu = sum(record.cpu for record in group)
+        lines.append(
+            f"  {stage:10} {images:6} {wall:8.3f}s {wall / images * 1000:8.1f}ms "
+            f"{cpu:8.3f}s {megabytes(r.peak_memory for r in group)} "
+            f"{megabytes(r.max_rss for r in group)}"
+        )
+    return "\n".join(lines)
+
+
+# Everything palette generation needs from an image, computed once and shared
+# by the dark and light builds. decoded_size is the resolution the decoder
+# produced (see load_image()); decode_seconds is None when the analysis came
+# from a ColorCache instead of decoding.
+ImageAnalysis = namedtuple(
+    "ImageAnalysis",
+    [
+        "colors",
+        "avg_color",
+        "image_size",
+        "sample_count",
+        "filtered_count",
+        "histogram_size",
+        "decoded_size",
+        "decode_seconds",
+    ],
+    defaults=(None, None),
+)
+
+
+# Both thumbnails come from one reduced decode sized for the larger one
+ANALYSIS_DECODE_SIZE = max(CLUSTER_THUMBNAIL_SIZE, AVERAGE_THUMBNAIL_SIZE)
+
+
+def analyze_image(image, n_colors=20, cache=None, quantizer=DEFAULT_QUANTIZER):
+    """Decode and cluster an image once.
+
+    Returns an ImageAnalysis with the extracted colors, the average color and
+    pixel statistics (image size, clustered sample size, pixels kept after
+    dropping near-black/near-white, distinct histogram bins clustered, decoded
+    size and decode time).
+
+    Args:
+        image: Path to the source image, encoded image bytes, a binary file
+               object (read to its end, e.g. sys.stdin.buffer), a PIL image or
+               an array of pixels as taken by PIL's Image.fromarray()
+        n_colors: Number of colors to extract
+        cache: Optional ColorCache. A hit skips decoding and clustering. PIL
+               images and arrays are never cached.
+        quantizer: Name of the engine in QUANTIZERS
+    """
+    decoded = _decoded_input(image)
+    if decoded is not None:
+        return analyze_decoded_image(decoded, n_colors, quantizer)
+    if cache is None:
+        return _analyze_source(_encoded_input(image), n_colors, quantizer)
+    if isinstance(image, (bytes, bytearray, memoryview)) or hasattr(image, "read"):
+        return analyze_image_bytes(
+            _encoded_input(image).data, n_colors, cache, quantizer
+        )
+
+    # A path is hashed in chunks and decoded from the file, so raw images are
+    # still sampled from a memory map rather than read into memory whole
+    with _stage("cache"):
+        key = cache.file_key(image, n_colors, quantizer)
+        analysis = cache.get(key)
+    if analysis is None:
+        analysis = _analyze_source(image, n_colors, quantizer)
+        with _stage("cache"):
+            cache.put(key, analysis)
+    return analysis
+
+
+def analyze_image_bytes(data, n_colors=20, cache=None, quantizer=DEFAULT_QUANTIZER):
+    """analyze_image() for an encoded image already held in memory"""
+    if cache is None:
+        return _analyze_source(_BytesFile(data), n_colors, quantizer)
+
+    with _stage("cache"):
+        key = cache.key(data, n_colors, quantizer)
+        analysis = cache.get(key)
+    if analysis is None:
+        analysis = _analyze_source(_BytesFile(data), n_colors, quantizer)
+        with _stage("cache"):
+            cache.put(key, analysis)
+    return analysis
+
+
+def analyze_decoded_image(img, n_colors=20, quantizer=DEFAULT_QUANTIZER):
+    """analyze_image() for an already decoded PIL image (never cached)"""
+    import time
+
+    start = time.perf_counter()
+    with _stage("decode"):
+        rgb = img if img.mode == "RGB" else img.convert("RGB")
+        rgb = _reduce_image(rgb, _needed_size(img.size, ANALYSIS_DECODE_SIZE))
+    decode_seconds = time.perf_counter() - start
+    return _analyze_rgb(
+        rgb, n_colors, quantizer, img.size, img.size, decode_seconds
+    )
+
+
+def _analyze_source(fp, n_colors, quantizer):
+    import time
+
+    start = time.perf_counter()
+    with _stage("decode"):
+        img, image_size, decoded_size = _decode_image(fp, ANALYSIS_DECODE_SIZE)
+    decode_seconds = time.perf_counter() - start
+    return _analyze_rgb(
+        img, n_colors, quantizer, image_size, decoded_size, decode_seconds
+    )
+
+
+def _analyze_rgb(img, n_colors, quantizer, image_size, decoded_size, decode_seconds):
+    with _stage("extract"):
+        pixels = _thumbnail_pixels(img, CLUSTER_THUMBNAIL_SIZE)
+        colors, filtered_count, histogram_size = _cluster_pixels(
+            pixels, n_colors, quantizer
+        )
+        avg_color = _average_pixels(_thumbnail_pixels(img, AVERAGE_THUMBNAIL_SIZE))
+    return ImageAnalysis(
+        colors=colors,
+        avg_color=avg_color,
+        image_size=image_size,
+        sample_count=len(pixels),
+        filtered_count=filtered_count,
+        histogram_size=histogram_size,
+        decoded_size=decoded_size,
+        decode_seconds=decode_seconds,
+    )
+
+
+def describe_decode(analysis):
+    """One-line summary of how an analysis was decoded"""
+    width, height = analysis.image_size
+    if analysis.decode_seconds is None:
+        return f"Image {width}x{height}, extracted colors loaded from cache"
+    decoded_width, decoded_height = analysis.decoded_size
+    # Pillow holds RGB pixels in 4 bytes each
+    megabytes = decoded_width * decoded_height * 4 / (1024 * 1024)
+    return (
+        f"Decoded {decoded_width}x{decoded_height} of {width}x{height} in "
+        f"{analysis.decode_seconds * 1000:.0f} ms ({megabytes:.1f} MiB of pixels)"
+    )
+
+
+def extraction_params(n_colors=20, quantizer=DEFAULT_QUANTIZER):
+    """Settings that determine the result of analyze_image() besides the pixels"""
+    params = {
+        "n_colors": n_colors,
+        "cluster_thumbnail": CLUSTER_THUMBNAIL_SIZE,
+        "average_thumbnail": AVERAGE_THUMBNAIL_SIZE,
+        "pixel_sum": [MIN_PIXEL_SUM, MAX_PIXEL_SUM],
+        "histogram_bits": HISTOGRAM_BITS,
+        "decode_reducing_gap": DECODE_REDUCING_GAP,
+        "quantizer": quantizer,
+    }
+    if quantizer == "kmeans":
+        params["kmeans"] = {
+            "random_state": KMEANS_RANDOM_STATE,
+            "n_init": KMEANS_NUMPY_N_INIT,
+            "batch_size": KMEANS_BATCH_SIZE,
+            "max_iter": KMEANS_MAX_ITER,
+        }
+    elif quantizer == "sklearn":
+        params["kmeans"] = {
+            "random_state": KMEANS_RANDOM_STATE,
+            "n_init": KMEANS_N_INIT,
+        }
+    return params
+
+
+def palette_distance(centers_a, centers_b):
+    """How far apart two extracted color sets are, in RGB units.
+
+    Mean distance from each color to the nearest color of the other set,
+    averaged over both directions (0 = identical sets).
+    """
+    import numpy as np
+
+    a = np.asarray(centers_a, dtype=np.float64)
+    b = np.asarray(centers_b, dtype=np.float64)
+    d = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+    return (d.min(axis=1).mean() + d.min(axis=0).mean()) / 2
+
+
+def compare_quantizers(image, n_colors=20, quantizers=None, reference=None):
+    """Run several quantizers on the same pixels and compare them.
+
+    Args:
+        image: Source image, any input analyze_image() takes
+        quantizers: Engine names to run (default: all available)
+        reference: Engine the others are measured against (default: the
+                   first engine in quantizers)
+
+    Returns:
+        List of (name, wall seconds, CPU seconds, palette_distance to the
+        reference) tuples. Engines whose dependencies are missing are skipped.
+    """
+    import time
+
+    image = _load_input(image, CLUSTER_THUMBNAIL_SIZE)
+    pixels = _thumbnail_pixels(image, CLUSTER_THUMBNAIL_SIZE)
+    quantizers = list(quantizers or QUANTIZERS)
+    if reference is not None and reference in quantizers:
+        quantizers.remove(reference)
+        quantizers.insert(0, reference)
+
+    results = []
+    reference_centers = None
+    for name in quantizers:
+        try:
+            # Warm up on a small sample so lazy imports aren't timed
+            _cluster_pixels(pixels[:: max(1, len(pixels) // 1000)], n_colors, name)
+        except ImportError:
+            continue
+        wall, cpu = time.perf_counter(), time.process_time()
+        colors, _, _ = _cluster_pixels(pixels, n_colors, name)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        centers = [c.rgb for c in colors]
+        if reference_centers is None:
+            reference_centers = centers
+        results.append((name, wall, cpu, palette_distance(reference_centers, centers)))
+    return results
+
+
+class ColorCache:
+    """Persistent SQLite store of image analyses.
+
+    Entries are keyed by the SHA-256 of the image bytes plus the extraction
+    settings (see extraction_params()), so editing palette rules or the Zed
+    mapping never invalidates them while changing any extraction setting does.
+    The total stored size is capped at max_bytes; least recently used entries
+    are evicted first. Safe to share between processes.
+    """
+
+    FILENAME = "colors.sqlite"
+
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024):
+        import os
+        import sqlite3
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, self.FILENAME)
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def key(image_bytes, n_colors=20, quantizer=DEFAULT_QUANTIZER):
+        import hashlib
+
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return ColorCache._key(digest, n_colors, quantizer)
+
+    @staticmethod
+    def file_key(path, n_colors=20, quantizer=DEFAULT_QUANTIZER):
+        """key() of an image file's bytes, hashed in chunks rather than read whole"""
+        import hashlib
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        return ColorCache._key(sha.hexdigest(), n_colors, quantizer)
+
+    @staticmethod
+    def _key(digest, n_colors, quantizer):
+        import hashlib
+
+        params = json.dumps(extraction_params(n_colors, quantizer), sort_keys=True)
+        return f"{digest}:{hashlib.sha256(params.encode()).hexdigest()[:16]}"
+
+    def get(self, key):
+        """Return the cached ImageAnalysis for key, or None"""
+        import time
+
+        row = self._db.execute(
+            "SELECT value FROM analyses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute(
+            "UPDATE analyses SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        data = json.loads(row[0])
+        return ImageAnalysis(
+            colors=create_colors(data["centers"]),
+            avg_color=create_color(*data["avg"]),
+            image_size=tuple(data["image_size"]),
+            sample_count=data["sample_count"],
+            filtered_count=data["filtered_count"],
+            histogram_size=data["histogram_size"],
+            decoded_size=tuple(data.get("decoded_size", data["image_size"])),
+        )
+
+    def put(self, key, analysis):
+        """Store an ImageAnalysis and evict old entries beyond max_bytes"""
+        import time
+
+        value = json.dumps(
+            {
+                "centers": [c.rgb for c in analysis.colors],
+                "avg": analysis.avg_color.rgb,
+                "image_size": analysis.image_size,
+                "sample_count": analysis.sample_count,
+                "filtered_count": analysis.filtered_count,
+                "histogram_size": analysis.histogram_size,
+                "decoded_size": analysis.decoded_size,
+            }
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time()),
+        )
+        self._evict()
+
+    def _evict(self):
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM analyses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM analyses ORDER BY last_used DESC"
+        ).fetchall()
+        kept = 0
+        stale = []
+        for key, size in rows:
+            kept += size
+            if kept > self.max_bytes:
+                stale.append((key,))
+        self._db.executemany("DELETE FROM analyses WHERE key = ?", stale)
+
+    def clear(self):
+        self._db.execute("DELETE FROM analyses")
+
+    def close(self):
+        self._db.close()
+
+
+# === PALETTE PROFILES ===
+# PaletteProfile (defined with the constants at the top) as stored in files
+
+
+def palette_profile_from_dict(data, base=DEFAULT_PROFILE):
+    """PaletteProfile from a dict of field values, other fields taken from base.
+
+    Raises ValueError for unknown fields and values of the wrong type.
+    """
+    unknown = sorted(set(data) - set(PaletteProfile._fields))
+    if unknown:
+        raise ValueError(f"Unknown palette profile fields: {', '.join(unknown)}")
+
+    def is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    values = {}
+    for field, value in data.items():
+        if isinstance(getattr(base, field), tuple):
+            if not (
+                isinstance(value, (list, tuple))
+                and len(value) == 3
+                and all(is_number(v) for v in value)
+            ):
+                raise ValueError(
+                    f"{field} must be [hue, saturation, lightness], got {value!r}"
+                )
+            value = tuple(value)
+        elif not is_number(value):
+            raise ValueError(f"{field} must be a number, got {value!r}")
+        values[field] = value
+    return base._replace(**values)
+
+
+def palette_profile_data(profile):
+    """PaletteProfile as the JSON-ready dict load_palette_profile() reads"""
+    return {
+        field: list(value) if isinstance(value, tuple) else value
+        for field, value in profile._asdict().items()
+    }
+
+
+def load_palette_profile(path):
+    """Read a PaletteProfile from a TOML (.toml) or JSON file.
+
+    The file sets any of the PaletteProfile fields at its top level; the rest
+    keep their DEFAULT_PROFILE values:
+
+        text_contrast = 7.0
+        max_accent_saturation = 60
+        error_hsl = [350, 70, 55]
+
+    TOML needs Python 3.11 or the tomli package on older versions.
+    """
+    if str(path).endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError as e:
+                raise ImportError(
+                    "TOML palette profiles need Python 3.11 or tomli: "
+                    "pip install 'color-palette-generator[toml]'"
+                ) from e
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        with open(path) as f:
+            data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("Expected a table of palette profile fields")
+    return palette_profile_from_dict(data)
+
+
+@functools.lru_cache(maxsize=32)
+def _color_arrays(colors):
+    """(hues, saturations, luminances) arrays of a tuple of extracted colors.
+
+    Cached, so the dark and light palettes and every theme variant of an image
+    share one pass; the arrays are read-only.
+    """
+    import numpy as np
+
+    rgb = np.array([c.rgb for c in colors])
+    hues, sats, _ = rgb_to_hsl_array(rgb).T
+    lums = relative_luminance_array(rgb)
+    for array in (hues, sats, lums):
+        array.flags.writeable = False
+    return hues, sats, lums
+
+
+def generate_functional_palette(
+    image, force_theme=None, analysis=None, contrast_method="solve", profile=None
+):
+    """Generate a functional color palette with strict readability
+
+    Args:
+        image: Source image, any input analyze_image() takes (unused when
+               analysis is given)
+        force_theme: "dark", "light", or None (auto-detect from image)
+        analysis: Optional ImageAnalysis from analyze_image(), so several
+                  palettes can share one decode and clustering pass
+        contrast_method: "solve" or "step", see CONTRAST_METHODS
+        profile: PaletteProfile of contrast and saturation targets (default:
+                 DEFAULT_PROFILE)
+    """
+    import numpy as np
+
+    if analysis is None:
+        analysis = analyze_image(image, n_colors=20)
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    colors = analysis.colors
+    avg_color = analysis.avg_color
+
+    # Candidate selection below works on arrays of the extracted colors
+    hues, sats, lums = _color_arrays(tuple(colors))
+    darkest = colors[lums.argmin()]
+    lightest = colors[len(lums) - 1 - lums[::-1].argmax()]  # Last of equals, as sorted()
+    most_saturated = colors[sats.argmax()]
+
+    palette = {}
+
+    # Determine if this should be a dark or light theme
+    if force_theme is not None:
+        is_dark_theme = force_theme == "dark"
+    else:
+        is_dark_theme = avg_color.luminance < 0.5
+
+    # === BACKGROUND ===
+    # Target lightness ranges for themes (by default 8-18% dark, 85-95% light)
+    if is_dark_theme:
+        # Dark theme: pick a color with good saturation, then force it dark
+        # Prefer colors with moderate saturation for character
+        bg_base = _select_color(colors, True, np.abs(sats - 25))
+        h, s, l = bg_base.hsl
+        # Clamp lightness to dark range
+        low, high = profile.dark_bg_min_lightness, profile.dark_bg_max_lightness
+        target_l = min(max(l, low), high)
+        # If the source color was bright, bring it down to dark range
+        if l > high:
+            target_l = high - 3  # Aim for ~15% lightness
+        bg = create_color(*hsl_to_rgb(h, min(s, profile.max_bg_saturation), target_l))
+    else:
+        # Light theme: pick a color with subtle saturation, then force it light
+        bg_base = _select_color(colors, True, np.abs(sats - 15))
+        h, s, l = bg_base.hsl
+        # Clamp lightness to light range
+        low, high = profile.light_bg_min_lightness, profile.light_bg_max_lightness
+        target_l = min(max(l, low), high)
+        # If the source color was dark, bring it up to light range
+        if l < low:
+            target_l = low + 5  # Aim for ~90% lightness
+        bg = create_color(
+            *hsl_to_rgb(h, min(s, profile.max_bg_saturation / 2), target_l)
+        )  # Lower saturation for light themes
+
+    # Clamp background saturation to avoid gaudy
+    bg = clamp_saturation(bg, profile.max_bg_saturation)
+    palette["background"] = bg
+
+    # === BACKGROUND MEDIUM ===
+    if is_dark_theme:
+        bg_medium = adjust_color(bg, lightness_delta=4)
+    else:
+        bg_medium = adjust_color(bg, lightness_delta=-3)
+    bg_medium = clamp_saturation(bg_medium, profile.max_bg_saturation)
+    palette["background_medium"] = bg_medium
+
+    # === BACKGROUND LIGHT ===
+    if is_dark_theme:
+        bg_light = adjust_color(bg, lightness_delta=8)
+    else:
+        bg_light = adjust_color(bg, lightness_delta=-6)
+    bg_light = clamp_saturation(bg_light, profile.max_bg_saturation)
+    palette["background_light"] = bg_light
+
+    # === BACKGROUND DISABLED ===
+    # Desaturated, slightly different from bg for disabled surfaces
+    if is_dark_theme:
+        bg_disabled = adjust_color(bg, lightness_delta=-2, saturation_delta=-10)
+    else:
+        bg_disabled = adjust_color(bg, lightness_delta=2, saturation_delta=-10)
+    bg_disabled = clamp_saturation(bg_disabled, profile.max_bg_saturation)
+    palette["background_disabled"] = bg_disabled
+
+    # === ELEMENT BACKGROUNDS ===
+    # For interactive elements (buttons, inputs, checkboxes, etc.)
+    if is_dark_theme:
+        # element.background - sits between bg and bg_medium
+        element_bg = adjust_color(bg, lightness_delta=2)
+        # element.hover - lighter than element
+        element_hover = adjust_color(bg, lightness_delta=5)
+        # element.active - lighter than hover (pressed state)
+        element_active = adjust_color(bg, lightness_delta=8)
+        # element.selected - same as active
+        element_selected = element_active
+        # element.disabled - darker and desaturated
+        element_disabled = adjust_color(bg, lightness_delta=-1, saturation_delta=-10)
+    else:
+        element_bg = adjust_color(bg, lightness_delta=-2)
+        element_hover = adjust_color(bg, lightness_delta=-4)
+        element_active = adjust_color(bg, lightness_delta=-6)
+        element_selected = element_active
+        element_disabled = adjust_color(bg, lightness_delta=2, saturation_delta=-10)
+
+    palette["element"] = clamp_saturation(element_bg, profile.max_bg_saturation)
+    palette["element_hover"] = clamp_saturation(
+        element_hover, profile.max_bg_saturation
+    )
+    palette["element_active"] = clamp_saturation(
+        element_active, profile.max_bg_saturation
+    )
+    palette["element_selected"] = clamp_saturation(
+        element_selected, profile.max_bg_saturation
+    )
+    palette["element_disabled"] = clamp_saturation(
+        element_disabled, profile.max_bg_saturation
+    )
+
+    # === POST-PROCESS: Ensure backgrounds allow for readable text ===
+    # For dark themes, if bg_light is too bright, we can't get enough contrast even with white text
+    # Calculate max possible contrast (white text on bg_light)
+    if is_dark_theme:
+        white_lum = 1.0
+        max_possible_contrast = contrast_ratio(white_lum, bg_light.luminance)
+
+        # If we can't even get the text contrast with white, darken the backgrounds
+        if max_possible_contrast < profile.text_contrast + 0.5:  # Add buffer
+            # Calculate required bg_light luminance for 5.5:1 with white
+            # contrast = (1 + 0.05) / (bg_lum + 0.05) >= 5.5
+            # bg_lum <= (1.05 / 5.5) - 0.05 = 0.14
+            target_lum = 0.12
+
+            # Darken bg_light until we hit target luminance
+            while bg_light.luminance > target_lum and bg_light.hsl[2] > 5:
+                bg_light = adjust_color(bg_light, lightness_delta=-3)
+
+            # Also darken main bg proportionally
+            lum_diff = palette["background_light"].luminance - bg_light.luminance
+            if lum_diff > 0:
+                bg = adjust_color(bg, lightness_delta=-int(lum_diff * 80))
+                bg = clamp_saturation(bg, profile.max_bg_saturation)
+                palette["background"] = bg
+
+            palette["background_light"] = bg_light
+
+    # === FOREGROUND ===
+    # Must have good contrast with BOTH bg and bg_light
+    if is_dark_theme:
+        # Start with lightest color from palette
+        fg_base = _select_color(colors, lums > 0.5, lums, largest=True)
+        if fg_base is None:
+            fg_base = lightest
+        fg_base = adjust_color(fg_base, lightness_delta=10, saturation_delta=-20)
+    else:
+        # Light theme: dark foreground
+        fg_base = _select_color(colors, lums < 0.3, lums)
+        if fg_base is None:
+            fg_base = darkest
+        fg_base = adjust_color(fg_base, lightness_delta=-10, saturation_delta=-20)
+
+    # Clamp saturation and ensure contrast
+    fg_base = clamp_saturation(fg_base, profile.max_fg_saturation)
+    fg = ensure_contrast(
+        fg_base,
+        bg,
+        bg_light,
+        profile.text_contrast,
+        is_dark_theme,
+        method=contrast_method,
+    )
+    palette["foreground"] = fg
+
+    # Push foreground a bit lighter for dark themes
+    if is_dark_theme:
+        fg = adjust_color(fg, lightness_delta=5)
+    palette["foreground"] = fg
+
+    # === FOREGROUND BRIGHT ===
+    # Brighter than foreground for emphasis, headings, etc.
+    if is_dark_theme:
+        fg_bright_base = adjust_color(fg, lightness_delta=10)
+    else:
+        fg_bright_base = adjust_color(fg, lightness_delta=-10)
+    fg_bright = clamp_saturation(fg_bright_base, profile.max_fg_saturation)
+    palette["foreground_bright"] = fg_bright
+
+    # === FOREGROUND MEDIUM ===
+    # Intermediate between foreground and foreground_dim
+    if is_dark_theme:
+        fg_medium_base = adjust_color(fg, lightness_delta=-3)
+    else:
+        fg_medium_base = adjust_color(fg, lightness_delta=4)
+    fg_medium = ensure_contrast(
+        fg_medium_base,
+        bg,
+        bg_light,
+        profile.text_contrast,
+        is_dark_theme,
+        method=contrast_method,
+    )
+    palette["foreground_medium"] = fg_medium
+
+    # === FOREGROUND DIM ===
+    # Start closer to fg, then ensure contrast - don't go too far from readable
+    if is_dark_theme:
+        fg_dim_base = adjust_color(fg, lightness_delta=-8)
+    else:
+        fg_dim_base = adjust_color(fg, lightness_delta=10)
+    fg_dim = ensure_contrast(
+        fg_dim_base,
+        bg,
+        bg_light,
+        profile.dim_contrast,
+        is_dark_theme,
+        method=contrast_method,
+    )
+    palette["foreground_dim"] = fg_dim
+
+    # === PRIMARY ACCENT ===
+    vibrant = (sats > 35) & (lums > 0.1) & (lums < 0.75)
+    primary = _select_color(colors, vibrant, sats, largest=True)
+    if primary is None:
+        primary = most_saturated
+    primary = clamp_saturation(primary, profile.max_accent_saturation)
+    palette["primary"] = primary
+
+    # === SECONDARY ACCENT ===
+    primary_hue = primary.hsl[0]
+    secondary_mask = (
+        (sats > 25) & (np.abs(hues - primary_hue) > 40) & (lums > 0.1) & (lums < 0.75)
+    )
+    secondary = _select_color(colors, secondary_mask, sats, largest=True)
+    if secondary is None:
         comp_hue = (primary_hue + 150) % 360
         r, g, b = hsl_to_rgb(comp_hue, min(primary.hsl[1], 60), 50)
         secondary = create_color(r, g, b)
-    secondary = clamp_saturation(secondary, MAX_ACCENT_SATURATION)
+    secondary = clamp_saturation(secondary, profile.max_accent_saturation)
     palette["secondary"] = secondary
 
     # === PRIMARY VARIANT ===
@@ -577,7 +2163,7 @@ def generate_functional_palette(image_path, force_theme=None):
         primary_variant = adjust_color(
             primary, lightness_delta=-15, saturation_delta=-5
         )
-    primary_variant = clamp_saturation(primary_variant, MAX_ACCENT_SATURATION)
+    primary_variant = clamp_saturation(primary_variant, profile.max_accent_saturation)
     palette["primary_variant"] = primary_variant
 
     # === SECONDARY VARIANT ===
@@ -590,24 +2176,29 @@ def generate_functional_palette(image_path, force_theme=None):
         secondary_variant = adjust_color(
             secondary, lightness_delta=-15, saturation_delta=-5
         )
-    secondary_variant = clamp_saturation(secondary_variant, MAX_ACCENT_SATURATION)
+    secondary_variant = clamp_saturation(
+        secondary_variant, profile.max_accent_saturation
+    )
     palette["secondary_variant"] = secondary_variant
 
     # === TERTIARY ===
     # High-contrast highlight color for syntax, links, accents
     tertiary_hue = (primary_hue + 80) % 360
-    tertiary_candidates = [
-        c for c in colors if abs(c.hsl[0] - tertiary_hue) < 50 and c.hsl[1] > 20
-    ]
-    if tertiary_candidates:
-        tertiary_base = tertiary_candidates[0]
-    else:
+    tertiary_base = _select_color(
+        colors, (np.abs(hues - tertiary_hue) < 50) & (sats > 20)
+    )
+    if tertiary_base is None:
         r, g, b = hsl_to_rgb(tertiary_hue, 50, 55)
         tertiary_base = create_color(r, g, b)
-    tertiary_base = clamp_saturation(tertiary_base, MAX_ACCENT_SATURATION)
+    tertiary_base = clamp_saturation(tertiary_base, profile.max_accent_saturation)
     # Enforce contrast for readability as highlight/accent text
     tertiary = ensure_terminal_contrast(
-        tertiary_base, bg, bg_light, MIN_SEMANTIC_CONTRAST, is_dark_theme
+        tertiary_base,
+        bg,
+        bg_light,
+        profile.semantic_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
     palette["tertiary"] = tertiary
 
@@ -623,8 +2214,6 @@ def generate_functional_palette(image_path, force_theme=None):
 
     # === BORDER COLORS ===
     # Borders should be subtle - close to background but with a hint of accent if compatible
-    BORDER_BLEND_COMPATIBLE = 0.50  # Blend toward accent if compatible
-    BORDER_BLEND_INCOMPATIBLE = 0.05  # Very subtle blend even if incompatible
 
     if is_dark_theme:
         # Dark mode: borders slightly lighter than background_light
@@ -633,11 +2222,12 @@ def generate_functional_palette(image_path, force_theme=None):
         # Light mode: borders slightly darker than background
         border_base = adjust_color(bg, lightness_delta=-5)
 
-    # Check if primary accent is compatible for blending
+    # Check if primary accent is compatible for blending: blend toward it if so,
+    # very subtly even if not
     if is_accent_compatible(bg, primary):
-        blend_factor = BORDER_BLEND_COMPATIBLE
+        blend_factor = profile.border_blend_compatible
     else:
-        blend_factor = BORDER_BLEND_INCOMPATIBLE
+        blend_factor = profile.border_blend_incompatible
 
     border = blend_colors(border_base, primary, blend_factor)
     border_variant = blend_colors(
@@ -651,9 +2241,9 @@ def generate_functional_palette(image_path, force_theme=None):
 
     # Focused/selected borders can be more prominent - use secondary with some blending
     if is_accent_compatible(bg, secondary):
-        focus_blend = BORDER_BLEND_COMPATIBLE
+        focus_blend = profile.border_blend_compatible
     else:
-        focus_blend = BORDER_BLEND_INCOMPATIBLE
+        focus_blend = profile.border_blend_incompatible
 
     border_focused = blend_colors(border_base, secondary, focus_blend * 1.2)
     border_selected = blend_colors(border_base, secondary_variant, focus_blend)
@@ -668,27 +2258,47 @@ def generate_functional_palette(image_path, force_theme=None):
 
     # === SEMANTIC COLORS (with enforced contrast) ===
     # Error - red
-    error_base = create_color(*hsl_to_rgb(0, 65, 55))
+    error_base = create_color(*hsl_to_rgb(*profile.error_hsl))
     palette["error"] = ensure_terminal_contrast(
-        error_base, bg, bg_light, MIN_SEMANTIC_CONTRAST, is_dark_theme
+        error_base,
+        bg,
+        bg_light,
+        profile.semantic_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
 
     # Warning - yellow/orange
-    warning_base = create_color(*hsl_to_rgb(38, 70, 55))
+    warning_base = create_color(*hsl_to_rgb(*profile.warning_hsl))
     palette["warning"] = ensure_terminal_contrast(
-        warning_base, bg, bg_light, MIN_SEMANTIC_CONTRAST, is_dark_theme
+        warning_base,
+        bg,
+        bg_light,
+        profile.semantic_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
 
     # Success - green
-    success_base = create_color(*hsl_to_rgb(120, 50, 45))
+    success_base = create_color(*hsl_to_rgb(*profile.success_hsl))
     palette["success"] = ensure_terminal_contrast(
-        success_base, bg, bg_light, MIN_SEMANTIC_CONTRAST, is_dark_theme
+        success_base,
+        bg,
+        bg_light,
+        profile.semantic_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
 
     # Info - cyan/blue
-    info_base = create_color(*hsl_to_rgb(200, 60, 50))
+    info_base = create_color(*hsl_to_rgb(*profile.info_hsl))
     palette["info"] = ensure_terminal_contrast(
-        info_base, bg, bg_light, MIN_SEMANTIC_CONTRAST, is_dark_theme
+        info_base,
+        bg,
+        bg_light,
+        profile.semantic_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
 
     # === TERMINAL COLORS (24 total: base, bright, dim) ===
@@ -714,7 +2324,12 @@ def generate_functional_palette(image_path, force_theme=None):
         palette["black_dim"] = create_color(*hsl_to_rgb(0, 0, min(35, black_lightness + 12)))
         # For light themes, ensure black variants meet contrast
         palette["black_bright"] = ensure_terminal_contrast(
-            palette["black_bright"], bg, bg_light, MIN_TERMINAL_CONTRAST, is_dark_theme
+            palette["black_bright"],
+            bg,
+            bg_light,
+            profile.terminal_contrast,
+            is_dark_theme,
+            method=contrast_method,
         )
 
     # Red - base=error, bright=lighter, dim=darker
@@ -723,8 +2338,9 @@ def generate_functional_palette(image_path, force_theme=None):
         adjust_color(palette["error"], lightness_delta=12),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
     palette["red_dim"] = ensure_terminal_contrast(
         adjust_color(
@@ -734,8 +2350,9 @@ def generate_functional_palette(image_path, force_theme=None):
         ),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
 
     # Green - base=success, bright=lighter, dim=darker
@@ -744,8 +2361,9 @@ def generate_functional_palette(image_path, force_theme=None):
         adjust_color(palette["success"], lightness_delta=15),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
     palette["green_dim"] = ensure_terminal_contrast(
         adjust_color(
@@ -755,8 +2373,9 @@ def generate_functional_palette(image_path, force_theme=None):
         ),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
 
     # Yellow - base=warning, bright=lighter, dim=darker
@@ -765,8 +2384,9 @@ def generate_functional_palette(image_path, force_theme=None):
         adjust_color(palette["warning"], lightness_delta=12),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
     palette["yellow_dim"] = ensure_terminal_contrast(
         adjust_color(
@@ -776,25 +2396,32 @@ def generate_functional_palette(image_path, force_theme=None):
         ),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
 
     # Blue
-    blue_candidates = [c for c in colors if 190 < c.hsl[0] < 260 and c.hsl[1] > 25]
-    if blue_candidates:
-        blue_base = sorted(blue_candidates, key=lambda c: c.luminance, reverse=True)[0]
-    else:
+    blue_base = _select_color(
+        colors, (hues > 190) & (hues < 260) & (sats > 25), lums, largest=True
+    )
+    if blue_base is None:
         blue_base = palette["info"]
     palette["blue"] = ensure_terminal_contrast(
-        blue_base, bg, bg_light, MIN_TERMINAL_CONTRAST, is_dark_theme
+        blue_base,
+        bg,
+        bg_light,
+        profile.terminal_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
     palette["blue_bright"] = ensure_terminal_contrast(
         adjust_color(palette["blue"], lightness_delta=15),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
     palette["blue_dim"] = ensure_terminal_contrast(
         adjust_color(
@@ -804,29 +2431,32 @@ def generate_functional_palette(image_path, force_theme=None):
         ),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
 
     # Magenta
-    magenta_candidates = [
-        c for c in colors if (c.hsl[0] > 280 or c.hsl[0] < 20) and c.hsl[1] > 30
-    ]
-    if magenta_candidates:
-        magenta_base = sorted(magenta_candidates, key=lambda c: c.hsl[1], reverse=True)[
-            0
-        ]
-    else:
+    magenta_base = _select_color(
+        colors, ((hues > 280) | (hues < 20)) & (sats > 30), sats, largest=True
+    )
+    if magenta_base is None:
         magenta_base = create_color(*hsl_to_rgb(300, 50, 55))
     palette["magenta"] = ensure_terminal_contrast(
-        magenta_base, bg, bg_light, MIN_TERMINAL_CONTRAST, is_dark_theme
+        magenta_base,
+        bg,
+        bg_light,
+        profile.terminal_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
     palette["magenta_bright"] = ensure_terminal_contrast(
         adjust_color(palette["magenta"], lightness_delta=15),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
     palette["magenta_dim"] = ensure_terminal_contrast(
         adjust_color(
@@ -836,25 +2466,30 @@ def generate_functional_palette(image_path, force_theme=None):
         ),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
 
     # Cyan
-    cyan_candidates = [c for c in colors if 160 < c.hsl[0] < 200 and c.hsl[1] > 25]
-    if cyan_candidates:
-        cyan_base = cyan_candidates[0]
-    else:
+    cyan_base = _select_color(colors, (hues > 160) & (hues < 200) & (sats > 25))
+    if cyan_base is None:
         cyan_base = create_color(*hsl_to_rgb(180, 50, 50))
     palette["cyan"] = ensure_terminal_contrast(
-        cyan_base, bg, bg_light, MIN_TERMINAL_CONTRAST, is_dark_theme
+        cyan_base,
+        bg,
+        bg_light,
+        profile.terminal_contrast,
+        is_dark_theme,
+        method=contrast_method,
     )
     palette["cyan_bright"] = ensure_terminal_contrast(
         adjust_color(palette["cyan"], lightness_delta=15),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
     palette["cyan_dim"] = ensure_terminal_contrast(
         adjust_color(
@@ -864,8 +2499,9 @@ def generate_functional_palette(image_path, force_theme=None):
         ),
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
 
     # White - always true grayscale light colors
@@ -888,15 +2524,22 @@ def generate_functional_palette(image_path, force_theme=None):
         palette["white_dim"],
         bg,
         bg_light,
-        MIN_TERMINAL_CONTRAST,
+        profile.terminal_contrast,
         is_dark_theme,
+        method=contrast_method,
     )
 
     return palette, colors, avg_color, is_dark_theme
 
 
-def generate_readability_report(palette, is_dark_theme):
-    """Generate a detailed readability report for inspection"""
+def generate_readability_report(palette, is_dark_theme, profile=None):
+    """Generate a detailed readability report for inspection.
+
+    Colors are checked against the contrast targets of profile, the
+    PaletteProfile the palette was built with (default: DEFAULT_PROFILE).
+    """
+    if profile is None:
+        profile = DEFAULT_PROFILE
     bg = palette["background"]
     bg_light = palette["background_light"]
 
@@ -919,20 +2562,28 @@ def generate_readability_report(palette, is_dark_theme):
 
     # Check categories
     categories = [
-        ("FOREGROUND (bright)", ["foreground_bright"], MIN_TEXT_CONTRAST),
-        ("FOREGROUND (main)", ["foreground", "foreground_medium"], MIN_TEXT_CONTRAST),
-        ("FOREGROUND (dim)", ["foreground_dim"], MIN_DIM_CONTRAST),
+        ("FOREGROUND (bright)", ["foreground_bright"], profile.text_contrast),
+        (
+            "FOREGROUND (main)",
+            ["foreground", "foreground_medium"],
+            profile.text_contrast,
+        ),
+        ("FOREGROUND (dim)", ["foreground_dim"], profile.dim_contrast),
         (
             "ACCENTS",
             ["primary", "primary_variant", "secondary", "secondary_variant"],
-            MIN_TERMINAL_CONTRAST,
+            profile.terminal_contrast,
+        ),
+        ("HIGHLIGHT", ["tertiary"], profile.semantic_contrast),
+        (
+            "SEMANTIC",
+            ["error", "warning", "success", "info"],
+            profile.semantic_contrast,
         ),
-        ("HIGHLIGHT", ["tertiary"], MIN_SEMANTIC_CONTRAST),
-        ("SEMANTIC", ["error", "warning", "success", "info"], MIN_SEMANTIC_CONTRAST),
         (
             "TERMINAL BASE",
             ["red", "green", "yellow", "blue", "magenta", "cyan", "white"],
-            MIN_TERMINAL_CONTRAST,
+            profile.terminal_contrast,
         ),
         (
             "TERMINAL BRIGHT",
@@ -945,7 +2596,7 @@ def generate_readability_report(palette, is_dark_theme):
                 "cyan_bright",
                 "white_bright",
             ],
-            MIN_TERMINAL_CONTRAST,
+            profile.terminal_contrast,
         ),
         (
             "TERMINAL DIM",
@@ -958,12 +2609,20 @@ def generate_readability_report(palette, is_dark_theme):
                 "cyan_dim",
                 "white_dim",
             ],
-            MIN_TERMINAL_CONTRAST,
+            profile.terminal_contrast,
         ),
     ]
 
     issues = []
 
+    # Contrast of every checked color against both backgrounds in one pass
+    checked = [key for _, keys, _ in categories for key in keys if key in palette]
+    contrasts = contrast_ratio_matrix(
+        [palette[key].luminance for key in checked],
+        [bg.luminance, bg_light.luminance],
+    )
+    contrast_by_key = dict(zip(checked, contrasts.tolist()))
+
     for cat_name, keys, min_contrast in categories:
         report.append(f"\n{cat_name} (min: {min_contrast}:1)")
         report.append("-" * 50)
@@ -971,8 +2630,7 @@ def generate_readability_report(palette, is_dark_theme):
             if key not in palette:
                 continue
             c = palette[key]
-            cr_bg = contrast_ratio(c.luminance, bg.luminance)
-            cr_bg_light = contrast_ratio(c.luminance, bg_light.luminance)
+            cr_bg, cr_bg_light = contrast_by_key[key]
             min_cr = min(cr_bg, cr_bg_light)
 
             status = "✓" if min_cr >= min_contrast else "✗ FAIL"
@@ -1051,8 +2709,8 @@ def print_palette(palette, is_dark_theme):
                 print(f"  {key:18} {c.hex}  (contrast: {contrast:.1f}:1)")
 
 
-def export_json(palette, filepath, blur_opacity=None):
-    """Export palette as JSON with all 24 terminal colors and blur opacity"""
+def palette_data(palette, blur_opacity=None):
+    """Palette as the JSON-ready dict written by export_json()"""
     data = {k: v.hex for k, v in palette.items()}
     if blur_opacity is not None:
         data["_blur_opacity"] = {
@@ -1066,13 +2724,58 @@ def export_json(palette, filepath, blur_opacity=None):
     data["_note"] = (
         "24 terminal colors: black/red/green/yellow/blue/magenta/cyan/white with _bright and _dim variants"
     )
-    with open(filepath, "w") as f:
-        json.dump(data, f, indent=2)
+    return data
 
 
-def create_html_preview(palette, extracted_colors, output_path, is_dark_theme):
-    """Create an HTML preview of the palette"""
-    html = """<!DOCTYPE html>
+def write_if_changed(path, content):
+    """Write content (str or bytes) to path unless the file already holds it.
+
+    Changed files are replaced atomically: the content goes to a temporary file
+    in the same directory that is then renamed over path, keeping the old
+    file's permissions, so readers never see a partly written file. Returns
+    True if the file was written.
+    """
+    import os
+
+    data = content.encode() if isinstance(content, str) else content
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+    if st is not None and st.st_size == len(data):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+
+    tmp = os.path.join(
+        os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp"
+    )
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        if st is not None:
+            os.chmod(tmp, st.st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+    return True
+
+
+def export_json(palette, filepath, blur_opacity=None):
+    """Export palette as JSON with all 24 terminal colors and blur opacity.
+
+    Returns False if filepath already held this export and was left untouched.
+    """
+    return write_if_changed(
+        filepath, json.dumps(palette_data(palette, blur_opacity), indent=2)
+    )
+
+
+# Preview page. {name} marks a placeholder, filled in by _preview_parts(); the
+# CSS rule braces never enclose a bare word, so they don't match.
+PREVIEW_TEMPLATE = """<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -1266,21 +2969,32 @@ def create_html_preview(palette, extracted_colors, output_path, is_dark_theme):
 </body>
 </html>"""
 
-    def make_card(name, color):
-        text_color = "#ffffff" if color.luminance < 0.5 else "#000000"
-        return f"""<div class="color-card">
-            <div class="color-swatch" style="background: {color.hex}; color: {text_color}">Aa</div>
-            <div class="color-info">
-                <div class="color-name">{name}</div>
-                <div class="color-hex">{color.hex}</div>
-            </div>
-        </div>"""
-
-    def make_terminal_color(name, color):
-        text_color = "#ffffff" if color.luminance < 0.5 else "#000000"
-        return f'<div class="terminal-color" style="background: {color.hex}; color: {text_color}">{name}</div>'
-
-    bg_fg_names = [
+# Placeholders filled with the hex value of a palette role
+_PREVIEW_COLORS = {
+    "bg": "background",
+    "bg_light": "background_light",
+    "fg": "foreground",
+    "fg_bright": "foreground_bright",
+    "fg_medium": "foreground_medium",
+    "fg_dim": "foreground_dim",
+    "primary": "primary",
+    "secondary": "secondary",
+    "muted": "muted",
+    "error": "error",
+    "warning": "warning",
+    "success": "success",
+    "info": "info",
+    "red": "red",
+    "green": "green",
+    "yellow": "yellow",
+    "blue": "blue",
+    "magenta": "magenta",
+    "cyan": "cyan",
+}
+
+# Placeholders filled with one color card per role
+_PREVIEW_SECTIONS = {
+    "bg_fg_cards": (
         "background",
         "background_medium",
         "background_light",
@@ -1289,22 +3003,22 @@ def create_html_preview(palette, extracted_colors, output_path, is_dark_theme):
         "foreground",
         "foreground_medium",
         "foreground_dim",
-    ]
-    element_names = [
+    ),
+    "element_cards": (
         "element",
         "element_hover",
         "element_active",
         "element_selected",
         "element_disabled",
-    ]
-    border_names = [
+    ),
+    "border_cards": (
         "border",
         "border_variant",
         "border_focused",
         "border_selected",
         "border_disabled",
-    ]
-    accent_names = [
+    ),
+    "accent_cards": (
         "primary",
         "primary_variant",
         "secondary",
@@ -1312,77 +3026,374 @@ def create_html_preview(palette, extracted_colors, output_path, is_dark_theme):
         "tertiary",
         "muted",
         "selection",
-    ]
-    semantic_names = ["error", "warning", "success", "info"]
-    terminal_color_names = [
-        "black",
-        "red",
-        "green",
-        "yellow",
-        "blue",
-        "magenta",
-        "cyan",
-        "white",
-    ]
+    ),
+    "semantic_cards": ("error", "warning", "success", "info"),
+}
+
+TERMINAL_COLOR_NAMES = (
+    "black",
+    "red",
+    "green",
+    "yellow",
+    "blue",
+    "magenta",
+    "cyan",
+    "white",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _preview_template():
+    """PREVIEW_TEMPLATE split once into (text, placeholder, text, ..., text).
+
+    Raises ValueError if its placeholders aren't exactly the ones
+    _preview_parts() fills.
+    """
+    import re
+
+    parts = tuple(re.split(r"\{(\w+)\}", PREVIEW_TEMPLATE))
+    found = set(parts[1::2])
+    expected = {*_PREVIEW_COLORS, *_PREVIEW_SECTIONS, "theme_type", "terminal_colors"}
+    if found != expected:
+        raise ValueError(
+            f"Preview template placeholders {sorted(found - expected)} are "
+            f"unknown and {sorted(expected - found)} are missing"
+        )
+    return parts
 
-    replacements = {
-        "{bg}": palette["background"].hex,
-        "{bg_light}": palette["background_light"].hex,
-        "{fg}": palette["foreground"].hex,
-        "{fg_bright}": palette["foreground_bright"].hex,
-        "{fg_medium}": palette["foreground_medium"].hex,
-        "{fg_dim}": palette["foreground_dim"].hex,
-        "{primary}": palette["primary"].hex,
-        "{secondary}": palette["secondary"].hex,
-        "{muted}": palette["muted"].hex,
-        "{error}": palette["error"].hex,
-        "{warning}": palette["warning"].hex,
-        "{success}": palette["success"].hex,
-        "{info}": palette["info"].hex,
-        "{theme_type}": "Dark" if is_dark_theme else "Light",
-    }
 
-    # Add terminal colors
-    for name in terminal_color_names:
-        if name in palette:
-            replacements[f"{{{name}}}"] = palette[name].hex
+def _preview_card(name, color):
+    text_color = "#ffffff" if color.luminance < 0.5 else "#000000"
+    return f"""<div class="color-card">
+            <div class="color-swatch" style="background: {color.hex}; color: {text_color}">Aa</div>
+            <div class="color-info">
+                <div class="color-name">{name}</div>
+                <div class="color-hex">{color.hex}</div>
+            </div>
+        </div>"""
 
-    for old, new in replacements.items():
-        html = html.replace(old, new)
 
-    html = html.replace(
-        "{bg_fg_cards}", "\n".join(make_card(n, palette[n]) for n in bg_fg_names)
-    )
-    html = html.replace(
-        "{element_cards}", "\n".join(make_card(n, palette[n]) for n in element_names)
-    )
-    html = html.replace(
-        "{border_cards}", "\n".join(make_card(n, palette[n]) for n in border_names)
-    )
-    html = html.replace(
-        "{accent_cards}", "\n".join(make_card(n, palette[n]) for n in accent_names)
+def _preview_terminal_color(name, color):
+    text_color = "#ffffff" if color.luminance < 0.5 else "#000000"
+    return f'<div class="terminal-color" style="background: {color.hex}; color: {text_color}">{name}</div>'
+
+
+def _preview_parts(palette, is_dark_theme):
+    """The preview page of a palette as a list of strings to concatenate"""
+    values = {
+        placeholder: palette[role].hex
+        for placeholder, role in _PREVIEW_COLORS.items()
+        if role in palette
+    }
+    values["theme_type"] = "Dark" if is_dark_theme else "Light"
+    for placeholder, names in _PREVIEW_SECTIONS.items():
+        values[placeholder] = "\n".join(_preview_card(n, palette[n]) for n in names)
+
+    # Terminal color grid with base + bright + dim variants
+    values["terminal_colors"] = "\n".join(
+        _preview_terminal_color(name, palette[name])
+        for suffix in ("", "_bright", "_dim")
+        for name in (base + suffix for base in TERMINAL_COLOR_NAMES)
+        if name in palette
     )
-    html = html.replace(
-        "{semantic_cards}", "\n".join(make_card(n, palette[n]) for n in semantic_names)
+
+    # The template is split once (see _preview_template()); a call only copies
+    # the segment list and fills its placeholder slots. A color role missing
+    # from the palette leaves its placeholder as is.
+    template = _preview_template()
+    parts = list(template)
+    parts[1::2] = [values.get(name, f"{{{name}}}") for name in template[1::2]]
+    return parts
+
+
+def render_html_preview(palette, is_dark_theme):
+    """The HTML preview create_html_preview() writes, as a string"""
+    return "".join(_preview_parts(palette, is_dark_theme))
+
+
+def create_html_preview(palette, extracted_colors, output_path, is_dark_theme):
+    """Create an HTML preview of the palette.
+
+    output_path is a file path or an open text file to write to. A path is
+    only rewritten if its content changes; returns False if it was left as is.
+    """
+    if hasattr(output_path, "write"):
+        output_path.writelines(_preview_parts(palette, is_dark_theme))
+        return True
+    return write_if_changed(output_path, render_html_preview(palette, is_dark_theme))
+
+
+# Zed style keys in file order, with the palette role each takes its color from
+# and the alpha appended to it: a fixed hex byte or one of the layers from
+# _zed_alphas(). A (opaque, blur) pair of roles picks one by theme kind; a None
+# role means the third field is the value itself.
+ZED_STYLE = (
+    ("border", "border", "border"),
+    ("border.variant", "border_variant", "border"),
+    ("border.focused", "border_focused", "border"),
+    ("border.selected", "border_selected", "ff"),
+    ("border.transparent", None, "#00000000"),
+    ("border.disabled", "border_disabled", "ff"),
+    # Elevated surfaces (popups) - use full target opacity
+    ("elevated_surface.background", "background_medium", "target"),
+    # Surface - transparent (inherits from global)
+    ("surface.background", "background_medium", "transparent"),
+    # Global background - base layer for panels
+    ("background", ("background_light", "background_medium"), "global"),
+    ("element.background", "element", "transparent"),
+    ("element.hover", "element_hover", "title_status"),
+    ("element.active", "element_active", "title_status"),
+    ("element.selected", "element_selected", "title_status"),
+    ("element.disabled", "element_disabled", "title_status"),
+    ("drop_target.background", "element_hover", "80"),
+    ("ghost_element.background", None, "#00000000"),
+    ("ghost_element.hover", "element_hover", "ff"),
+    ("ghost_element.active", "element_active", "ff"),
+    ("ghost_element.selected", "element_selected", "ff"),
+    ("ghost_element.disabled", "element_disabled", "ff"),
+    ("text", "foreground_bright", "ff"),
+    ("text.muted", "foreground", "ff"),
+    ("text.placeholder", "foreground_dim", "ff"),
+    ("text.disabled", "foreground_dim", "ff"),
+    ("text.accent", "tertiary", "ff"),
+    ("icon", "foreground_bright", "ff"),
+    ("icon.muted", "foreground", "ff"),
+    ("icon.disabled", "foreground_dim", "ff"),
+    ("icon.placeholder", "foreground", "ff"),
+    ("icon.accent", "tertiary", "ff"),
+    # Title/status bars - standalone, no stacking
+    ("status_bar.background", "background_light", "title_status"),
+    ("title_bar.background", "background_light", "title_status"),
+    ("title_bar.inactive_background", "background_light", "title_status"),
+    ("toolbar.background", "background", "editor"),
+    # Tab bar - stacks on global
+    ("tab_bar.background", "background_medium", "tab_bar"),
+    ("tab.inactive_background", "background_medium", "tab"),
+    ("tab.active_background", "background", "target"),
+    ("search.match_background", "tertiary", "66"),
+    # Panel - transparent (inherits global)
+    ("panel.background", "background_medium", "transparent"),
+    ("panel.focused_border", None, None),
+    ("pane.focused_border", None, None),
+    ("scrollbar.thumb.background", "primary", "4c"),
+    ("scrollbar.thumb.hover_background", "primary_variant", "ff"),
+    ("scrollbar.thumb.border", "primary_variant", "transparent"),
+    ("scrollbar.track.background", None, "#00000000"),
+    ("scrollbar.track.border", "primary", "transparent"),
+    ("editor.foreground", "foreground", "ff"),
+    # Editor - stacks on global to reach target opacity
+    ("editor.background", "background", "editor"),
+    ("editor.gutter.background", "background", "editor"),
+    ("editor.subheader.background", "background_medium", "editor"),
+    ("editor.active_line.background", "background_medium", "bf"),
+    ("editor.highlighted_line.background", "background_medium", "ff"),
+    ("editor.line_number", "foreground_dim", "ff"),
+    ("editor.active_line_number", "foreground_bright", "ff"),
+    ("editor.hover_line_number", "foreground_dim", "ff"),
+    ("editor.invisible", "foreground_dim", "ff"),
+    ("editor.wrap_guide", "primary", "0d"),
+    ("editor.active_wrap_guide", "primary", "1a"),
+    ("editor.document_highlight.read_background", "tertiary", "1a"),
+    ("editor.document_highlight.write_background", "primary", "66"),
+    # Terminal - transparent (inherits from editor which stacks on global)
+    ("terminal.background", "background", "transparent"),
+    ("terminal.foreground", "foreground_bright", "ff"),
+    ("terminal.bright_foreground", "foreground_bright", "ff"),
+    # Terminal foreground/dim_foreground are inverted (dim_fg shows low-contrast text)
+    ("terminal.dim_foreground", "background", "ff"),
+    ("terminal.ansi.black", "black", "ff"),
+    ("terminal.ansi.bright_black", "black_bright", "ff"),
+    ("terminal.ansi.dim_black", "black_dim", "ff"),
+    ("terminal.ansi.red", "red", "ff"),
+    ("terminal.ansi.bright_red", "red_bright", "ff"),
+    ("terminal.ansi.dim_red", "red_dim", "ff"),
+    ("terminal.ansi.green", "green", "ff"),
+    ("terminal.ansi.bright_green", "green_bright", "ff"),
+    ("terminal.ansi.dim_green", "green_dim", "ff"),
+    ("terminal.ansi.yellow", "yellow", "ff"),
+    ("terminal.ansi.bright_yellow", "yellow_bright", "ff"),
+    ("terminal.ansi.dim_yellow", "yellow_dim", "ff"),
+    ("terminal.ansi.blue", "blue", "ff"),
+    ("terminal.ansi.bright_blue", "blue_bright", "ff"),
+    ("terminal.ansi.dim_blue", "blue_dim", "ff"),
+    ("terminal.ansi.magenta", "magenta", "ff"),
+    ("terminal.ansi.bright_magenta", "magenta_bright", "ff"),
+    ("terminal.ansi.dim_magenta", "magenta_dim", "ff"),
+    ("terminal.ansi.cyan", "cyan", "ff"),
+    ("terminal.ansi.bright_cyan", "cyan_bright", "ff"),
+    ("terminal.ansi.dim_cyan", "cyan_dim", "ff"),
+    ("terminal.ansi.white", "white", "ff"),
+    ("terminal.ansi.bright_white", "white_bright", "ff"),
+    ("terminal.ansi.dim_white", "white_dim", "ff"),
+    ("link_text.hover", "info", "ff"),
+    ("version_control.added", "green", "ff"),
+    ("version_control.modified", "yellow", "ff"),
+    ("version_control.deleted", "red", "ff"),
+    ("version_control.conflict_marker.ours", "success", "1a"),
+    ("version_control.conflict_marker.theirs", "tertiary", "1a"),
+    ("conflict", "warning", "ff"),
+    ("conflict.background", "warning", "1a"),
+    ("conflict.border", "yellow_dim", "c2"),
+    ("created", "success", "ff"),
+    ("created.background", "success", "1a"),
+    ("created.border", "green_dim", "c2"),
+    ("deleted", "error", "ff"),
+    ("deleted.background", "error", "1a"),
+    ("deleted.border", "red_dim", "c2"),
+    ("error", "error", "ff"),
+    ("error.background", "error", "1a"),
+    ("error.border", "red_dim", "c2"),
+    ("hidden", "foreground_dim", "ff"),
+    ("hidden.background", "background_disabled", "1a"),
+    ("hidden.border", "muted", "ff"),
+    ("hint", "blue_bright", "ff"),
+    ("hint.background", "secondary_variant", "1a"),
+    ("hint.border", "secondary_variant", "ff"),
+    ("ignored", "foreground_dim", "ff"),
+    ("ignored.background", "background_disabled", "1a"),
+    ("ignored.border", "primary", "ff"),
+    ("info", "info", "ff"),
+    ("info.background", "info", "1a"),
+    ("info.border", "blue_dim", "ff"),
+    ("modified", "warning", "ff"),
+    ("modified.background", "warning", "1a"),
+    ("modified.border", "yellow_dim", "c2"),
+    ("predictive", "cyan_bright", "ff"),
+    ("predictive.background", "cyan_bright", "1a"),
+    ("predictive.border", "green_dim", "c2"),
+    ("renamed", "tertiary", "ff"),
+    ("renamed.background", "tertiary", "1a"),
+    ("renamed.border", "secondary_variant", "ff"),
+    ("success", "success", "ff"),
+    ("success.background", "success", "1a"),
+    ("success.border", "green_dim", "c2"),
+    ("unreachable", "foreground", "ff"),
+    ("unreachable.background", "primary", "1a"),
+    ("unreachable.border", "primary", "ff"),
+    ("warning", "warning", "ff"),
+    ("warning.background", "warning", "1a"),
+    ("warning.border", "yellow_dim", "c2"),
+)
+
+# Roles of the Zed collaborator colors ("players"), in order
+ZED_PLAYERS = ("tertiary", "magenta", "cyan", "error", "warning", "success")
+
+# Zed syntax tokens: (token, palette role, font_style, font_weight)
+ZED_SYNTAX = (
+    ("attribute", "tertiary", None, None),
+    ("boolean", "yellow", None, None),
+    ("comment", "foreground_dim", None, None),
+    ("comment.doc", "foreground_medium", None, None),
+    ("constant", "yellow", None, None),
+    ("constructor", "blue_dim", None, None),
+    ("embedded", "foreground_bright", None, None),
+    ("emphasis", "tertiary", None, None),
+    ("emphasis.strong", "yellow", None, 700),
+    ("enum", "error", None, None),
+    ("function", "cyan_dim", None, None),
+    ("hint", "blue_bright", None, None),
+    ("keyword", "magenta", None, None),
+    ("label", "tertiary", None, None),
+    ("link_text", "cyan_dim", "normal", None),
+    ("link_uri", "cyan", None, None),
+    ("namespace", "foreground_bright", None, None),
+    ("number", "yellow", None, None),
+    ("operator", "cyan", None, None),
+    ("predictive", "cyan_bright", "italic", None),
+    ("preproc", "foreground_bright", None, None),
+    ("primary", "foreground", None, None),
+    ("property", "error", None, None),
+    ("punctuation", "foreground", None, None),
+    ("punctuation.bracket", "foreground_medium", None, None),
+    ("punctuation.delimiter", "foreground_medium", None, None),
+    ("punctuation.list_marker", "error", None, None),
+    ("punctuation.markup", "error", None, None),
+    ("punctuation.special", "red", None, None),
+    ("selector", "yellow", None, None),
+    ("selector.pseudo", "tertiary", None, None),
+    ("string", "success", None, None),
+    ("string.escape", "foreground_medium", None, None),
+    ("string.regex", "yellow", None, None),
+    ("string.special", "yellow", None, None),
+    ("string.special.symbol", "yellow", None, None),
+    ("tag", "tertiary", None, None),
+    ("text.literal", "success", None, None),
+    ("title", "error", None, 400),
+    ("type", "cyan", None, None),
+    ("variable", "foreground", None, None),
+    ("variable.special", "yellow", None, None),
+    ("variant", "blue_dim", None, None),
+)
+
+
+def _zed_alphas(opacity):
+    """Alpha hex bytes of the ZED_STYLE layers for a blur theme's opacity.
+
+    Uses the layered transparency system (see calculate_layered_opacities());
+    an opaque theme (opacity None) has every layer at ff.
+    """
+    if opacity is None:
+        return dict.fromkeys(
+            (
+                "target",
+                "global",
+                "editor",
+                "tab_bar",
+                "tab",
+                "title_status",
+                "transparent",
+                "border",
+            ),
+            "ff",
+        )
+    layers = calculate_layered_opacities(opacity)
+    return {
+        "target": opacity_to_hex(opacity),  # Full editor target
+        "global": opacity_to_hex(layers["global"]),
+        "editor": opacity_to_hex(layers["editor_layer"]),
+        "tab_bar": opacity_to_hex(layers["tab_bar_layer"]),
+        "tab": opacity_to_hex(layers["tab_layer"]),
+        "title_status": opacity_to_hex(layers["title_status"]),
+        "transparent": "00",
+        "border": opacity_to_hex(0.4),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _zed_style_table(is_blur):
+    """ZED_STYLE with the role pairs resolved for an opaque or blur theme"""
+    return tuple(
+        (key, role[is_blur] if isinstance(role, tuple) else role, alpha)
+        for key, role, alpha in ZED_STYLE
     )
 
-    # Generate terminal color grid with base + bright variants
-    terminal_grid = []
-    for name in terminal_color_names:
-        if name in palette:
-            terminal_grid.append(make_terminal_color(name, palette[name]))
-    for name in terminal_color_names:
-        bright_name = f"{name}_bright"
-        if bright_name in palette:
-            terminal_grid.append(make_terminal_color(bright_name, palette[bright_name]))
-    for name in terminal_color_names:
-        dim_name = f"{name}_dim"
-        if dim_name in palette:
-            terminal_grid.append(make_terminal_color(dim_name, palette[dim_name]))
-    html = html.replace("{terminal_colors}", "\n".join(terminal_grid))
 
-    with open(output_path, "w") as f:
-        f.write(html)
+def _fill_zed_style(is_blur, color):
+    """The Zed style dict with color(role, alpha) as each palette color value"""
+    style = {
+        key: alpha if role is None else color(role, alpha)
+        for key, role, alpha in _zed_style_table(is_blur)
+    }
+    style["players"] = [
+        {
+            "cursor": color(role, "ff"),
+            "background": color(role, "ff"),
+            "selection": color(role, "3d"),
+        }
+        for role in ZED_PLAYERS
+    ]
+    style["syntax"] = {
+        token: {
+            "color": color(role, "ff"),
+            "font_style": font_style,
+            "font_weight": font_weight,
+        }
+        for token, role, font_style, font_weight in ZED_SYNTAX
+    }
+    # Add blur appearance for transparent themes
+    if is_blur:
+        style["background.appearance"] = "blurred"
+    return style
 
 
 def _build_zed_style(palette, is_dark, opacity=None):
@@ -1394,431 +3405,80 @@ def _build_zed_style(palette, is_dark, opacity=None):
         opacity: Optional opacity value (0.0-1.0) for transparent blur theme.
                  If None, creates opaque theme (ff alpha).
     """
-    # Terminal foreground/dim_foreground are inverted (dim_fg shows low-contrast text)
-    term_fg = palette["foreground_bright"]
-    term_dim_fg = palette["background"]  # Inverted for low contrast
-
-    # Calculate opacity hex values using layered transparency system
-    if opacity is not None:
-        layers = calculate_layered_opacities(opacity)
-        target_alpha = opacity_to_hex(opacity)  # Full editor target
-        global_alpha = opacity_to_hex(layers["global"])
-        editor_alpha = opacity_to_hex(layers["editor_layer"])
-        tab_bar_alpha = opacity_to_hex(layers["tab_bar_layer"])
-        tab_alpha = opacity_to_hex(layers["tab_layer"])
-        title_status_alpha = opacity_to_hex(layers["title_status"])
-        transparent_alpha = "00"
-    else:
-        # Opaque theme - all fully opaque
-        target_alpha = "ff"
-        global_alpha = "ff"
-        editor_alpha = "ff"
-        tab_bar_alpha = "ff"
-        tab_alpha = "ff"
-        title_status_alpha = "ff"
-        transparent_alpha = "ff"
+    alphas = _zed_alphas(opacity)
+    return _fill_zed_style(
+        opacity is not None,
+        lambda role, alpha: palette[role].hex + alphas.get(alpha, alpha),
+    )
 
-    style = {
-        "border": f"{palette['border'].hex}{'ff' if opacity is None else opacity_to_hex(0.4)}",
-        "border.variant": f"{palette['border_variant'].hex}{'ff' if opacity is None else opacity_to_hex(0.4)}",
-        "border.focused": f"{palette['border_focused'].hex}{'ff' if opacity is None else opacity_to_hex(0.4)}",
-        "border.selected": f"{palette['border_selected'].hex}ff",
-        "border.transparent": f"#00000000",
-        "border.disabled": f"{palette['border_disabled'].hex}ff",
-        # Elevated surfaces (popups) - use full target opacity
-        "elevated_surface.background": f"{palette['background_medium'].hex}{target_alpha}",
-        # Surface - transparent (inherits from global)
-        "surface.background": f"{palette['background_medium'].hex}{transparent_alpha}",
-        # Global background - base layer for panels
-        "background": f"{palette['background_light' if opacity is None else 'background_medium'].hex}{global_alpha}",
-        "element.background": f"{palette['element'].hex}{'ff' if opacity is None else transparent_alpha}",
-        "element.hover": f"{palette['element_hover'].hex}{'ff' if opacity is None else title_status_alpha}",
-        "element.active": f"{palette['element_active'].hex}{'ff' if opacity is None else title_status_alpha}",
-        "element.selected": f"{palette['element_selected'].hex}{'ff' if opacity is None else title_status_alpha}",
-        "element.disabled": f"{palette['element_disabled'].hex}{'ff' if opacity is None else title_status_alpha}",
-        "drop_target.background": f"{palette['element_hover'].hex}80",
-        "ghost_element.background": f"#00000000",
-        "ghost_element.hover": f"{palette['element_hover'].hex}ff",
-        "ghost_element.active": f"{palette['element_active'].hex}ff",
-        "ghost_element.selected": f"{palette['element_selected'].hex}ff",
-        "ghost_element.disabled": f"{palette['element_disabled'].hex}ff",
-        "text": f"{palette['foreground_bright'].hex}ff",
-        "text.muted": f"{palette['foreground'].hex}ff",
-        "text.placeholder": f"{palette['foreground_dim'].hex}ff",
-        "text.disabled": f"{palette['foreground_dim'].hex}ff",
-        "text.accent": f"{palette['tertiary'].hex}ff",
-        "icon": f"{palette['foreground_bright'].hex}ff",
-        "icon.muted": f"{palette['foreground'].hex}ff",
-        "icon.disabled": f"{palette['foreground_dim'].hex}ff",
-        "icon.placeholder": f"{palette['foreground'].hex}ff",
-        "icon.accent": f"{palette['tertiary'].hex}ff",
-        # Title/status bars - standalone, no stacking
-        "status_bar.background": f"{palette['background_light'].hex}{title_status_alpha}",
-        "title_bar.background": f"{palette['background_light'].hex}{title_status_alpha}",
-        "title_bar.inactive_background": f"{palette['background_light'].hex}{title_status_alpha}",
-        "toolbar.background": f"{palette['background'].hex}{editor_alpha}",
-        # Tab bar - stacks on global
-        "tab_bar.background": f"{palette['background_medium'].hex}{tab_bar_alpha}",
-        "tab.inactive_background": f"{palette['background_medium'].hex}{tab_alpha}",
-        "tab.active_background": f"{palette['background'].hex}{target_alpha}",
-        "search.match_background": f"{palette['tertiary'].hex}66",
-        # Panel - transparent (inherits global)
-        "panel.background": f"{palette['background_medium'].hex}{transparent_alpha}",
-        "panel.focused_border": None,
-        "pane.focused_border": None,
-        "scrollbar.thumb.background": f"{palette['primary'].hex}4c",
-        "scrollbar.thumb.hover_background": f"{palette['primary_variant'].hex}ff",
-        "scrollbar.thumb.border": f"{palette['primary_variant'].hex}{'ff' if opacity is None else transparent_alpha}",
-        "scrollbar.track.background": f"#00000000",
-        "scrollbar.track.border": f"{palette['primary'].hex}{'ff' if opacity is None else transparent_alpha}",
-        "editor.foreground": f"{palette['foreground'].hex}ff",
-        # Editor - stacks on global to reach target opacity
-        "editor.background": f"{palette['background'].hex}{editor_alpha}",
-        "editor.gutter.background": f"{palette['background'].hex}{editor_alpha}",
-        "editor.subheader.background": f"{palette['background_medium'].hex}{editor_alpha}",
-        "editor.active_line.background": f"{palette['background_medium'].hex}bf",
-        "editor.highlighted_line.background": f"{palette['background_medium'].hex}ff",
-        "editor.line_number": f"{palette['foreground_dim'].hex}ff",
-        "editor.active_line_number": f"{palette['foreground_bright'].hex}ff",
-        "editor.hover_line_number": f"{palette['foreground_dim'].hex}ff",
-        "editor.invisible": f"{palette['foreground_dim'].hex}ff",
-        "editor.wrap_guide": f"{palette['primary'].hex}0d",
-        "editor.active_wrap_guide": f"{palette['primary'].hex}1a",
-        "editor.document_highlight.read_background": f"{palette['tertiary'].hex}1a",
-        "editor.document_highlight.write_background": f"{palette['primary'].hex}66",
-        # Terminal - transparent (inherits from editor which stacks on global)
-        "terminal.background": f"{palette['background'].hex}{transparent_alpha}",
-        "terminal.foreground": f"{term_fg.hex}ff",
-        "terminal.bright_foreground": f"{term_fg.hex}ff",
-        "terminal.dim_foreground": f"{term_dim_fg.hex}ff",
-        "terminal.ansi.black": f"{palette['black'].hex}ff",
-        "terminal.ansi.bright_black": f"{palette['black_bright'].hex}ff",
-        "terminal.ansi.dim_black": f"{palette['black_dim'].hex}ff",
-        "terminal.ansi.red": f"{palette['red'].hex}ff",
-        "terminal.ansi.bright_red": f"{palette['red_bright'].hex}ff",
-        "terminal.ansi.dim_red": f"{palette['red_dim'].hex}ff",
-        "terminal.ansi.green": f"{palette['green'].hex}ff",
-        "terminal.ansi.bright_green": f"{palette['green_bright'].hex}ff",
-        "terminal.ansi.dim_green": f"{palette['green_dim'].hex}ff",
-        "terminal.ansi.yellow": f"{palette['yellow'].hex}ff",
-        "terminal.ansi.bright_yellow": f"{palette['yellow_bright'].hex}ff",
-        "terminal.ansi.dim_yellow": f"{palette['yellow_dim'].hex}ff",
-        "terminal.ansi.blue": f"{palette['blue'].hex}ff",
-        "terminal.ansi.bright_blue": f"{palette['blue_bright'].hex}ff",
-        "terminal.ansi.dim_blue": f"{palette['blue_dim'].hex}ff",
-        "terminal.ansi.magenta": f"{palette['magenta'].hex}ff",
-        "terminal.ansi.bright_magenta": f"{palette['magenta_bright'].hex}ff",
-        "terminal.ansi.dim_magenta": f"{palette['magenta_dim'].hex}ff",
-        "terminal.ansi.cyan": f"{palette['cyan'].hex}ff",
-        "terminal.ansi.bright_cyan": f"{palette['cyan_bright'].hex}ff",
-        "terminal.ansi.dim_cyan": f"{palette['cyan_dim'].hex}ff",
-        "terminal.ansi.white": f"{palette['white'].hex}ff",
-        "terminal.ansi.bright_white": f"{palette['white_bright'].hex}ff",
-        "terminal.ansi.dim_white": f"{palette['white_dim'].hex}ff",
-        "link_text.hover": f"{palette['info'].hex}ff",
-        "version_control.added": f"{palette['green'].hex}ff",
-        "version_control.modified": f"{palette['yellow'].hex}ff",
-        "version_control.deleted": f"{palette['red'].hex}ff",
-        "version_control.conflict_marker.ours": f"{palette['success'].hex}1a",
-        "version_control.conflict_marker.theirs": f"{palette['tertiary'].hex}1a",
-        "conflict": f"{palette['warning'].hex}ff",
-        "conflict.background": f"{palette['warning'].hex}1a",
-        "conflict.border": f"{palette['yellow_dim'].hex}c2",
-        "created": f"{palette['success'].hex}ff",
-        "created.background": f"{palette['success'].hex}1a",
-        "created.border": f"{palette['green_dim'].hex}c2",
-        "deleted": f"{palette['error'].hex}ff",
-        "deleted.background": f"{palette['error'].hex}1a",
-        "deleted.border": f"{palette['red_dim'].hex}c2",
-        "error": f"{palette['error'].hex}ff",
-        "error.background": f"{palette['error'].hex}1a",
-        "error.border": f"{palette['red_dim'].hex}c2",
-        "hidden": f"{palette['foreground_dim'].hex}ff",
-        "hidden.background": f"{palette['background_disabled'].hex}1a",
-        "hidden.border": f"{palette['muted'].hex}ff",
-        "hint": f"{palette['blue_bright'].hex}ff",
-        "hint.background": f"{palette['secondary_variant'].hex}1a",
-        "hint.border": f"{palette['secondary_variant'].hex}ff",
-        "ignored": f"{palette['foreground_dim'].hex}ff",
-        "ignored.background": f"{palette['background_disabled'].hex}1a",
-        "ignored.border": f"{palette['primary'].hex}ff",
-        "info": f"{palette['info'].hex}ff",
-        "info.background": f"{palette['info'].hex}1a",
-        "info.border": f"{palette['blue_dim'].hex}ff",
-        "modified": f"{palette['warning'].hex}ff",
-        "modified.background": f"{palette['warning'].hex}1a",
-        "modified.border": f"{palette['yellow_dim'].hex}c2",
-        "predictive": f"{palette['cyan_bright'].hex}ff",
-        "predictive.background": f"{palette['cyan_bright'].hex}1a",
-        "predictive.border": f"{palette['green_dim'].hex}c2",
-        "renamed": f"{palette['tertiary'].hex}ff",
-        "renamed.background": f"{palette['tertiary'].hex}1a",
-        "renamed.border": f"{palette['secondary_variant'].hex}ff",
-        "success": f"{palette['success'].hex}ff",
-        "success.background": f"{palette['success'].hex}1a",
-        "success.border": f"{palette['green_dim'].hex}c2",
-        "unreachable": f"{palette['foreground'].hex}ff",
-        "unreachable.background": f"{palette['primary'].hex}1a",
-        "unreachable.border": f"{palette['primary'].hex}ff",
-        "warning": f"{palette['warning'].hex}ff",
-        "warning.background": f"{palette['warning'].hex}1a",
-        "warning.border": f"{palette['yellow_dim'].hex}c2",
-        "players": [
-            {
-                "cursor": f"{palette['tertiary'].hex}ff",
-                "background": f"{palette['tertiary'].hex}ff",
-                "selection": f"{palette['tertiary'].hex}3d",
-            },
-            {
-                "cursor": f"{palette['magenta'].hex}ff",
-                "background": f"{palette['magenta'].hex}ff",
-                "selection": f"{palette['magenta'].hex}3d",
-            },
-            {
-                "cursor": f"{palette['cyan'].hex}ff",
-                "background": f"{palette['cyan'].hex}ff",
-                "selection": f"{palette['cyan'].hex}3d",
-            },
-            {
-                "cursor": f"{palette['error'].hex}ff",
-                "background": f"{palette['error'].hex}ff",
-                "selection": f"{palette['error'].hex}3d",
-            },
+
+def _zed_document(family_name, themes):
+    return {
+        "$schema": "https://zed.dev/schema/themes/v0.2.0.json",
+        "name": family_name,
+        "author": "Palette Generator",
+        "themes": themes,
+    }
+
+
+def _zed_family(theme_name, dark_style, light_style, is_blur_theme):
+    # Determine theme name suffix based on opacity
+    name_suffix = " Blur" if is_blur_theme else ""
+
+    return _zed_document(
+        f"{theme_name}{name_suffix}",
+        [
             {
-                "cursor": f"{palette['warning'].hex}ff",
-                "background": f"{palette['warning'].hex}ff",
-                "selection": f"{palette['warning'].hex}3d",
+                "name": f"{theme_name} Dark{name_suffix}",
+                "appearance": "dark",
+                "style": dark_style,
             },
             {
-                "cursor": f"{palette['success'].hex}ff",
-                "background": f"{palette['success'].hex}ff",
-                "selection": f"{palette['success'].hex}3d",
+                "name": f"{theme_name} Light{name_suffix}",
+                "appearance": "light",
+                "style": light_style,
             },
         ],
-        "syntax": {
-            "attribute": {
-                "color": f"{palette['tertiary'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "boolean": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "comment": {
-                "color": f"{palette['foreground_dim'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "comment.doc": {
-                "color": f"{palette['foreground_medium'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "constant": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "constructor": {
-                "color": f"{palette['blue_dim'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "embedded": {
-                "color": f"{palette['foreground_bright'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "emphasis": {
-                "color": f"{palette['tertiary'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "emphasis.strong": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": 700,
-            },
-            "enum": {
-                "color": f"{palette['error'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "function": {
-                "color": f"{palette['cyan_dim'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "hint": {
-                "color": f"{palette['blue_bright'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "keyword": {
-                "color": f"{palette['magenta'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "label": {
-                "color": f"{palette['tertiary'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "link_text": {
-                "color": f"{palette['cyan_dim'].hex}ff",
-                "font_style": "normal",
-                "font_weight": None,
-            },
-            "link_uri": {
-                "color": f"{palette['cyan'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "namespace": {
-                "color": f"{palette['foreground_bright'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "number": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "operator": {
-                "color": f"{palette['cyan'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "predictive": {
-                "color": f"{palette['cyan_bright'].hex}ff",
-                "font_style": f"italic",
-                "font_weight": None,
-            },
-            "preproc": {
-                "color": f"{palette['foreground_bright'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "primary": {
-                "color": f"{palette['foreground'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "property": {
-                "color": f"{palette['error'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "punctuation": {
-                "color": f"{palette['foreground'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "punctuation.bracket": {
-                "color": f"{palette['foreground_medium'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "punctuation.delimiter": {
-                "color": f"{palette['foreground_medium'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "punctuation.list_marker": {
-                "color": f"{palette['error'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "punctuation.markup": {
-                "color": f"{palette['error'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "punctuation.special": {
-                "color": f"{palette['red'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "selector": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "selector.pseudo": {
-                "color": f"{palette['tertiary'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "string": {
-                "color": f"{palette['success'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "string.escape": {
-                "color": f"{palette['foreground_medium'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "string.regex": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "string.special": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "string.special.symbol": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "tag": {
-                "color": f"{palette['tertiary'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "text.literal": {
-                "color": f"{palette['success'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "title": {
-                "color": f"{palette['error'].hex}ff",
-                "font_style": None,
-                "font_weight": 400,
-            },
-            "type": {
-                "color": f"{palette['cyan'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "variable": {
-                "color": f"{palette['foreground'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "variable.special": {
-                "color": f"{palette['yellow'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-            "variant": {
-                "color": f"{palette['blue_dim'].hex}ff",
-                "font_style": None,
-                "font_weight": None,
-            },
-        },
-    }
+    )
+
+
+def zed_theme_data(
+    dark_palette, light_palette, theme_name, dark_opacity=None, light_opacity=None
+):
+    """Zed theme family as a JSON-ready dict, see generate_zed_themes()"""
+    return _zed_family(
+        theme_name,
+        _build_zed_style(dark_palette, is_dark=True, opacity=dark_opacity),
+        _build_zed_style(light_palette, is_dark=False, opacity=light_opacity),
+        dark_opacity is not None or light_opacity is not None,
+    )
 
-    # Add blur appearance for transparent themes
-    if opacity is not None:
-        style["background.appearance"] = "blurred"
 
-    return style
+@functools.lru_cache(maxsize=None)
+def _zed_theme_template(dark_blur, light_blur):
+    """The generate_zed_themes() document, serialized once and split at its slots.
+
+    Returns (parts, slots): parts alternates fixed JSON text with slot numbers,
+    and slots holds for each number either None (the theme name) or (theme,
+    role, alpha), theme being 0 for dark and 1 for light.
+    """
+    import re
+
+    slots = []
+
+    def slot(*value):
+        slots.append(value or None)
+        return f"@@{len(slots) - 1}@@"
+
+    document = _zed_family(
+        slot(),
+        _fill_zed_style(dark_blur, lambda role, alpha: slot(0, role, alpha)),
+        _fill_zed_style(light_blur, lambda role, alpha: slot(1, role, alpha)),
+        dark_blur or light_blur,
+    )
+    parts = re.split(r"@@(\d+)@@", json.dumps(document, indent=2))
+    parts[1::2] = [int(number) for number in parts[1::2]]
+    return tuple(parts), tuple(slots)
 
 
 def generate_zed_themes(
@@ -1826,6 +3486,10 @@ def generate_zed_themes(
 ):
     """Generate a Zed theme JSON file with both dark and light variants.
 
+    Equal to json.dumps(zed_theme_data(...), indent=2), but fills the slots of
+    a document serialized once per opaque/blur combination instead of
+    serializing the whole style again.
+
     Args:
         dark_palette: The dark theme palette
         light_palette: The light theme palette
@@ -1833,91 +3497,357 @@ def generate_zed_themes(
         dark_opacity: Optional opacity for dark theme (0.0-1.0). If set, creates blur theme.
         light_opacity: Optional opacity for light theme (0.0-1.0). If set, creates blur theme.
     """
-    # Determine theme name suffix based on opacity
-    is_blur_theme = dark_opacity is not None or light_opacity is not None
-    name_suffix = " Blur" if is_blur_theme else ""
+    parts, slots = _zed_theme_template(
+        dark_opacity is not None, light_opacity is not None
+    )
+    palettes = (dark_palette, light_palette)
+    alphas = (_zed_alphas(dark_opacity), _zed_alphas(light_opacity))
+    # Escaped like json.dumps() would, without the quotes
+    name = json.dumps(theme_name)[1:-1]
+    values = [
+        name
+        if slot is None
+        else palettes[slot[0]][slot[1]].hex + alphas[slot[0]].get(slot[2], slot[2])
+        for slot in slots
+    ]
+    document = list(parts)
+    document[1::2] = [values[number] for number in parts[1::2]]
+    return "".join(document)
 
-    theme_data = {
-        "$schema": "https://zed.dev/schema/themes/v0.2.0.json",
-        "name": f"{theme_name}{name_suffix}",
-        "author": "Palette Generator",
-        "themes": [
-            {
-                "name": f"{theme_name} Dark{name_suffix}",
-                "appearance": "dark",
-                "style": _build_zed_style(
-                    dark_palette, is_dark=True, opacity=dark_opacity
-                ),
-            },
-            {
-                "name": f"{theme_name} Light{name_suffix}",
-                "appearance": "light",
-                "style": _build_zed_style(
-                    light_palette, is_dark=False, opacity=light_opacity
-                ),
-            },
-        ],
-    }
-    return json.dumps(theme_data, indent=2)
 
+# Theme variants to build from one image: contrast tiers (CONTRAST_TIERS),
+# saturation tiers (SATURATION_TIERS) and blur opacities, None being an opaque
+# theme and "auto" the calculate_theme_opacity() one. Every combination becomes
+# a dark and a light theme.
+VariantMatrix = namedtuple("VariantMatrix", ["contrasts", "saturations", "opacities"])
+DEFAULT_VARIANTS = VariantMatrix(tuple(CONTRAST_TIERS), ("standard",), (None, "auto"))
 
-def main():
-    import argparse
-    import os
 
-    parser = argparse.ArgumentParser(
-        description="Generate color palettes and Zed themes from images"
+def variant_profile(contrast, saturation, base=DEFAULT_PROFILE):
+    """base PaletteProfile with the fields of a contrast and a saturation tier"""
+    if contrast not in CONTRAST_TIERS:
+        raise ValueError(
+            f"Unknown contrast tier {contrast!r}, expected one of "
+            f"{', '.join(CONTRAST_TIERS)}"
+        )
+    if saturation not in SATURATION_TIERS:
+        raise ValueError(
+            f"Unknown saturation tier {saturation!r}, expected one of "
+            f"{', '.join(SATURATION_TIERS)}"
+        )
+    return base._replace(**CONTRAST_TIERS[contrast], **SATURATION_TIERS[saturation])
+
+
+def parse_variants(contrasts=None, saturations=None, opacities=None):
+    """VariantMatrix from comma-separated CLI values, None if all are None.
+
+    Values left out are taken from DEFAULT_VARIANTS. Opacities are numbers from
+    0 to 1, "auto" or "opaque".
+    """
+    if contrasts is None and saturations is None and opacities is None:
+        return None
+
+    def split(text):
+        return tuple(value.strip() for value in text.split(",") if value.strip())
+
+    variants = DEFAULT_VARIANTS
+    if contrasts is not None:
+        variants = variants._replace(contrasts=split(contrasts))
+    if saturations is not None:
+        variants = variants._replace(saturations=split(saturations))
+    if opacities is not None:
+        values = []
+        for value in split(opacities):
+            if value in ("auto", "opaque"):
+                values.append(None if value == "opaque" else value)
+                continue
+            try:
+                opacity = float(value)
+            except ValueError:
+                opacity = None
+            if opacity is None or not 0.0 <= opacity <= 1.0:
+                raise ValueError(
+                    f"Invalid opacity {value!r}, expected 0.0-1.0, auto or opaque"
+                )
+            values.append(opacity)
+        variants = variants._replace(opacities=tuple(values))
+    for contrast in variants.contrasts:
+        for saturation in variants.saturations:
+            variant_profile(contrast, saturation)  # Raises for unknown tiers
+    if not all(variants):
+        raise ValueError("Every variant option needs at least one value")
+    return variants
+
+
+def add_variant_arguments(parser):
+    """Add the options parse_variants() takes to an argparse parser"""
+    parser.add_argument(
+        "--contrast-tiers",
+        default=None,
+        help="Write a Zed theme family (<name>-variants.json) with a variant for "
+        f"each of these comma-separated contrast tiers ({', '.join(CONTRAST_TIERS)};"
+        " default: all)",
     )
-    parser.add_argument("image_path", help="Path to the source image")
     parser.add_argument(
-        "output_dir",
-        nargs="?",
+        "--saturation-tiers",
         default=None,
-        help="Output directory (default: same as image)",
+        help="Saturation tiers of the variants "
+        f"({', '.join(SATURATION_TIERS)}; default: standard)",
     )
     parser.add_argument(
-        "--opacity",
-        type=float,
+        "--opacities",
         default=None,
-        help="Override blur theme opacity (0.0-1.0). If not set, auto-calculates optimal value.",
+        help="Blur opacities of the variants: numbers from 0.0 to 1.0, auto or "
+        "opaque (default: opaque,auto)",
     )
 
-    args = parser.parse_args()
 
-    image_path = args.image_path
-    output_dir = args.output_dir or os.path.dirname(image_path) or "."
-    override_opacity = args.opacity
+def _variant_theme_name(theme_name, theme, contrast, saturation, opacity):
+    """Theme name like "<name> Dark High Contrast Vivid Blur 80%" (no standard tiers)"""
+    parts = [theme_name, theme.capitalize()]
+    if contrast != "standard":
+        parts.append(f"{contrast.capitalize()} Contrast")
+    if saturation != "standard":
+        parts.append(saturation.capitalize())
+    if opacity == "auto":
+        parts.append("Blur")
+    elif opacity is not None:
+        parts.append(f"Blur {opacity:.0%}")
+    return " ".join(parts)
+
+
+def zed_variant_data(
+    analysis,
+    theme_name,
+    variants=DEFAULT_VARIANTS,
+    contrast_method="solve",
+    override_opacity=None,
+    palette_profile=None,
+):
+    """Zed theme family with a dark and a light theme for every variant.
 
-    os.makedirs(output_dir, exist_ok=True)
+    All variants share the analysis and the color arrays role assignment
+    selects from (see _color_arrays()). Each contrast and saturation tier pair
+    builds its two palettes once for all opacities, and their "auto" opacity
+    (override_opacity if given) is calculated once.
 
-    print(f"Analyzing: {image_path}")
+    Args:
+        analysis: ImageAnalysis from analyze_image()
+        theme_name: Base name for the family and its themes
+        variants: VariantMatrix of the variants to build
+        contrast_method: "solve" or "step", see CONTRAST_METHODS
+        override_opacity: Optional blur opacity (0.0-1.0) for "auto" opacities
+        palette_profile: PaletteProfile the tiers modify (default: DEFAULT_PROFILE)
+    """
+    base = DEFAULT_PROFILE if palette_profile is None else palette_profile
+    themes = []
+    for contrast in variants.contrasts:
+        for saturation in variants.saturations:
+            profile = variant_profile(contrast, saturation, base)
+            palettes = {}
+            with _stage("palette"):
+                for theme in THEMES:
+                    palettes[theme], _, _, _ = generate_functional_palette(
+                        None, theme, analysis, contrast_method, profile
+                    )
+            auto = {theme: override_opacity for theme in THEMES}
+            if override_opacity is None and "auto" in variants.opacities:
+                with _stage("opacity"):
+                    for theme in THEMES:
+                        auto[theme] = calculate_theme_opacity(
+                            palettes[theme], theme == "dark", profile.dim_contrast
+                        )
+            for opacity in variants.opacities:
+                for theme in THEMES:
+                    style = _build_zed_style(
+                        palettes[theme],
+                        is_dark=theme == "dark",
+                        opacity=auto[theme] if opacity == "auto" else opacity,
+                    )
+                    name = _variant_theme_name(
+                        theme_name, theme, contrast, saturation, opacity
+                    )
+                    themes.append({"name": name, "appearance": theme, "style": style})
+    return _zed_document(f"{theme_name} Variants", themes)
+
+
+def build_theme(
+    analysis,
+    theme_name,
+    override_opacity=None,
+    contrast_method="solve",
+    palette_profile=None,
+):
+    """Palettes and Zed themes for an analyzed image, without writing files.
 
-    # Generate both dark and light palettes
-    dark_palette, dark_extracted, _, _ = generate_functional_palette(
-        image_path, force_theme="dark"
-    )
-    light_palette, light_extracted, _, _ = generate_functional_palette(
-        image_path, force_theme="light"
-    )
+    Returns a JSON-ready dict holding the same documents export_theme() writes:
+    the dark/light palette exports, the opaque and blur Zed theme families and
+    the blur opacities used.
 
-    # Print and export dark theme
-    print_palette(dark_palette, is_dark_theme=True)
-    dark_report, dark_issues = generate_readability_report(
-        dark_palette, is_dark_theme=True
+    Args:
+        analysis: ImageAnalysis from analyze_image()
+        theme_name: Base name for the Zed themes
+        override_opacity: Optional blur opacity (0.0-1.0). If None, auto-calculates.
+        contrast_method: "solve" or "step", see CONTRAST_METHODS
+        palette_profile: PaletteProfile the palettes are built with (default:
+                         DEFAULT_PROFILE)
+    """
+    if palette_profile is None:
+        palette_profile = DEFAULT_PROFILE
+    palettes = apply_profile(
+        analysis, palette_profile, contrast_method=contrast_method
     )
-    print("\n" + dark_report)
+    dark_palette, light_palette = palettes["dark"], palettes["light"]
 
-    # Print and export light theme
-    print_palette(light_palette, is_dark_theme=False)
-    light_report, light_issues = generate_readability_report(
-        light_palette, is_dark_theme=False
-    )
-    print("\n" + light_report)
+    if override_opacity is not None:
+        dark_opacity = override_opacity
+        light_opacity = override_opacity
+    else:
+        opacities = apply_profile_opacities(palettes, palette_profile)
+        dark_opacity, light_opacity = opacities["dark"], opacities["light"]
 
-    # Export paths
-    # Get theme name from image filename (without extension)
-    theme_name = os.path.splitext(os.path.basename(image_path))[0]
+    return {
+        "name": theme_name,
+        "opacity": {"dark": dark_opacity, "light": light_opacity},
+        "palette": {
+            "dark": palette_data(dark_palette, blur_opacity=dark_opacity),
+            "light": palette_data(light_palette, blur_opacity=light_opacity),
+        },
+        "zed": zed_theme_data(dark_palette, light_palette, theme_name),
+        "zed_blur": zed_theme_data(
+            dark_palette,
+            light_palette,
+            theme_name,
+            dark_opacity=dark_opacity,
+            light_opacity=light_opacity,
+        ),
+    }
+
+
+# Files export_theme() can write, by the name they are selected with. The
+# palette-json, html and report outputs are one file per theme (dark, light);
+# zed-variants is the theme family of a VariantMatrix. Without an explicit
+# selection, DEFAULT_OUTPUTS are written, plus zed-variants when variants are.
+OUTPUTS = ("palette-json", "html", "report", "zed", "zed-blur", "zed-variants")
+DEFAULT_OUTPUTS = OUTPUTS[:-1]
+
+
+def parse_outputs(text):
+    """Split a comma-separated --outputs value into a tuple of OUTPUTS names"""
+    names = tuple(name.strip() for name in text.split(",") if name.strip())
+    unknown = [name for name in names if name not in OUTPUTS]
+    if unknown or not names:
+        raise ValueError(
+            f"Invalid outputs {text!r}, expected a comma-separated list of "
+            f"{', '.join(OUTPUTS)}"
+        )
+    return names
+
+
+def export_theme(
+    image,
+    output_dir,
+    override_opacity=None,
+    verbose=True,
+    cache=None,
+    quantizer=DEFAULT_QUANTIZER,
+    contrast_method="solve",
+    outputs=None,
+    theme_name=None,
+    variants=None,
+    palette_profile=None,
+):
+    """Generate palettes and Zed themes for one image and write its output files.
+
+    Only the stages the selected outputs need are run: without "report" or
+    verbose, no readability report is built; without "palette-json" or
+    "zed-blur", no blur opacity is calculated. Files whose content is unchanged
+    are left untouched (see write_if_changed()), so re-exporting an unchanged
+    image writes nothing.
+
+    Args:
+        image: Source image, any input analyze_image() takes; it is decoded once
+        output_dir: Directory the output files are written to (created if missing)
+        override_opacity: Optional blur opacity (0.0-1.0). If None, auto-calculates.
+        verbose: Print the palettes, readability reports and exported paths
+        cache: Optional ColorCache for the extracted colors
+        quantizer: Name of the color extraction engine in QUANTIZERS
+        contrast_method: "solve" or "step", see CONTRAST_METHODS
+        outputs: Names from OUTPUTS to write (default: DEFAULT_OUTPUTS, plus
+                 zed-variants if variants is given)
+        theme_name: Base name for the Zed theme files and themes (default: the
+                    image file name without extension, required for inputs
+                    other than paths)
+        variants: VariantMatrix for the zed-variants output (default:
+                  DEFAULT_VARIANTS)
+        palette_profile: PaletteProfile the palettes are built with (default:
+                         DEFAULT_PROFILE), see load_palette_profile()
+
+    Returns:
+        (exported file paths, (dark_opacity, light_opacity)). The opacities are
+        None when no selected output needed them.
+    """
+    import os
 
+    if outputs is None:
+        outputs = OUTPUTS if variants is not None else DEFAULT_OUTPUTS
+    outputs = tuple(outputs)
+    unknown = [name for name in outputs if name not in OUTPUTS]
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(unknown)}")
+    if variants is None:
+        variants = DEFAULT_VARIANTS
+    if palette_profile is None:
+        palette_profile = DEFAULT_PROFILE
+
+    is_path = isinstance(image, (str, os.PathLike))
+    if theme_name is None:
+        if not is_path:
+            raise ValueError("theme_name is required unless image is a path")
+        # Get theme name from image filename (without extension)
+        theme_name = os.path.splitext(os.path.basename(image))[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    if verbose:
+        print(f"Analyzing: {image if is_path else theme_name}")
+
+    # Decode and cluster once, then build both dark and light palettes
+    analysis = analyze_image(image, n_colors=20, cache=cache, quantizer=quantizer)
+    if verbose:
+        print(describe_decode(analysis))
+    with _stage("palette"):
+        dark_palette, dark_extracted, _, _ = generate_functional_palette(
+            None, "dark", analysis, contrast_method, palette_profile
+        )
+        light_palette, light_extracted, _, _ = generate_functional_palette(
+            None, "light", analysis, contrast_method, palette_profile
+        )
+
+    # Readability reports, for the report files and the console
+    build_reports = verbose or "report" in outputs
+
+    # Dark theme report
+    if build_reports:
+        with _stage("report"):
+            dark_report, dark_issues = generate_readability_report(
+                dark_palette, is_dark_theme=True, profile=palette_profile
+            )
+    if verbose:
+        print_palette(dark_palette, is_dark_theme=True)
+        print("\n" + dark_report)
+
+    # Light theme report
+    if build_reports:
+        with _stage("report"):
+            light_report, light_issues = generate_readability_report(
+                light_palette, is_dark_theme=False, profile=palette_profile
+            )
+    if verbose:
+        print_palette(light_palette, is_dark_theme=False)
+        print("\n" + light_report)
+
+    # Export paths
     dark_json_path = os.path.join(output_dir, "palette-dark.json")
     dark_html_path = os.path.join(output_dir, "palette_preview-dark.html")
     dark_report_path = os.path.join(output_dir, "readability_report-dark.txt")
@@ -1928,61 +3858,863 @@ def main():
 
     zed_path = os.path.join(output_dir, f"{theme_name}.json")
     zed_blur_path = os.path.join(output_dir, f"{theme_name}-blur.json")
+    zed_variants_path = os.path.join(output_dir, f"{theme_name}-variants.json")
 
     # Calculate opacity for blur theme (needed for palette export too)
     if override_opacity is not None:
         dark_opacity = override_opacity
         light_opacity = override_opacity
+    elif "palette-json" in outputs or "zed-blur" in outputs:
+        with _stage("opacity"):
+            dark_opacity = calculate_theme_opacity(
+                dark_palette, True, palette_profile.dim_contrast
+            )
+            light_opacity = calculate_theme_opacity(
+                light_palette, False, palette_profile.dim_contrast
+            )
     else:
-        dark_opacity = calculate_theme_opacity(dark_palette, is_dark_theme=True)
-        light_opacity = calculate_theme_opacity(light_palette, is_dark_theme=False)
+        dark_opacity = light_opacity = None
+
+    # Whether each exported file was (re)written, by path in export order
+    written = {}
 
     # Export dark theme files
-    export_json(dark_palette, dark_json_path, blur_opacity=dark_opacity)
-    create_html_preview(
-        dark_palette, dark_extracted, dark_html_path, is_dark_theme=True
-    )
-    with open(dark_report_path, "w") as f:
-        f.write(dark_report)
+    if "palette-json" in outputs:
+        with _stage("json"):
+            written[dark_json_path] = export_json(
+                dark_palette, dark_json_path, blur_opacity=dark_opacity
+            )
+    if "html" in outputs:
+        with _stage("html"):
+            written[dark_html_path] = create_html_preview(
+                dark_palette, dark_extracted, dark_html_path, is_dark_theme=True
+            )
+    if "report" in outputs:
+        with _stage("report"):
+            written[dark_report_path] = write_if_changed(dark_report_path, dark_report)
 
     # Export light theme files
-    export_json(light_palette, light_json_path, blur_opacity=light_opacity)
-    create_html_preview(
-        light_palette, light_extracted, light_html_path, is_dark_theme=False
-    )
-    with open(light_report_path, "w") as f:
-        f.write(light_report)
+    if "palette-json" in outputs:
+        with _stage("json"):
+            written[light_json_path] = export_json(
+                light_palette, light_json_path, blur_opacity=light_opacity
+            )
+    if "html" in outputs:
+        with _stage("html"):
+            written[light_html_path] = create_html_preview(
+                light_palette, light_extracted, light_html_path, is_dark_theme=False
+            )
+    if "report" in outputs:
+        with _stage("report"):
+            written[light_report_path] = write_if_changed(
+                light_report_path, light_report
+            )
 
     # Export opaque Zed theme
-    zed_theme = generate_zed_themes(dark_palette, light_palette, theme_name)
-    with open(zed_path, "w") as f:
-        f.write(zed_theme)
+    if "zed" in outputs:
+        with _stage("json"):
+            zed_theme = generate_zed_themes(dark_palette, light_palette, theme_name)
+            written[zed_path] = write_if_changed(zed_path, zed_theme)
 
     # Export blur Zed theme
-    zed_blur_theme = generate_zed_themes(
-        dark_palette,
-        light_palette,
-        theme_name,
-        dark_opacity=dark_opacity,
-        light_opacity=light_opacity,
+    if "zed-blur" in outputs:
+        with _stage("json"):
+            zed_blur_theme = generate_zed_themes(
+                dark_palette,
+                light_palette,
+                theme_name,
+                dark_opacity=dark_opacity,
+                light_opacity=light_opacity,
+            )
+            written[zed_blur_path] = write_if_changed(zed_blur_path, zed_blur_theme)
+
+    # Export every variant as one Zed theme family
+    if "zed-variants" in outputs:
+        zed_variants = zed_variant_data(
+            analysis,
+            theme_name,
+            variants,
+            contrast_method,
+            override_opacity,
+            palette_profile,
+        )
+        with _stage("json"):
+            written[zed_variants_path] = write_if_changed(
+                zed_variants_path, json.dumps(zed_variants, indent=2)
+            )
+
+    if verbose:
+        theme_count = len(THEMES)
+        for values in variants:
+            theme_count *= len(values)
+        contents = {
+            zed_path: f" (contains '{theme_name} Dark' and '{theme_name} Light')",
+            zed_blur_path: (
+                f" (contains '{theme_name} Dark Blur' and '{theme_name} Light Blur')"
+            ),
+            zed_variants_path: f" ({theme_count} themes)",
+        }
+        print("\n" + "=" * 60)
+        print("Exported:")
+        # Unchanged files are marked, the rest were written
+        for path, changed in written.items():
+            mark = "" if changed else " (unchanged)"
+            print(f"  - {path}{contents.get(path, '')}{mark}")
+        if dark_opacity is not None:
+            print(f"\nBlur opacity: dark={dark_opacity:.2f}, light={light_opacity:.2f}")
+        print("=" * 60)
+
+    opacities = None if dark_opacity is None else (dark_opacity, light_opacity)
+    return list(written), opacities
+
+
+THEMES = ("dark", "light")
+
+
+def apply_profile(analysis, profile, themes=THEMES, contrast_method="solve"):
+    """Build palettes from an already extracted color set with a PaletteProfile.
+
+    Nothing is decoded or clustered: with an analysis from analyze_image() or
+    a ColorCache, each profile only costs role assignment, a few milliseconds
+    per palette, so hundreds of profiles can be swept over one image.
+
+    Returns {theme: palette} for every theme in themes.
+    """
+    return {
+        theme: generate_functional_palette(
+            None, theme, analysis, contrast_method, profile
+        )[0]
+        for theme in themes
+    }
+
+
+def apply_profile_opacities(palettes, profile, surfaces=False):
+    """Blur opacities of apply_profile() palettes under the profile's dim_contrast.
+
+    Returns {theme: opacity} from calculate_theme_opacity(), or with surfaces
+    {theme: {role: opacity}} from calculate_surface_opacities().
+    """
+    calculate = calculate_surface_opacities if surfaces else calculate_theme_opacity
+    return {
+        theme: calculate(palette, theme == "dark", profile.dim_contrast)
+        for theme, palette in palettes.items()
+    }
+
+
+# Outcome of one generate_palettes() input, index being its position in the
+# input. source is the path for path inputs, else None. palettes, opacities and
+# issues (from generate_readability_report()) are keyed by theme, timings by
+# stage ("decode", "analyze", "palettes", "reports", in seconds). error is None
+# on success, otherwise a one-line description and analysis is None.
+PaletteResult = namedtuple(
+    "PaletteResult",
+    [
+        "index",
+        "source",
+        "analysis",
+        "palettes",
+        "opacities",
+        "issues",
+        "timings",
+        "error",
+    ],
+)
+
+
+def generate_palettes(
+    images,
+    themes=THEMES,
+    n_colors=20,
+    cache=None,
+    quantizer=DEFAULT_QUANTIZER,
+    contrast_method="solve",
+    override_opacity=None,
+    palette_profile=None,
+):
+    """Generate palettes for many images without writing any files.
+
+    Yields one PaletteResult per image, in input order, as soon as it is done.
+    A failing image yields a result with error set instead of raising, so one
+    bad input doesn't end the iteration.
+
+    Args:
+        images: Iterable of inputs analyze_image() takes: paths, encoded image
+                bytes, file objects, PIL images or pixel arrays
+        themes: Palettes to build for each image, from THEMES
+        n_colors: Number of colors to extract
+        cache: Optional ColorCache, used for path, bytes and file inputs
+        quantizer: Name of the color extraction engine in QUANTIZERS
+        contrast_method: "solve" or "step", see CONTRAST_METHODS
+        override_opacity: Optional blur opacity (0.0-1.0). If None, auto-calculates.
+        palette_profile: PaletteProfile the palettes are built with (default:
+                         DEFAULT_PROFILE)
+    """
+    import os
+    import time
+    import traceback
+
+    if palette_profile is None:
+        palette_profile = DEFAULT_PROFILE
+    themes = tuple(themes)
+    for theme in themes:
+        if theme not in THEMES:
+            raise ValueError(f"Unknown theme {theme!r}, expected one of {THEMES}")
+
+    for index, image in enumerate(images):
+        source = image if isinstance(image, (str, os.PathLike)) else None
+        timings = {}
+        try:
+            start = time.perf_counter()
+            analysis = analyze_image(image, n_colors, cache, quantizer)
+            timings["analyze"] = time.perf_counter() - start
+            if analysis.decode_seconds is not None:
+                timings["decode"] = analysis.decode_seconds
+
+            start = time.perf_counter()
+            palettes = apply_profile(analysis, palette_profile, themes, contrast_method)
+            if override_opacity is not None:
+                opacities = dict.fromkeys(palettes, override_opacity)
+            else:
+                opacities = apply_profile_opacities(palettes, palette_profile)
+            timings["palettes"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            issues = {
+                theme: generate_readability_report(
+                    palette, theme == "dark", palette_profile
+                )[1]
+                for theme, palette in palettes.items()
+            }
+            timings["reports"] = time.perf_counter() - start
+        except Exception as e:
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            yield PaletteResult(index, source, None, {}, {}, {}, timings, error)
+            continue
+        yield PaletteResult(
+            index, source, analysis, palettes, opacities, issues, timings, None
+        )
+
+
+# Outcome of one image in a batch run, files and opacities being export_theme()'s
+# result. error is None on success, otherwise a one-line description of the
+# exception, files is empty and opacities is None. stages holds the image's
+# StageRecords when the batch is profiled, else None.
+BatchResult = namedtuple(
+    "BatchResult",
+    ["image_path", "output_dir", "files", "opacities", "error", "stages"],
+    defaults=(None,),
+)
+
+
+# One ColorCache connection per worker process, by cache directory
+_worker_caches = {}
+
+
+def _worker_cache(cache_dir):
+    if cache_dir is None:
+        return None
+    if cache_dir not in _worker_caches:
+        _worker_caches[cache_dir] = ColorCache(cache_dir)
+    return _worker_caches[cache_dir]
+
+
+def _batch_worker(image_path, output_dir, cache_dir, options, profile=False):
+    """Process one batch image, capturing failures instead of raising.
+
+    options are extra export_theme() keyword arguments, profile is
+    generate_batch()'s.
+    """
+    import traceback
+
+    profiler = StageProfiler(profile == "memory") if profile else None
+    measuring = profiler.measure(image_path) if profile else contextlib.nullcontext()
+    try:
+        with measuring:
+            files, opacities = export_theme(
+                image_path,
+                output_dir,
+                verbose=False,
+                cache=_worker_cache(cache_dir),
+                **options,
+            )
+    except Exception as e:
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        files, opacities = [], None
+    else:
+        error = None
+    stages = profiler.records if profile else None
+    return BatchResult(image_path, output_dir, files, opacities, error, stages)
+
+
+def generate_batch(
+    image_paths,
+    output_root,
+    jobs=None,
+    override_opacity=None,
+    cache_dir=None,
+    rebuild_cache=False,
+    quantizer=DEFAULT_QUANTIZER,
+    contrast_method="solve",
+    profile=False,
+    outputs=None,
+    variants=None,
+    palette_profile=None,
+):
+    """Generate themes for many images in one process pool.
+
+    Each image is written to <output_root>/<image stem>/, the same layout as
+    running the CLI once per image. Results are yielded as BatchResult tuples
+    in completion order, so callers can report progress while the rest of the
+    batch is still running.
+
+    Args:
+        image_paths: Iterable of source image paths
+        output_root: Directory holding one output folder per image
+        jobs: Worker process count (default: number of CPU cores). With 1,
+              images are processed in the calling process.
+        override_opacity: Optional blur opacity (0.0-1.0) for every image
+        cache_dir: Optional ColorCache directory shared by all workers
+        rebuild_cache: Empty the cache before starting, forcing re-extraction
+        quantizer: Name of the color extraction engine in QUANTIZERS
+        contrast_method: "solve" or "step", see CONTRAST_METHODS
+        profile: Measure every stage of every image into the results' stages
+                 (see StageProfiler), "memory" to trace memory as well
+        outputs: Names from OUTPUTS to write for each image (default:
+                 DEFAULT_OUTPUTS, plus zed-variants if variants is given)
+        variants: VariantMatrix of theme variants to write for each image
+        palette_profile: PaletteProfile every image's palettes are built with
+    """
+    import os
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    tasks = []
+    for image_path in image_paths:
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        tasks.append((str(image_path), os.path.join(output_root, stem)))
+
+    if cache_dir is not None:
+        cache_dir = str(cache_dir)
+        if rebuild_cache:
+            cache = ColorCache(cache_dir)
+            cache.clear()
+            cache.close()
+
+    options = {
+        "override_opacity": override_opacity,
+        "quantizer": quantizer,
+        "contrast_method": contrast_method,
+        "outputs": outputs,
+        "variants": variants,
+        "palette_profile": palette_profile,
+    }
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) <= 1:
+        for image_path, output_dir in tasks:
+            yield _batch_worker(image_path, output_dir, cache_dir, options, profile)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+        futures = [
+            pool.submit(
+                _batch_worker, image_path, output_dir, cache_dir, options, profile
+            )
+            for image_path, output_dir in tasks
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# === THEME SERVER ===
+
+SERVE_MEMORY_ENTRIES = 256  # Analyses a running server keeps in memory
+
+
+def parse_address(address):
+    """Split a --serve address into ("unix", path) or ("tcp", (host, port)).
+
+    "unix:PATH" or any value containing a "/" is a Unix socket path. "HOST:PORT",
+    ":PORT" or a bare port listen on TCP, on 127.0.0.1 unless a host is given.
+    """
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:") :]
+    if "/" in address:
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(
+            f"Invalid address {address!r}, expected unix:PATH or HOST:PORT"
+        )
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def _ignore_sigint():
+    # Ctrl+C reaches the whole process group; only the server should handle it
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _serve_worker(data, key, n_colors, quantizer, cache_dir):
+    """Analyze image bytes in a server worker process, through the disk cache"""
+    cache = _worker_cache(cache_dir)
+    analysis = cache.get(key) if cache is not None else None
+    if analysis is None:
+        analysis = analyze_image_bytes(data, n_colors, quantizer=quantizer)
+        if cache is not None:
+            cache.put(key, analysis)
+    return analysis
+
+
+class ThemeService:
+    """Theme generation for a long-running process.
+
+    Analyses are kept in an in-memory LRU keyed like ColorCache, so a repeat
+    request for an image only hashes its bytes and rebuilds the palettes.
+    Misses are decoded and clustered on a process pool, through the shared
+    ColorCache when cache_dir is set; concurrent requests for the same image
+    wait on a single analysis. Safe to call from several threads.
+    """
+
+    def __init__(
+        self,
+        jobs=None,
+        cache_dir=None,
+        quantizer=DEFAULT_QUANTIZER,
+        contrast_method="solve",
+        override_opacity=None,
+        max_entries=SERVE_MEMORY_ENTRIES,
+        palette_profile=None,
+    ):
+        import os
+        import threading
+        from collections import OrderedDict
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.cache_dir = None if cache_dir is None else str(cache_dir)
+        self.quantizer = quantizer
+        self.contrast_method = contrast_method
+        self.override_opacity = override_opacity
+        self.max_entries = max_entries
+        self.palette_profile = palette_profile
+        self._pool = ProcessPoolExecutor(
+            max_workers=jobs or os.cpu_count() or 1, initializer=_ignore_sigint
+        )
+
+        self._analyses = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def analyze(self, data, quantizer=None):
+        """ImageAnalysis of encoded image bytes, from memory when possible"""
+        quantizer = quantizer or self.quantizer
+        if quantizer not in QUANTIZERS:
+            raise ValueError(f"Unknown quantizer {quantizer!r}")
+        key = ColorCache.key(data, 20, quantizer)
+
+        with self._lock:
+            analysis = self._analyses.get(key)
+            if analysis is not None:
+                self._analyses.move_to_end(key)
+                return analysis
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(
+                    _serve_worker, data, key, 20, quantizer, self.cache_dir
+                )
+                self._pending[key] = future
+
+        try:
+            analysis = future.result()
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+        with self._lock:
+            self._analyses[key] = analysis
+            while len(self._analyses) > self.max_entries:
+                self._analyses.popitem(last=False)
+        return analysis
+
+    def theme(
+        self,
+        image=None,
+        data=None,
+        name=None,
+        override_opacity=None,
+        quantizer=None,
+        contrast_method=None,
+    ):
+        """build_theme() for an image path or encoded image bytes.
+
+        Options left as None use the service defaults. The theme name defaults
+        to the image file name without extension, or "theme" for bytes.
+        """
+        import os
+
+        if data is None:
+            if image is None:
+                raise ValueError("Either an image path or image bytes is required")
+            # open() would take an integer as a file descriptor and close it
+            if not isinstance(image, (str, os.PathLike)):
+                raise TypeError(f"Image path must be a string, got {image!r}")
+            with open(image, "rb") as f:
+                data = f.read()
+            if name is None:
+                name = os.path.splitext(os.path.basename(image))[0]
+        contrast_method = contrast_method or self.contrast_method
+        if contrast_method not in CONTRAST_METHODS:
+            raise ValueError(f"Unknown contrast method {contrast_method!r}")
+        if override_opacity is None:
+            override_opacity = self.override_opacity
+
+        analysis = self.analyze(data, quantizer)
+        return build_theme(
+            analysis,
+            name or "theme",
+            override_opacity,
+            contrast_method,
+            self.palette_profile,
+        )
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def serve(
+    address,
+    jobs=None,
+    cache_dir=None,
+    quantizer=DEFAULT_QUANTIZER,
+    contrast_method="solve",
+    override_opacity=None,
+    palette_profile=None,
+):
+    """Serve themes over HTTP on a Unix socket or local TCP port until interrupted.
+
+    POST /theme with either a JSON body {"image": "/path/to/image", ...} or the
+    raw image bytes, options then going in the query string. Options are name,
+    opacity, quantizer and contrast_method; omitted ones use the defaults given
+    here. The response is the build_theme() JSON, or {"error": ...} with status
+    400 for bad input. GET /health answers {"status": "ok"}.
+
+    Args:
+        address: Where to listen, see parse_address()
+        jobs: Worker processes for decoding and clustering (default: CPU count)
+        cache_dir: Optional ColorCache directory shared with the CLI and batches
+        quantizer, contrast_method, override_opacity: Request defaults
+        palette_profile: PaletteProfile every theme is built with
+    """
+    import os
+    import socketserver
+    import stat
+    import traceback
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qsl, urlsplit
+
+    kind, target = parse_address(address)
+    service = ThemeService(
+        jobs=jobs,
+        cache_dir=cache_dir,
+        quantizer=quantizer,
+        contrast_method=contrast_method,
+        override_opacity=override_opacity,
+        palette_profile=palette_profile,
     )
-    with open(zed_blur_path, "w") as f:
-        f.write(zed_blur_theme)
 
-    print("\n" + "=" * 60)
-    print("Exported:")
-    print(f"  - {dark_json_path}")
-    print(f"  - {dark_html_path}")
-    print(f"  - {dark_report_path}")
-    print(f"  - {light_json_path}")
-    print(f"  - {light_html_path}")
-    print(f"  - {light_report_path}")
-    print(f"  - {zed_path} (contains '{theme_name} Dark' and '{theme_name} Light')")
-    print(
-        f"  - {zed_blur_path} (contains '{theme_name} Dark Blur' and '{theme_name} Light Blur')"
-    )
-    print(f"\nBlur opacity: dark={dark_opacity:.2f}, light={light_opacity:.2f}")
-    print("=" * 60)
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so a client can reuse one connection for many switches
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if urlsplit(self.path).path != "/health":
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+                return
+            self._reply(200, {"status": "ok"})
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if url.path != "/theme":
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+                return
+
+            try:
+                if self.headers.get_content_type() == "application/json":
+                    options, data = json.loads(body), None
+                else:
+                    options, data = dict(parse_qsl(url.query)), body or None
+                if not isinstance(options, dict):
+                    raise ValueError("Expected a JSON object of options")
+                for option in ("image", "name", "quantizer", "contrast_method"):
+                    value = options.get(option)
+                    if value is not None and not isinstance(value, str):
+                        raise ValueError(
+                            f"Invalid {option} {value!r}, expected a string"
+                        )
+                opacity = options.get("opacity")
+                if opacity is not None:
+                    value = opacity
+                    try:
+                        opacity = float(value)
+                    except (TypeError, ValueError):
+                        opacity = None
+                    if opacity is None or not 0.0 <= opacity <= 1.0:
+                        raise ValueError(
+                            f"Invalid opacity {value!r}, expected 0.0-1.0"
+                        )
+                result = service.theme(
+                    image=options.get("image"),
+                    data=data,
+                    name=options.get("name"),
+                    override_opacity=opacity,
+                    quantizer=options.get("quantizer"),
+                    contrast_method=options.get("contrast_method"),
+                )
+            except (ValueError, OSError) as e:
+                self._reply(400, {"error": str(e)})
+                return
+            except Exception as e:
+                error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                self._reply(500, {"error": error})
+                return
+            self._reply(200, result)
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            # Unix socket peers have no address
+            return self.client_address[0] if self.client_address else "unix"
+
+    if kind == "unix":
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+
+        # Remove a socket left behind by a previous server, but nothing else
+        if os.path.exists(target) and stat.S_ISSOCK(os.stat(target).st_mode):
+            os.unlink(target)
+        server = Server(target, Handler)
+    else:
+        server = ThreadingHTTPServer(target, Handler)
+
+    print(f"Serving themes on {address} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if kind == "unix" and os.path.exists(target):
+            os.unlink(target)
+
+
+def main():
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Generate color palettes and Zed themes from images"
+    )
+    parser.add_argument(
+        "image_path",
+        nargs="?",
+        default=None,
+        help="Path to the source image, or - to read it from stdin",
+    )
+    parser.add_argument(
+        "output_dir",
+        nargs="?",
+        default=None,
+        help="Output directory (default: same as image)",
+    )
+    parser.add_argument(
+        "--name",
+        default=None,
+        help="Theme name (default: the image file name without extension, "
+        "required when reading from stdin)",
+    )
+    parser.add_argument(
+        "--opacity",
+        type=float,
+        default=None,
+        help="Override blur theme opacity (0.0-1.0). If not set, auto-calculates optimal value.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Reuse extracted colors stored in this directory across runs",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Empty the --cache-dir cache before extracting",
+    )
+    parser.add_argument(
+        "--quantizer",
+        choices=sorted(QUANTIZERS),
+        default=DEFAULT_QUANTIZER,
+        help=f"Color extraction engine (default: {DEFAULT_QUANTIZER})",
+    )
+    parser.add_argument(
+        "--compare-quantizers",
+        action="store_true",
+        help="Time every quantizer on the image, report how far their colors "
+        "differ from the --quantizer engine, and exit",
+    )
+    parser.add_argument(
+        "--contrast-method",
+        choices=CONTRAST_METHODS,
+        default="solve",
+        help="How text colors are moved to reach contrast targets: 'solve' finds "
+        "the closest passing lightness, 'step' reproduces the original "
+        "fixed-step adjustment (default: solve)",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        default=None,
+        help="Keep running and generate themes on request over HTTP, on a Unix "
+        "socket (unix:PATH) or local port (HOST:PORT). See serve().",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes for --serve (default: CPU count)",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        default=None,
+        help="Record the wall time, CPU time and peak memory of every stage to "
+        "FILE (Chrome trace if it ends in .json, else JSON lines) and print a "
+        "summary",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="With --profile, also trace each stage's Python and NumPy "
+        "allocations (slows those stages down)",
+    )
+    parser.add_argument(
+        "--outputs",
+        default=None,
+        help="Comma-separated files to write, from "
+        f"{', '.join(OUTPUTS)} (default: {', '.join(DEFAULT_OUTPUTS)}, plus "
+        "zed-variants with a variant option). Stages only needed by other "
+        "outputs are skipped.",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Don't print the palettes, readability reports and exported paths",
+    )
+    parser.add_argument(
+        "--palette-profile",
+        metavar="FILE",
+        default=None,
+        help="TOML or JSON file of PaletteProfile fields overriding the built-in "
+        "contrast targets, saturation caps, background lightness and semantic "
+        "colors",
+    )
+    add_variant_arguments(parser)
+
+    args = parser.parse_args()
+
+    palette_profile = None
+    if args.palette_profile is not None:
+        try:
+            palette_profile = load_palette_profile(args.palette_profile)
+        except (OSError, ValueError) as e:
+            parser.error(f"{args.palette_profile}: {e}")
+
+    if args.serve is not None:
+        try:
+            parse_address(args.serve)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.cache_dir is not None and args.rebuild_cache:
+            cache = ColorCache(args.cache_dir)
+            cache.clear()
+            cache.close()
+        serve(
+            args.serve,
+            jobs=args.jobs,
+            cache_dir=args.cache_dir,
+            quantizer=args.quantizer,
+            contrast_method=args.contrast_method,
+            override_opacity=args.opacity,
+            palette_profile=palette_profile,
+        )
+        return
+    if args.image_path is None:
+        parser.error("image_path is required unless --serve is given")
+    if args.profile_memory and args.profile is None:
+        parser.error("--profile-memory requires --profile")
+    outputs = None
+    try:
+        if args.outputs is not None:
+            outputs = parse_outputs(args.outputs)
+        variants = parse_variants(
+            args.contrast_tiers, args.saturation_tiers, args.opacities
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    image_path = args.image_path
+    output_dir = args.output_dir or os.path.dirname(image_path) or "."
+    if image_path == "-":
+        if args.name is None and not args.compare_quantizers:
+            parser.error("--name is required when reading the image from stdin")
+        # Read once here; the image is decoded from memory, never a temp file
+        image = sys.stdin.buffer.read()
+    else:
+        image = image_path
+
+    if args.compare_quantizers:
+        print(f"Quantizers on {image_path} (distance vs {args.quantizer}, RGB units)")
+        print(f"  {'engine':12} {'wall':>8} {'cpu':>8} {'distance':>9}")
+        for name, wall, cpu, distance in compare_quantizers(
+            image, reference=args.quantizer
+        ):
+            print(f"  {name:12} {wall:7.3f}s {cpu:7.3f}s {distance:9.2f}")
+        return
+
+    cache = None
+    if args.cache_dir is not None:
+        cache = ColorCache(args.cache_dir)
+        if args.rebuild_cache:
+            cache.clear()
+
+    profiler = StageProfiler(args.profile_memory) if args.profile else None
+    label = args.name or image_path
+    with profiler.measure(label) if profiler else contextlib.nullcontext():
+        export_theme(
+            image,
+            output_dir,
+            theme_name=args.name,
+            variants=variants,
+            override_opacity=args.opacity,
+            cache=cache,
+            quantizer=args.quantizer,
+            contrast_method=args.contrast_method,
+            verbose=not args.quiet,
+            outputs=outputs,
+            palette_profile=palette_profile,
+        )
+    if profiler is not None:
+        write_profile(profiler.records, args.profile)
+        print(f"\nStage profile (written to {args.profile}):")
+        print(format_profile_summary(profiler.records))
 
 
 if __name__ == "__main__":
@@ -2,69 +2,536 @@
 """
 Generate all themes from images in the images folder.
 Consolidates blur themes into out/themes/ folder.
+
+Images are processed in-process on a worker pool (one process per core by
+default), so the generator module and its dependencies load once per worker
+instead of once per image.
+
+With --watch, the images folder is monitored and only added or changed images
+are regenerated; outputs of deleted images are removed. What has been
+generated is tracked in out/.manifest.json by content hash.
+
+Output files are only rewritten when their content changes, and the themes in
+out/themes/ are hard links to the per-image ones, so rerunning on unchanged
+images writes no files.
 """
 
+import argparse
+import filecmp
+import hashlib
+import json
 import os
 import shutil
-import subprocess
+import threading
+import time
 from pathlib import Path
 
+from color_palette_generator import (
+    CONTRAST_METHODS,
+    DEFAULT_OUTPUTS,
+    DEFAULT_QUANTIZER,
+    OUTPUTS,
+    QUANTIZERS,
+    add_variant_arguments,
+    format_profile_summary,
+    generate_batch,
+    load_palette_profile,
+    palette_profile_data,
+    parse_outputs,
+    parse_variants,
+    write_if_changed,
+    write_profile,
+)
 
-def main():
-    root = Path(__file__).parent
-    images_dir = root / "images"
-    out_dir = root / "out"
-    themes_dir = out_dir / "themes"
+# Supported image extensions
+EXTENSIONS = {".png", ".jpg", ".jpeg"}
 
-    # Supported image extensions
-    extensions = {".png", ".jpg", ".jpeg"}
+MANIFEST = ".manifest.json"
+MANIFEST_VERSION = 1
 
-    # Find all images
-    images = [f for f in images_dir.iterdir() if f.suffix.lower() in extensions]
 
-    if not images:
-        print(f"No images found in {images_dir}")
-        return
+def scan_images(images_dir):
+    """Map each image file name in images_dir to its (size, mtime_ns)"""
+    found = {}
+    with os.scandir(images_dir) as entries:
+        for entry in entries:
+            if Path(entry.name).suffix.lower() not in EXTENSIONS:
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue  # Deleted while scanning
+            found[entry.name] = (st.st_size, st.st_mtime_ns)
+    return found
 
-    print(f"Found {len(images)} images to process\n")
 
-    # Create themes directory
-    themes_dir.mkdir(parents=True, exist_ok=True)
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(out_dir, settings):
+    """Manifest entries by image name, empty if generated with other settings"""
+    try:
+        with open(out_dir / MANIFEST) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION or data.get("settings") != settings:
+        return {}
+    return data["images"]
+
+
+def save_manifest(out_dir, settings, images):
+    data = {"version": MANIFEST_VERSION, "settings": settings, "images": images}
+    write_if_changed(out_dir / MANIFEST, json.dumps(data, indent=2, sort_keys=True))
+
+
+def link_theme(source, target):
+    """Make target a hard link to source, so the consolidated folder holds no copies.
+
+    Nothing is written if target already is source or has the same content.
+    Where hard links aren't possible (another filesystem, or one without them)
+    target is copied to instead, still only if its content differs. Either way
+    target is replaced atomically. Returns "linked", "copied" or None if target
+    was already up to date.
+    """
+    if target.exists() and (
+        os.path.samefile(source, target) or filecmp.cmp(source, target, shallow=False)
+    ):
+        return None
 
-    # Process each image
-    for image_path in sorted(images):
-        theme_name = image_path.stem
-        theme_out_dir = out_dir / theme_name
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(source, tmp)
+    except OSError:
+        return "copied" if write_if_changed(target, source.read_bytes()) else None
+    os.replace(tmp, target)
+    return "linked"
 
+
+def report(result, themes_dir, quiet=False):
+    """Print one batch result and link its Zed themes. Returns False on failure.
+
+    With quiet, only a failure is printed.
+    """
+    theme_name = Path(result.image_path).stem
+    theme_out_dir = Path(result.output_dir)
+
+    if not quiet:
         print(f"{'='*60}")
-        print(f"Generating: {theme_name}")
+        print(f"Generated: {theme_name}")
         print(f"{'='*60}")
 
-        # Run the generator
-        result = subprocess.run(
-            ["uv", "run", "color_palette_generator.py", str(image_path), str(theme_out_dir)],
-            cwd=root,
-        )
+    if result.error is not None:
+        print(f"Error generating {theme_name}: {result.error}\n")
+        return False
+
+    if result.opacities is not None and not quiet:
+        dark_opacity, light_opacity = result.opacities
+        print(f"Blur opacity: dark={dark_opacity:.2f}, light={light_opacity:.2f}")
 
-        if result.returncode != 0:
-            print(f"Error generating {theme_name}")
+    # Link the Zed themes into the consolidated folder, if exported
+    exported = {Path(path).name for path in result.files}
+    for theme in zed_theme_files(theme_name):
+        if theme not in exported:
             continue
+        action = link_theme(theme_out_dir / theme, themes_dir / theme)
+        if quiet:
+            continue
+        if action is None:
+            print(f"{theme} in {themes_dir} is up to date")
+        else:
+            print(f"{action.capitalize()} {theme} to {themes_dir}")
+
+    if not quiet:
+        print()
+    return True
 
-        # Copy blur theme to consolidated folder
-        blur_theme = theme_out_dir / f"{theme_name}-blur.json"
-        if blur_theme.exists():
-            shutil.copy(blur_theme, themes_dir / blur_theme.name)
-            print(f"Copied {blur_theme.name} to {themes_dir}")
 
-        # Also copy opaque theme
-        opaque_theme = theme_out_dir / f"{theme_name}.json"
-        if opaque_theme.exists():
-            shutil.copy(opaque_theme, themes_dir / opaque_theme.name)
-            print(f"Copied {opaque_theme.name} to {themes_dir}")
+def zed_theme_files(stem):
+    """Names of the Zed theme files generated for an image, as linked in themes/"""
+    return (f"{stem}-blur.json", f"{stem}.json", f"{stem}-variants.json")
 
-        print()
+
+def remove_outputs(name, out_dir, themes_dir, quiet=False):
+    """Delete everything generated for the image file name"""
+    stem = Path(name).stem
+    shutil.rmtree(out_dir / stem, ignore_errors=True)
+    for theme in zed_theme_files(stem):
+        (themes_dir / theme).unlink(missing_ok=True)
+    if not quiet:
+        print(f"Removed outputs of deleted image {name}")
+
+
+def sync(
+    images_dir,
+    out_dir,
+    themes_dir,
+    manifest,
+    found,
+    batch_options,
+    stages=None,
+    quiet=False,
+):
+    """Bring the outputs in line with the images in found (see scan_images()).
+
+    Hashes only images whose size or modification time differ from the
+    manifest, regenerates those whose content changed, removes outputs of
+    images that are gone and updates manifest in place. Returns the names of
+    images that failed. With a profiled batch, the StageRecords of the
+    regenerated images are appended to stages. quiet only prints failures.
+    """
+    for name in sorted(set(manifest) - set(found)):
+        remove_outputs(name, out_dir, themes_dir, quiet)
+        del manifest[name]
+
+    changed = {}
+    for name, (size, mtime_ns) in found.items():
+        entry = manifest.get(name)
+        if entry is not None and (entry["size"], entry["mtime_ns"]) == (size, mtime_ns):
+            continue
+        try:
+            digest = file_hash(images_dir / name)
+        except FileNotFoundError:
+            continue  # Deleted since the scan, handled by the next one
+        entry = {"sha256": digest, "size": size, "mtime_ns": mtime_ns}
+        if name in manifest and manifest[name]["sha256"] == digest:
+            manifest[name] = entry  # Touched but not modified
+        else:
+            changed[name] = entry
+
+    failed = []
+    if changed:
+        if not quiet:
+            print(f"Found {len(changed)} images to process\n")
+        paths = [images_dir / name for name in sorted(changed)]
+        for result in generate_batch(paths, out_dir, **batch_options):
+            if not report(result, themes_dir, quiet):
+                failed.append(Path(result.image_path).stem)
+            if stages is not None and result.stages:
+                stages.extend(result.stages)
+        # Failed images are recorded too, so they are retried only once modified
+        manifest.update(changed)
+    return failed
+
+
+def _change_notifier(images_dir):
+    """threading.Event set on file events in images_dir, or None without watchdog"""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    changed = threading.Event()
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            changed.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), str(images_dir), recursive=False)
+    observer.daemon = True
+    observer.start()
+    return changed
+
+
+def print_profile(stages, profile_path):
+    """Write the batch's StageRecords to profile_path and print their summary"""
+    write_profile(stages, profile_path)
+    images = len({record.image for record in stages})
+    print(f"Stage profile of {images} images (written to {profile_path}):")
+    print(format_profile_summary(stages))
+
+
+def watch(
+    images_dir,
+    out_dir,
+    themes_dir,
+    settings,
+    batch_options,
+    interval,
+    debounce,
+    profile_path=None,
+    quiet=False,
+):
+    """Regenerate themes as images are added, changed or deleted, until Ctrl+C.
+
+    Uses watchdog (inotify on Linux) when installed, otherwise rescans every
+    interval seconds. A burst of changes is processed once the directory has
+    been quiet for debounce seconds, so files still being copied are skipped.
+    With profile_path, the profile of everything regenerated so far is
+    rewritten after every batch. quiet only prints failures.
+    """
+    manifest = load_manifest(out_dir, settings)
+    notifier = _change_notifier(images_dir)
+    mode = "file events" if notifier is not None else f"polling every {interval}s"
+    if not quiet:
+        print(f"Watching {images_dir} ({mode}, Ctrl+C to stop)\n")
+
+    found = scan_images(images_dir)
+    stages = [] if profile_path is not None else None
+    try:
+        while True:
+            processed = len(stages or ())
+            failed = sync(
+                images_dir,
+                out_dir,
+                themes_dir,
+                manifest,
+                found,
+                batch_options,
+                stages,
+                quiet,
+            )
+
+            save_manifest(out_dir, settings, manifest)
+            if failed:
+                print(f"Failed: {', '.join(sorted(failed))}\n")
+            if stages is not None and len(stages) > processed:
+                print_profile(stages, profile_path)
+                print()
+            # Only the first batch may rebuild the cache
+            batch_options["rebuild_cache"] = False
+
+            # Wait for a change, then until the directory stops changing
+            previous = found
+            while found == previous:
+                if notifier is not None:
+                    notifier.wait()
+                    notifier.clear()
+                else:
+                    time.sleep(interval)
+                found = scan_images(images_dir)
+            while True:
+                time.sleep(debounce)
+                if notifier is not None:
+                    notifier.clear()
+                settled = scan_images(images_dir)
+                if settled == found:
+                    break
+                found = settled
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+def main():
+    root = Path(__file__).parent
+
+    parser = argparse.ArgumentParser(
+        description="Generate themes for every image in a folder"
+    )
+    parser.add_argument(
+        "--images",
+        type=Path,
+        default=root / "images",
+        help="Folder of source images (default: images/)",
+    )
+    parser.add_argument(
+        "--out",
+        type=Path,
+        default=root / "out",
+        help="Output root (default: out/)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help=f"Worker processes (default: CPU count, {os.cpu_count()})",
+    )
+    parser.add_argument(
+        "--opacity",
+        type=float,
+        default=None,
+        help="Override blur theme opacity (0.0-1.0) for every image",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't reuse extracted colors from previous runs",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Discard the extraction cache and re-extract every image",
+    )
+    parser.add_argument(
+        "--quantizer",
+        choices=sorted(QUANTIZERS),
+        default=DEFAULT_QUANTIZER,
+        help=f"Color extraction engine (default: {DEFAULT_QUANTIZER})",
+    )
+    parser.add_argument(
+        "--contrast-method",
+        choices=CONTRAST_METHODS,
+        default="solve",
+        help="'solve' (default) or 'step' to reproduce the original fixed-step "
+        "contrast adjustment",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and regenerate only added or changed images, "
+        "removing outputs of deleted ones",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="Seconds between rescans when watching without watchdog (default: 2)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=1.0,
+        help="Seconds the folder must be quiet before processing changes "
+        "(default: 1)",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        type=Path,
+        default=None,
+        help="Record the wall time, CPU time and peak memory of every stage of "
+        "every image to FILE (Chrome trace if it ends in .json, else JSON lines) "
+        "and print a per-stage summary at the end",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="With --profile, also trace each stage's Python and NumPy "
+        "allocations (slows those stages down)",
+    )
+    parser.add_argument(
+        "--outputs",
+        default=None,
+        help="Comma-separated files to write for each image, from "
+        f"{', '.join(OUTPUTS)} (default: {', '.join(DEFAULT_OUTPUTS)}, plus "
+        "zed-variants with a variant option). Stages only needed by other "
+        "outputs are skipped.",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Only print failures",
+    )
+    parser.add_argument(
+        "--palette-profile",
+        metavar="FILE",
+        type=Path,
+        default=None,
+        help="TOML or JSON file of PaletteProfile fields every image's palettes "
+        "are built with",
+    )
+    add_variant_arguments(parser)
+    args = parser.parse_args()
+    if args.profile_memory and args.profile is None:
+        parser.error("--profile-memory requires --profile")
+    outputs = None
+    try:
+        if args.outputs is not None:
+            outputs = parse_outputs(args.outputs)
+        variants = parse_variants(
+            args.contrast_tiers, args.saturation_tiers, args.opacities
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    palette_profile = None
+    if args.palette_profile is not None:
+        try:
+            palette_profile = load_palette_profile(args.palette_profile)
+        except (OSError, ValueError) as e:
+            parser.error(f"{args.palette_profile}: {e}")
+
+    images_dir = args.images
+    out_dir = args.out
+    themes_dir = out_dir / "themes"
+    # Extracted colors cached by image content, so re-theming skips clustering
+    cache_dir = None if args.no_cache else out_dir / ".cache"
+
+    batch_options = {
+        "jobs": args.jobs,
+        "override_opacity": args.opacity,
+        "cache_dir": cache_dir,
+        "rebuild_cache": args.rebuild_cache,
+        "quantizer": args.quantizer,
+        "contrast_method": args.contrast_method,
+        "profile": "memory" if args.profile_memory else args.profile is not None,
+        "outputs": outputs,
+        "variants": variants,
+        "palette_profile": palette_profile,
+    }
+    # Changing any of these regenerates every image when watching
+    settings = {
+        "opacity": args.opacity,
+        "quantizer": args.quantizer,
+        "contrast_method": args.contrast_method,
+        "outputs": sorted(outputs or (OUTPUTS if variants else DEFAULT_OUTPUTS)),
+        "variants": variants and [list(values) for values in variants],
+        # The profile's content, so editing the file re-themes every image
+        "palette_profile": palette_profile and palette_profile_data(palette_profile),
+    }
+
+    # Create themes directory
+    themes_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.watch:
+        watch(
+            images_dir,
+            out_dir,
+            themes_dir,
+            settings,
+            batch_options,
+            args.interval,
+            args.debounce,
+            args.profile,
+            args.quiet,
+        )
+        return
+
+    # Find all images
+    found = scan_images(images_dir)
+
+    if not found:
+        print(f"No images found in {images_dir}")
+        return
+
+    # Regenerate everything, recording it so a later --watch starts from here
+    manifest = {}
+    stages = [] if args.profile is not None else None
+    failed = sync(
+        images_dir,
+        out_dir,
+        themes_dir,
+        manifest,
+        found,
+        batch_options,
+        stages,
+        args.quiet,
+    )
+    save_manifest(out_dir, settings, manifest)
+
+    if args.quiet:
+        if stages:
+            print_profile(stages, args.profile)
+        if failed:
+            print(f"Failed: {', '.join(sorted(failed))}")
+        return
 
     print(f"{'='*60}")
+
+    if stages:
+        print_profile(stages, args.profile)
+        print(f"{'='*60}")
+    if failed:
+        print(f"Failed: {', '.join(sorted(failed))}")
     print("Done! All themes consolidated in:")
     print(f"  {themes_dir}")
     print(f"{'='*60}")
@@ -0,0 +1,71 @@
+"""The vectorized conversions must match the scalar ones bit for bit."""
+
+import numpy as np
+import pytest
+
+from color_palette_generator import (
+    contrast_ratio,
+    contrast_ratio_matrix,
+    hsl_to_rgb,
+    hsl_to_rgb_array,
+    relative_luminance,
+    relative_luminance_array,
+    rgb_to_hsl,
+    rgb_to_hsl_array,
+)
+
+EDGE_VALUES = (0, 1, 127, 128, 254, 255)
+
+
+@pytest.fixture(scope="module")
+def rgb():
+    """300k random RGB triples, every edge combination and a grey ramp"""
+    rng = np.random.default_rng(0)
+    edges = np.array(
+        [(r, g, b) for r in EDGE_VALUES for g in EDGE_VALUES for b in EDGE_VALUES]
+    )
+    greys = np.repeat(np.arange(256)[:, None], 3, axis=1)
+    return np.concatenate([rng.integers(0, 256, (300_000, 3)), edges, greys])
+
+
+@pytest.fixture(scope="module")
+def hsl():
+    """200k random HSL triples, plus greys (s=0) and the range boundaries"""
+    rng = np.random.default_rng(1)
+    random = rng.random((200_000, 3)) * (360, 100, 100)
+    lightness = np.linspace(0, 100, 201)
+    greys = np.column_stack(
+        [rng.random(lightness.size) * 360, np.zeros_like(lightness), lightness]
+    )
+    bounds = np.array(
+        [
+            (h, s, l)
+            for h in (0, 120, 359.99, 360)
+            for s in (0, 100)
+            for l in (0, 50, 100)
+        ],
+        dtype=np.float64,
+    )
+    return np.concatenate([random, greys, bounds])
+
+
+def test_rgb_to_hsl_array(rgb):
+    expected = [rgb_to_hsl(*color) for color in rgb.tolist()]
+    assert [tuple(row) for row in rgb_to_hsl_array(rgb).tolist()] == expected
+
+
+def test_hsl_to_rgb_array(hsl):
+    expected = [hsl_to_rgb(*color) for color in hsl.tolist()]
+    assert [tuple(row) for row in hsl_to_rgb_array(hsl).tolist()] == expected
+
+
+def test_relative_luminance_array(rgb):
+    expected = [relative_luminance(*color) for color in rgb.tolist()]
+    assert relative_luminance_array(rgb).tolist() == expected
+
+
+def test_contrast_ratio_matrix(rgb):
+    lums_a = relative_luminance_array(rgb[:400]).tolist()
+    lums_b = relative_luminance_array(rgb[-300:]).tolist()
+    expected = [[contrast_ratio(a, b) for b in lums_b] for a in lums_a]
+    assert contrast_ratio_matrix(lums_a, lums_b).tolist() == expected
@@ -0,0 +1,56 @@
+"""Decoding stays under DECODE_MEMORY_LIMIT, and raw images are only sampled."""
+
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import color_palette_generator as cpg
+
+# A quarter of the BMP below, which decoded whole would take 192 MB
+LIMIT = 36 * 1024 * 1024
+
+
+@pytest.fixture(scope="module")
+def large_bmp(tmp_path_factory):
+    """8000x6000 uncompressed BMP, 144 MB of pixels"""
+    rng = np.random.default_rng(0)
+    pixels = np.repeat(rng.integers(0, 256, (6000, 1, 3), dtype=np.uint8), 8000, 1)
+    path = tmp_path_factory.mktemp("decode") / "large.bmp"
+    Image.fromarray(pixels).save(path)
+    return path
+
+
+@pytest.fixture
+def limit(monkeypatch):
+    monkeypatch.setattr(cpg, "DECODE_MEMORY_LIMIT", LIMIT)
+
+
+def test_oversized_png_raises(tmp_path, limit):
+    path = tmp_path / "large.png"
+    Image.new("RGB", (4000, 3000), (40, 90, 160)).save(path)
+    with pytest.raises(ValueError, match="limit"):
+        cpg.load_image(path, size=cpg.ANALYSIS_DECODE_SIZE)
+    with pytest.raises(ValueError, match="limit"):
+        cpg.analyze_image(path.read_bytes())
+
+
+@pytest.mark.parametrize("source", ["path", "bytes", "cache"])
+def test_raw_bmp_is_sampled_in_constant_memory(large_bmp, source, tmp_path, limit):
+    image = large_bmp.read_bytes() if source == "bytes" else large_bmp
+    cache = cpg.ColorCache(tmp_path) if source == "cache" else None
+
+    tracemalloc.start()
+    try:
+        analysis = cpg.analyze_image(image, cache=cache)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        if cache is not None:
+            cache.close()
+
+    assert analysis.image_size == (8000, 6000)
+    assert analysis.decoded_size[0] < 8000
+    # Sampling and clustering; the memory map and the input bytes are not traced
+    assert peak < LIMIT
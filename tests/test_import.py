@@ -0,0 +1,37 @@
+"""Importing the module must not pull in the heavy dependencies."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Seconds. The import takes about 20-40 ms; NumPy and Pillow alone take over
+# 100 ms more, so pulling them or similar work back into the import exceeds it
+IMPORT_BUDGET = 0.2
+RUNS = 3  # The fastest run is compared, so one slow start doesn't fail the test
+
+CHECK = """
+import sys, time
+start = time.perf_counter()
+import color_palette_generator
+elapsed = time.perf_counter() - start
+heavy = sorted({"numpy", "PIL", "sklearn"} & set(sys.modules))
+print(elapsed, ",".join(heavy))
+"""
+
+
+def test_import_is_lazy():
+    times = []
+    for _ in range(RUNS):
+        result = subprocess.run(
+            [sys.executable, "-c", CHECK],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed, heavy = result.stdout.split(" ")
+        assert heavy.strip() == "", f"imported at module level: {heavy.strip()}"
+        times.append(float(elapsed))
+    assert min(times) < IMPORT_BUDGET, f"import took {min(times):.3f}s"
@@ -0,0 +1,81 @@
+"""The theme server rejects bad options without harming itself."""
+
+import http.client
+import json
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost", timeout=10)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def request(path, method, url, body=None):
+    connection = UnixConnection(str(path))
+    try:
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        connection.request(method, url, body, headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = tmp_path / "themes.sock"
+    process = subprocess.Popen(
+        [sys.executable, "color_palette_generator.py", "--serve", f"unix:{path}"]
+        + ["--jobs", "1"],
+        cwd=ROOT,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                request(path, "GET", "/health")
+                break
+            except OSError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise
+                time.sleep(0.05)
+        yield path
+    finally:
+        process.terminate()
+        process.wait()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        # Integers would be taken as file descriptors, such as the server's own
+        # listening socket
+        *({"image": fd} for fd in range(3, 10)),
+        {"image": ["a.png"]},
+        {"name": 5},
+        {"quantizer": ["x"]},
+        {"contrast_method": {}},
+    ],
+)
+def test_non_string_options_are_rejected(server, options):
+    status, reply = request(server, "POST", "/theme", json.dumps(options))
+    assert status == 400
+    assert "expected a string" in reply["error"]
+    assert request(server, "GET", "/health") == (200, {"status": "ok"})